@@ -44,6 +44,7 @@ POSTGRES_PASSWORD = env.str("POSTGRES_PASSWORD", default="")
 POSTGRES_HOST = env.str("POSTGRES_HOST", default="localhost")
 POSTGRES_PORT = env.int("POSTGRES_PORT", default=5432)
 POSTGRES_DB = env.str("POSTGRES_DB", default="docker")
+POSTGRES_POOL_SIZE = env.int("POSTGRES_POOL_SIZE", default=10)
 POSTGRES_URI = (
     f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}"
     f"@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
@@ -53,6 +54,32 @@ REDIS_HOST = env.str("REDIS_HOST", default="redis")
 REDIS_PORT = env.int("REDIS_PORT", default=6379)
 REDIS_DB = env.int("REDIS_DB", default=0)
 
+# updates of different users processed at once, each needs a connection
+UPDATE_WORKERS = env.int("UPDATE_WORKERS", default=POSTGRES_POOL_SIZE)
+
+USER_CACHE_SIZE = env.int("USER_CACHE_SIZE", default=10000)
+USER_CACHE_TTL = env.int("USER_CACHE_TTL", default=300)
+
+STATS_CACHE_TTL = env.int("STATS_CACHE_TTL", default=7 * 24 * 3600)
+SLEEP_INDEX_RECONCILE_MINUTES = env.int("SLEEP_INDEX_RECONCILE_MINUTES", default=10)
+STATS_BACKEND = env.str("STATS_BACKEND", default="python")
+# replicas claim due reminders in postgres, so each is sent by one of them
+SCHEDULER_DISTRIBUTED = env.bool("SCHEDULER_DISTRIBUTED", default=False)
+SCHEDULER_CLAIM_LEASE = env.int("SCHEDULER_CLAIM_LEASE", default=60)
+SCHEDULER_CLAIM_INTERVAL = env.int("SCHEDULER_CLAIM_INTERVAL", default=5)
+# telegram allows about 30 messages per second to different chats
+REMINDER_SEND_RATE = env.float("REMINDER_SEND_RATE", default=30)
+REMINDER_SEND_BURST = env.int("REMINDER_SEND_BURST", default=1)
+REMINDER_SEND_CONCURRENCY = env.int("REMINDER_SEND_CONCURRENCY", default=50)
+
+EXPORT_CHUNK_SIZE = env.int("EXPORT_CHUNK_SIZE", default=1000)
+EXPORT_SPOOL_SIZE = env.int("EXPORT_SPOOL_SIZE", default=1024 * 1024)
+IMPORT_CHUNK_SIZE = env.int("IMPORT_CHUNK_SIZE", default=10000)
+
+# base url of a Bot API server other than api.telegram.org,
+# e.g. fake one of `python -m app fake-api` for tests without network
+BOT_API_SERVER = env.str("BOT_API_SERVER", default="")
+
 PROXY_USE = env.bool("PROXY_USE", default=False)
 PROXY_URL = env.str("PROXY_URL", default="")
 PROXY_USERNAME = env.str("PROXY_USERNAME", default="")
@@ -64,5 +91,10 @@ WEBHOOK_BASE_PATH = env.str("WEBHOOK_BASE_PATH", default="/webhook")
 WEBHOOK_PATH = f"{WEBHOOK_BASE_PATH}/{SECRET_KEY}"
 WEBHOOK_URL = f"https://{DOMAIN}{WEBHOOK_PATH}"
 BOT_PUBLIC_PORT = env.int("BOT_PUBLIC_PORT", default=8080)
+# primary replies of handlers are returned as webhook responses, which saves
+# a Bot API call per reply, but Telegram reports no errors of such replies:
+# a reply it fails to send (blocked bot, bad markup) is lost without a trace,
+# only counted as sent in interaction_webhook_replies
+WEBHOOK_REPLIES = env.bool("WEBHOOK_REPLIES", default=False)
 
 SUPERUSER_STARTUP_NOTIFIER = env.bool("SUPERUSER_STARTUP_NOTIFIER", default=False)
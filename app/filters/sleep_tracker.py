@@ -6,6 +6,7 @@ from sqlalchemy import and_
 
 from app.models.sleep_record import SleepRecord
 from app.models.user import User
+from app.utils import sleep_index
 
 
 @dataclass
@@ -18,10 +19,13 @@ class UserAwakeFilter(BoundFilter):
         if not self.user:
             data = ctx_data.get()
             self.user: User = data["user"]
-        record = await SleepRecord.query.where(
-            and_(
-                SleepRecord.user_id == self.user.id,
-                SleepRecord.wakeup_time == None,  # noqa
-            )
-        ).gino.first()
-        return (record is None) == self.user_awake
+        asleep = await sleep_index.is_asleep(self.user.id)
+        if asleep is None:
+            record = await SleepRecord.query.where(
+                and_(
+                    SleepRecord.user_id == self.user.id,
+                    SleepRecord.wakeup_time == None,  # noqa
+                )
+            ).gino.first()
+            asleep = record is not None
+        return (not asleep) == self.user_awake
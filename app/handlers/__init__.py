@@ -7,4 +7,6 @@ isort:skip_file
 from . import base
 from . import superuser
 from . import user_settings
+from . import export
+from . import sleep_import
 from . import sleep_tracker
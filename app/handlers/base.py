@@ -5,6 +5,8 @@ from loguru import logger
 from app.middlewares.i18n import i18n
 from app.misc import dp
 from app.models.user import User
+from app.utils.interaction import Reply
+from app.utils.user_cache import update_user
 
 _ = i18n.gettext
 
@@ -13,7 +15,7 @@ _ = i18n.gettext
 async def cmd_start(message: types.Message, user: User):
     logger.info("User {user} started conversation with bot", user=message.from_user.id)
 
-    await message.answer(
+    reply = Reply("start", message.chat.id).add(
         _(
             "Hello, {user}!\n\n"
             "Send me '-' when you go to sleep, and '+' when you wake up :) \n"
@@ -24,8 +26,10 @@ async def cmd_start(message: types.Message, user: User):
             "You can change language in /settings menu :)"
         ).format(user=hbold(message.from_user.full_name),)
     )
+    response = await reply.respond()
 
-    await user.update(conversation_started=True).apply()
+    await update_user(user, conversation_started=True)
+    return response
 
 
 @dp.message_handler(commands=["help"])
@@ -39,11 +43,16 @@ async def cmd_help(message: types.Message, user: User):
         _('"!m" - View monthly stats'),
         _('"! -1" - View previous week\'s stats'),
         _('"!m -1" - View previous month\'s stats'),
+        _('"!y" - View yearly stats'),
+        _('"!all" - View all-time stats'),
         _("{command} - Start conversation with bot").format(command="/start"),
         _("{command} - Show this message").format(command="/help"),
         _("{command} - User settings").format(command="/settings"),
+        _("{command} - Export sleep history").format(command="/export"),
+        _("{command} - Import sleep history").format(command="/import"),
     ]
-    await message.reply("\n".join(text))
+    reply = Reply("help", message.chat.id, reply_to_message_id=message.message_id)
+    return await reply.add("\n".join(text)).respond()
 
 
 @dp.errors_handler()
@@ -0,0 +1,54 @@
+from aiogram import types
+from aiogram.utils.markdown import hitalic
+from loguru import logger
+
+from app.middlewares.i18n import i18n
+from app.misc import dp
+from app.models.user import User
+from app.utils.datetime import parse_tz
+from app.utils.export import (
+    COMPRESSION,
+    FORMATS,
+    MAX_DOCUMENT_SIZE,
+    as_input_file,
+    export_filename,
+    export_size,
+    iterate_records,
+    write_export,
+)
+
+_ = i18n.gettext
+
+
+@dp.message_handler(commands=["export"])
+async def cmd_export(message: types.Message, user: User):
+    args = message.get_args().lower().split()
+    fmt = args.pop(0) if args and args[0] in FORMATS else FORMATS[0]
+    compress = args == [COMPRESSION]
+    if args and not compress:
+        await message.answer(
+            _("Wrong option! - {option}").format(option=message.get_args())
+        )
+        return
+
+    logger.info(
+        "User {user} requested sleep history export as {fmt}", user=user.id, fmt=fmt,
+    )
+    await types.ChatActions.upload_document()
+    spool = await write_export(
+        iterate_records(user.id), fmt, compress, parse_tz(user.timezone)
+    )
+    with spool:
+        if export_size(spool) > MAX_DOCUMENT_SIZE:
+            await message.answer(
+                hitalic(
+                    _("Your history is too large, try {command}").format(
+                        command=f"/export {fmt} {COMPRESSION}"
+                    )
+                )
+            )
+            return
+        await message.answer_document(
+            as_input_file(spool, export_filename(fmt, compress)),
+            caption=_("Your sleep history"),
+        )
@@ -0,0 +1,102 @@
+import csv
+import time
+from contextlib import suppress
+from tempfile import TemporaryFile
+
+from aiogram import types
+from aiogram.dispatcher.filters.state import default_state
+from aiogram.types import ContentTypes
+from aiogram.utils.exceptions import MessageNotModified
+from aiogram.utils.markdown import hitalic
+from loguru import logger
+
+from app.middlewares.i18n import i18n
+from app.misc import dp
+from app.models.user import User
+from app.utils import sleep_rollups, stats_cache
+from app.utils.datetime import parse_tz
+from app.utils.sleep_import import (
+    MAX_DOCUMENT_SIZE,
+    ImportStats,
+    import_records,
+    iterate_rows,
+    open_document,
+)
+from app.utils.states import States
+
+_ = i18n.gettext
+PROGRESS_INTERVAL = 2
+
+
+@dp.message_handler(commands=["import"])
+async def cmd_import(message: types.Message, user: User):
+    logger.info("User {user} wants to import sleep history", user=user.id)
+    await States.IMPORT_SLEEP_RECORDS.set()
+    await message.answer(
+        _(
+            "Send me a CSV or JSON file with your sleep history "
+            "in the same format as {command} produces (gzip is fine).\n"
+            "Times without time zone are treated as {timezone}.\n"
+            "Send any text to cancel."
+        ).format(command="/export", timezone=user.timezone)
+    )
+
+
+@dp.message_handler(
+    state=[States.IMPORT_SLEEP_RECORDS], content_types=ContentTypes.DOCUMENT
+)
+async def import_document(message: types.Message, user: User):
+    await default_state.set()
+    document = message.document
+    if document.file_size and document.file_size > MAX_DOCUMENT_SIZE:
+        await message.answer(hitalic(_("File is too large, try to gzip it")))
+        return
+
+    logger.info(
+        "User {user} imports sleep history from {file}",
+        user=user.id,
+        file=document.file_name,
+    )
+    status = await message.answer(hitalic(_("Importing...")))
+    last_edit = time.monotonic()
+
+    async def progress(stats: ImportStats):
+        nonlocal last_edit
+        if time.monotonic() - last_edit < PROGRESS_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        with suppress(MessageNotModified):
+            await status.edit_text(
+                hitalic(
+                    _("Importing... {count} records loaded").format(count=stats.loaded)
+                )
+            )
+
+    with TemporaryFile() as file:
+        await document.download(file)
+        rows = iterate_rows(open_document(file), parse_tz(user.timezone))
+        try:
+            stats = await import_records(user.id, rows, progress)
+        except (OSError, ValueError, csv.Error) as e:
+            logger.info("Failed to import file of user {user}: {e}", user=user.id, e=e)
+            await status.edit_text(_("Can't read this file"))
+            return
+
+    if stats.inserted:
+        await sleep_rollups.rebuild([user.id])
+        await stats_cache.invalidate(user.id)
+    await status.edit_text(
+        _(
+            "Import finished: {inserted} new records, "
+            "{duplicates} duplicates, {skipped} invalid rows skipped"
+        ).format(
+            inserted=stats.inserted, duplicates=stats.duplicates, skipped=stats.skipped,
+        )
+    )
+
+
+@dp.message_handler(state=[States.IMPORT_SLEEP_RECORDS], content_types=ContentTypes.ANY)
+async def import_cancel(message: types.Message, user: User):
+    logger.info("User {user} cancelled sleep history import", user=user.id)
+    await default_state.set()
+    await message.answer(_("Import cancelled"))
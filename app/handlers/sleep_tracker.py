@@ -1,10 +1,9 @@
-import asyncio
-from contextlib import suppress
+from bisect import bisect_left, bisect_right
+from datetime import date
 
 import pendulum
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup
-from aiogram.utils.exceptions import MessageCantBeDeleted
 from aiogram.utils.markdown import hbold, hitalic
 from loguru import logger
 from pendulum import DateTime, Period
@@ -16,59 +15,61 @@ from app.middlewares.i18n import i18n
 from app.misc import dp
 from app.models.sleep_record import SleepRecord
 from app.models.user import User
+from app.utils import sleep_index, sleep_rollups, stats_cache
 from app.utils.datetime import (
-    VISUAL_GRACE_TIME,
     as_datetime,
     as_month,
     as_short_date,
     latenight_offset,
     parse_tz,
 )
+from app.utils.interaction import Reply
+from app.utils.sleep_stats import local_day
 from app.utils.sleep_tracker import (
+    average_sleep,
     cb_moods,
     cb_sleep_or_wakeup,
-    get_average_sleep,
+    get_month_weeks,
     get_moods_markup,
     get_records_stats,
     get_sleep_markup,
     subtract_from,
 )
-from app.utils.wakeup_reminder import schedule_wakeup_reminder, sleep_duration
+from app.utils.stats_backend import stats_backend
+from app.utils.wakeup_reminder import (
+    cancel_wakeup_reminder,
+    schedule_wakeup_reminder,
+    sleep_duration,
+)
 
 _ = i18n.gettext
 
 
-@dp.message_handler(text="-")
-async def sleep_start(message: types.Message, user: User):
+async def start_sleep(user: User, reply: Reply):
     if await UserAwakeFilter(user_awake=False, user=user).check():
-        await message.answer(hitalic(_("Please record your previous sleep first!")))
+        reply.add(hitalic(_("Please record your previous sleep first!")))
         return
 
     logger.info("User {user} is going to sleep now", user=user.id)
     await SleepRecord.create(user_id=user.id)
+    await sleep_index.mark_asleep(user.id)
     tz: FixedTimezone = parse_tz(user.timezone)
     time: DateTime = pendulum.now(tz).add(seconds=sleep_duration.seconds)
     await schedule_wakeup_reminder(user, time, tz)
     markup = get_sleep_markup(_("I woke up"), "wakeup")
-    await asyncio.sleep(VISUAL_GRACE_TIME)
-    await message.answer(hitalic(_("Good night..")), reply_markup=markup)
+    reply.add(hitalic(_("Good night..")), reply_markup=markup)
 
 
-@dp.message_handler(text="+", user_awake=False)
-async def sleep_end(message: types.Message, user: User):
-    logger.info("User {user} is waking up now", user=user.id)
-    now = pendulum.now()
-    record: SleepRecord = await SleepRecord.query.where(
-        and_(SleepRecord.user_id == user.id, SleepRecord.wakeup_time == None)  # noqa
-    ).gino.first()
-    tz = parse_tz(user.timezone)
-    interval = Period(record.created_at, now).as_interval()
-    text = [
+def sleep_summary(record: SleepRecord, tz: FixedTimezone, language: str):
+    created_at = pendulum.instance(record.created_at)
+    wakeup_time = pendulum.instance(record.wakeup_time)
+    interval = Period(created_at, wakeup_time).as_interval()
+    return [
         hbold(_("Good morning!")),
         _("Your sleep:"),
-        f"{as_datetime(pendulum.instance(record.created_at), tz, user.language)}"
+        f"{as_datetime(created_at, tz, language)}"
         + " - "
-        + f"{as_datetime(now, tz, user.language)}"
+        + f"{as_datetime(wakeup_time, tz, language)}"
         + " -- "
         + hbold(
             _("{hours}h {minutes}min").format(
@@ -76,13 +77,42 @@ async def sleep_end(message: types.Message, user: User):
             )
         ),
     ]
+
+
+async def end_sleep(user: User, reply: Reply):
+    logger.info("User {user} is waking up now", user=user.id)
+    now = pendulum.now()
+    record: SleepRecord = await SleepRecord.query.where(
+        and_(SleepRecord.user_id == user.id, SleepRecord.wakeup_time == None)  # noqa
+    ).gino.first()
+    if record is None:
+        # sleep index was stale, user is already awake
+        await sleep_index.mark_awake(user.id)
+        reply.add(hitalic(_("You are awake already!")))
+        return
+    tz = parse_tz(user.timezone)
     await record.update(wakeup_time=now).apply()
-    await asyncio.sleep(VISUAL_GRACE_TIME)
-    await message.answer("\n".join(text))
-    await asyncio.sleep(VISUAL_GRACE_TIME)
-    await message.answer(
-        _("How do you feel?"), reply_markup=get_moods_markup(record.id)
-    )
+    await sleep_index.mark_awake(user.id)
+    await cancel_wakeup_reminder(user)
+    await sleep_rollups.add_sleep_record(record, tz)
+    await stats_cache.invalidate(user.id)
+    # summary and mood question go in one message
+    reply.add("\n".join(sleep_summary(record, tz, user.language)))
+    reply.add(_("How do you feel?"), reply_markup=get_moods_markup(record.id))
+
+
+@dp.message_handler(text="-")
+async def sleep_start(message: types.Message, user: User):
+    reply = Reply("sleep_start", message.chat.id)
+    await start_sleep(user, reply)
+    return await reply.respond()
+
+
+@dp.message_handler(text="+", user_awake=False)
+async def sleep_end(message: types.Message, user: User):
+    reply = Reply("sleep_end", message.chat.id)
+    await end_sleep(user, reply)
+    return await reply.respond()
 
 
 @dp.callback_query_handler(cb_sleep_or_wakeup.filter())
@@ -96,21 +126,22 @@ async def cq_user_sleep_or_wakeup(
         action=(action := callback_data["action"]),
     )
     await query.answer()
+    # message with the button is replaced by the answer
+    reply = Reply(
+        f"{action}_button",
+        query.message.chat.id,
+        edit_message_id=query.message.message_id,
+    )
     if action == "sleep" and await UserAwakeFilter(user_awake=True, user=user).check():
-        await sleep_start(query.message, user)
-        with suppress(MessageCantBeDeleted):
-            await asyncio.sleep(VISUAL_GRACE_TIME)
-            await query.message.delete()
+        await start_sleep(user, reply)
     elif (
         action == "wakeup"
         and await UserAwakeFilter(user_awake=False, user=user).check()
     ):
-        await sleep_end(query.message, user)
-        with suppress(MessageCantBeDeleted):
-            await asyncio.sleep(VISUAL_GRACE_TIME)
-            await query.message.delete()
+        await end_sleep(user, reply)
     else:
         return
+    await reply.send()
 
 
 @dp.callback_query_handler(cb_moods.filter())
@@ -125,8 +156,13 @@ async def cq_user_wakeup_mood(
     mood_text = mood + emoji
     sleep_record: SleepRecord = await SleepRecord.get(int(callback_data["record_id"]))
     await sleep_record.update(mood=mood, emoji=emoji).apply()
+    await stats_cache.invalidate(user.id)
 
     text = [_("Mood this morning"), mood_text]
+    # mood question used to be sent apart from the sleep summary
+    if query.message.text != _("How do you feel?") and sleep_record.wakeup_time:
+        tz = parse_tz(user.timezone)
+        text = [*sleep_summary(sleep_record, tz, user.language), "", *text]
     await query.answer()
     await query.message.edit_text(
         text="\n".join(text), reply_markup=InlineKeyboardMarkup()
@@ -146,10 +182,9 @@ async def sleep_statistics_month(message: types.Message, user: User):
     try:
         dt = subtract_from(date=now, diff=message.text, period="month")
     except ValueError:
-        await message.answer(_("Wrong option! - {option}").format(option=message.text))
-        return
+        text = _("Wrong option! - {option}").format(option=message.text)
+        return await Reply("stats_month", message.chat.id).add(text).respond()
 
-    monthly_records = []
     start_dt = pendulum.instance(
         now.replace(
             year=dt.year,
@@ -161,6 +196,10 @@ async def sleep_statistics_month(message: types.Message, user: User):
             microsecond=0,
         )
     ).add(seconds=latenight_offset.in_seconds())
+    cache_period = start_dt.format("YYYY-MM")
+    if cached := await stats_cache.get(user, "month", cache_period):
+        return await Reply("stats_month", message.chat.id).add(cached).respond()
+
     text = [
         hbold(
             _("Monthly stats for {month_year}: ").format(
@@ -169,61 +208,154 @@ async def sleep_statistics_month(message: types.Message, user: User):
         ),
     ]
 
-    end_dt = start_dt.add(weeks=1)
-    end_dt = end_dt.subtract(days=max(end_dt.day_of_week - 1, 0))
-
-    break_ = False
-    while not break_:
-        if end_dt.month != start_dt.month:
-            end_dt = end_dt.subtract(days=end_dt.day - 1)
-            break_ = True
-        weekly_records = (
-            await SleepRecord.query.where(
-                and_(
-                    SleepRecord.user_id == user.id,
-                    SleepRecord.created_at >= start_dt,
-                    SleepRecord.created_at <= end_dt,
+    end_dt = start_dt.add(months=1)
+    monthly_records, sleep_days = await stats_backend.get_period_stats(
+        user.id, tz, start_dt, end_dt
+    )
+    created = [record.created_at for record in monthly_records]
+    for week_start, week_end in get_month_weeks(start_dt):
+        lo = bisect_left(created, week_start)
+        hi = bisect_right(created, week_end)
+        if lo == hi:
+            continue
+        explicit_stats = get_records_stats(monthly_records[lo:hi], tz, user.language)
+        avg_sleep_per_day = average_sleep(
+            sleep_days.between(
+                local_day(week_start, tz.offset), local_day(week_end, tz.offset)
+            )
+        )
+        text.extend(
+            [
+                "",
+                hbold(
+                    "{start} - {end}: ".format(
+                        start=as_short_date(week_start, tz, user.language),
+                        end=as_short_date(week_end, tz, user.language),
+                    )
+                ),
+                *explicit_stats,
+                hbold(_("Average sleep:")),
+                hbold(
+                    _("{hours}h {minutes}min").format(
+                        hours=avg_sleep_per_day.hours,
+                        minutes=avg_sleep_per_day.minutes,
+                    )
+                ),
+            ]
+        )
+
+    avg_sleep_per_day = average_sleep(sleep_days)
+
+    text.extend(
+        [
+            "",
+            hbold(_("Monthly average sleep:")),
+            hbold(
+                _("{hours}h {minutes}min").format(
+                    hours=avg_sleep_per_day.hours, minutes=avg_sleep_per_day.minutes,
                 )
+            ),
+        ]
+    )
+    text = "\n".join(text)
+    await stats_cache.put(user, "month", cache_period, text)
+    return await Reply("stats_month", message.chat.id).add(text).respond()
+
+
+def format_rollup_line(label: str, total_seconds: int, days: int) -> str:
+    avg_sleep_per_day = sleep_rollups.rollup_average(total_seconds, days)
+    return (
+        f"{label} -- "
+        + hbold(
+            _("{hours}h {minutes}min").format(
+                hours=avg_sleep_per_day.hours, minutes=avg_sleep_per_day.minutes,
             )
-            .order_by(SleepRecord.created_at)
-            .gino.all()
         )
-        if weekly_records:
-            monthly_records.extend(weekly_records)
-            explicit_stats = get_records_stats(weekly_records, tz, user.language)
-            avg_sleep_per_day = get_average_sleep(weekly_records, tz, user.language)
-            text.extend(
-                [
-                    "",
-                    hbold(
-                        "{start} - {end}: ".format(
-                            start=as_short_date(start_dt, tz, user.language),
-                            end=as_short_date(end_dt, tz, user.language),
-                        )
-                    ),
-                    *explicit_stats,
-                    hbold(_("Average sleep:")),
-                    hbold(
-                        _("{hours}h {minutes}min").format(
-                            hours=avg_sleep_per_day.hours,
-                            minutes=avg_sleep_per_day.minutes,
-                        )
-                    ),
-                ]
+        + " "
+        + _("({count} nights)").format(count=days)
+    )
+
+
+@dp.message_handler(text_startswith="!у")
+@dp.message_handler(text_startswith="!y")
+async def sleep_statistics_year(message: types.Message, user: User):
+    logger.info(
+        "User {user} requested yearly sleep statistics, command - {cmd}",
+        user=message.from_user.id,
+        cmd=message.text,
+    )
+    tz = parse_tz(user.timezone)
+    now = pendulum.now(tz)
+    try:
+        dt = subtract_from(date=now, diff=message.text, period="year")
+    except ValueError:
+        text = _("Wrong option! - {option}").format(option=message.text)
+        return await Reply("stats_year", message.chat.id).add(text).respond()
+
+    cache_period = str(dt.year)
+    if cached := await stats_cache.get(user, "year", cache_period):
+        return await Reply("stats_year", message.chat.id).add(cached).respond()
+
+    monthly_stats = await sleep_rollups.get_monthly_stats(
+        user.id, start=date(dt.year, 1, 1), end=date(dt.year + 1, 1, 1)
+    )
+    text = [hbold(_("Yearly stats for {year}: ").format(year=dt.year)), ""]
+    for stats in monthly_stats:
+        month = pendulum.datetime(stats.month.year, stats.month.month, 1, tz=tz)
+        text.append(
+            format_rollup_line(
+                as_month(month, tz, user.language), stats.total_seconds, stats.days
             )
-        if break_:
-            break
-        start_dt = end_dt
-        end_dt = end_dt.add(weeks=1)
+        )
 
-    avg_sleep_per_day = get_average_sleep(
-        monthly_records, tz, user.language, mode="month", days=start_dt.days_in_month
+    avg_sleep_per_day = sleep_rollups.rollup_average(
+        sum(stats.total_seconds for stats in monthly_stats),
+        sum(stats.days for stats in monthly_stats),
+    )
+    text.extend(
+        [
+            "",
+            hbold(_("Yearly average sleep:")),
+            hbold(
+                _("{hours}h {minutes}min").format(
+                    hours=avg_sleep_per_day.hours, minutes=avg_sleep_per_day.minutes,
+                )
+            ),
+        ]
     )
+    text = "\n".join(text)
+    await stats_cache.put(user, "year", cache_period, text)
+    return await Reply("stats_year", message.chat.id).add(text).respond()
+
 
+@dp.message_handler(text="!all")
+async def sleep_statistics_all_time(message: types.Message, user: User):
+    logger.info(
+        "User {user} requested all-time sleep statistics", user=message.from_user.id
+    )
+    if cached := await stats_cache.get(user, "all", "all"):
+        return await Reply("stats_all", message.chat.id).add(cached).respond()
+
+    yearly_stats = {}
+    for stats in await sleep_rollups.get_monthly_stats(user.id):
+        total_seconds, days = yearly_stats.get(stats.month.year, (0, 0))
+        yearly_stats[stats.month.year] = (
+            total_seconds + stats.total_seconds,
+            days + stats.days,
+        )
+
+    text = [hbold(_("All-time stats: ")), ""]
+    for year, (total_seconds, days) in yearly_stats.items():
+        text.append(format_rollup_line(str(year), total_seconds, days))
+
+    avg_sleep_per_day = sleep_rollups.rollup_average(
+        sum(total_seconds for total_seconds, _days in yearly_stats.values()),
+        sum(days for _total_seconds, days in yearly_stats.values()),
+    )
     text.extend(
         [
             "",
-            hbold(_("Monthly average sleep:")),
+            hbold(_("All-time average sleep:")),
             hbold(
                 _("{hours}h {minutes}min").format(
                     hours=avg_sleep_per_day.hours, minutes=avg_sleep_per_day.minutes,
@@ -231,7 +363,9 @@ async def sleep_statistics_month(message: types.Message, user: User):
             ),
         ]
     )
-    await message.answer("\n".join(text))
+    text = "\n".join(text)
+    await stats_cache.put(user, "all", "all", text)
+    return await Reply("stats_all", message.chat.id).add(text).respond()
 
 
 @dp.message_handler(text_startswith="!")
@@ -244,29 +378,24 @@ async def sleep_statistics_week(message: types.Message, user: User):
     try:
         dt = subtract_from(date=now, diff=message.text, period="week")
     except ValueError:
-        await message.answer(_("Wrong option! - {option}").format(option=message.text))
-        return
+        text = _("Wrong option! - {option}").format(option=message.text)
+        return await Reply("stats_week", message.chat.id).add(text).respond()
     start_dt = pendulum.instance(
         dt.subtract(days=dt.weekday()).replace(
             hour=0, minute=0, second=0, microsecond=0,
         )
     ).add(seconds=latenight_offset.in_seconds())
     end_dt = start_dt.add(weeks=1)
+    cache_period = start_dt.to_date_string()
+    if cached := await stats_cache.get(user, "week", cache_period):
+        return await Reply("stats_week", message.chat.id).add(cached).respond()
 
-    weekly_records = (
-        await SleepRecord.query.where(
-            and_(
-                SleepRecord.user_id == user.id,
-                SleepRecord.created_at >= start_dt,
-                SleepRecord.created_at <= end_dt,
-            )
-        )
-        .order_by(SleepRecord.created_at)
-        .gino.all()
+    weekly_records, sleep_days = await stats_backend.get_period_stats(
+        user.id, tz, start_dt, end_dt
     )
 
     explicit_stats = get_records_stats(weekly_records, tz, user.language)
-    avg_sleep_per_day = get_average_sleep(weekly_records, tz, user.language)
+    avg_sleep_per_day = average_sleep(sleep_days)
 
     text = [
         hbold(
@@ -284,4 +413,6 @@ async def sleep_statistics_week(message: types.Message, user: User):
             )
         ),
     ]
-    await message.answer("\n".join(text))
+    text = "\n".join(text)
+    await stats_cache.put(user, "week", cache_period, text)
+    return await Reply("stats_week", message.chat.id).add(text).respond()
@@ -1,8 +1,11 @@
 from aiogram import types
+from aiogram.utils.parts import safe_split_text
 
 from app.middlewares.i18n import i18n
 from app.misc import dp
+from app.utils.metrics import metrics
 from app.utils.superuser import create_super_user
+from app.utils.user_cache import user_cache
 
 _ = i18n.gettext
 
@@ -32,3 +35,23 @@ async def cmd_superuser(message: types.Message):
             is_superuser=not remove, user=user_id
         )
     )
+
+
+@dp.message_handler(commands=["user_cache"], is_superuser=True)
+async def cmd_user_cache(message: types.Message):
+    stats = user_cache.stats()
+    requests = stats["hits"] + stats["misses"]
+    await message.answer(
+        "User cache: {size}/{maxsize} entries\n"
+        "Hits: {hits}, misses: {misses}, hit ratio: {ratio:.1%}\n"
+        "Prefetched from update batches: {prefetched}".format(
+            ratio=stats["hits"] / max(requests, 1), **stats
+        )
+    )
+
+
+@dp.message_handler(commands=["scheduler_stats"], is_superuser=True)
+async def cmd_scheduler_stats(message: types.Message):
+    lines = metrics.summary() or ["Nothing recorded yet"]
+    for part in safe_split_text("\n".join(lines)):
+        await message.answer(part)
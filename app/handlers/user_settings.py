@@ -1,4 +1,3 @@
-import asyncio
 from contextlib import suppress
 
 from aiogram import types
@@ -14,9 +13,11 @@ import app.utils.bedtime_reminder
 from app.middlewares.i18n import i18n
 from app.misc import bot, dp
 from app.models.user import User
-from app.utils import scheduler
-from app.utils.datetime import VISUAL_GRACE_TIME, parse_time, parse_tz
+from app.utils import scheduler, sleep_rollups, stats_cache
+from app.utils.datetime import parse_time, parse_tz
+from app.utils.interaction import Reply
 from app.utils.states import States
+from app.utils.user_cache import update_user
 from app.utils.user_settings import (
     cb_user_settings,
     get_bedtime_reminder_markup,
@@ -94,7 +95,7 @@ async def cq_reset_reminder(
     logger.info(
         "User {user} reset his reminder", user=query.from_user.id,
     )
-    await user.update(reminder="-").apply()
+    await update_user(user, reminder="-")
     await app.utils.bedtime_reminder.delete_bedtime_reminder(user)
     await query.answer(_("Reminder reset"))
     text, markup = get_user_settings_markup(user)
@@ -113,22 +114,21 @@ async def set_timezone(message: types.Message, user: User, state: FSMContext):
     except ValueError:
         await message.answer(_("Wrong format! See examples above"))
         return
-    await user.update(timezone=tz.name).apply()
+    await update_user(user, timezone=tz.name)
     await app.utils.bedtime_reminder.schedule_bedtime_reminder(user, tz=tz)
+    await sleep_rollups.rebuild([user.id])
+    await stats_cache.invalidate(user.id)
 
     state_data = await state.get_data() or {}
     if original_message_id := state_data.get("original_message_id"):
-        with suppress(MessageCantBeDeleted):
-            await asyncio.sleep(VISUAL_GRACE_TIME)
-            await bot.delete_message(user.id, original_message_id)
-        with suppress(MessageCantBeDeleted):
-            await asyncio.sleep(VISUAL_GRACE_TIME)
-            await message.delete()
+        # settings message is updated in place, user's answer is cleaned up
         text, markup = get_user_settings_markup(user)
-        await message.answer(
+        reply = Reply("set_timezone", user.id, edit_message_id=original_message_id)
+        reply.add(
             _("Time zone changed to {timezone}").format(timezone=tz.name),
             reply_markup=markup,
         )
+        await reply.delete(message.message_id).send()
         await state.set_data({})
     await default_state.set()
 
@@ -145,22 +145,21 @@ async def set_bedtime_reminder(message: types.Message, user: User, state: FSMCon
     except ValueError:
         await message.answer(_("Wrong time format!"))
         return
-    await user.update(reminder=time.format("HH:mm")).apply()
+    await update_user(user, reminder=time.format("HH:mm"))
     await app.utils.bedtime_reminder.schedule_bedtime_reminder(user, time=time)
 
     state_data = await state.get_data() or {}
     if original_message_id := state_data.get("original_message_id"):
-        with suppress(MessageCantBeDeleted):
-            await asyncio.sleep(VISUAL_GRACE_TIME)
-            await bot.delete_message(user.id, original_message_id)
-        with suppress(MessageCantBeDeleted):
-            await asyncio.sleep(VISUAL_GRACE_TIME)
-            await message.delete()
+        # settings message is updated in place, user's answer is cleaned up
         text, markup = get_user_settings_markup(user)
-        await message.answer(
+        reply = Reply(
+            "set_bedtime_reminder", user.id, edit_message_id=original_message_id
+        )
+        reply.add(
             _("Bedtime reminder changed to {time}").format(time=time.format("HH:mm")),
             reply_markup=markup,
         )
+        await reply.delete(message.message_id).send()
         await state.set_data({})
     await default_state.set()
 
@@ -204,7 +203,8 @@ async def cq_choose_language(
     )
 
     i18n.ctx_locale.set(target_language)
-    await user.update(language=target_language).apply()
+    await update_user(user, language=target_language)
+    await stats_cache.invalidate(user.id)
     text, markup = get_user_settings_markup(user)
     await query.answer(
         _("Language changed to {new_language}").format(
@@ -224,7 +224,7 @@ async def cq_do_not_disturb(query: types.CallbackQuery, user: User):
             mode=_("switched on") if not user.do_not_disturb else _("switched off")
         )
     )
-    await user.update(do_not_disturb=not user.do_not_disturb).apply()
+    await update_user(user, do_not_disturb=not user.do_not_disturb)
     text, markup = get_user_settings_markup(user)
     with suppress(MessageNotModified):
         await query.message.edit_text(text, reply_markup=markup)
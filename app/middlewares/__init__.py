@@ -3,6 +3,7 @@ from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from loguru import logger
 
 from app.middlewares.acl import ACLMiddleware
+from app.middlewares.metrics import MetricsMiddleware
 
 
 def setup(dispatcher: Dispatcher):
@@ -11,4 +12,5 @@ def setup(dispatcher: Dispatcher):
 
     dispatcher.middleware.setup(LoggingMiddleware("bot"))
     dispatcher.middleware.setup(ACLMiddleware())
+    dispatcher.middleware.setup(MetricsMiddleware())
     dispatcher.middleware.setup(i18n)
@@ -6,6 +6,7 @@ from aiogram.dispatcher.middlewares import BaseMiddleware
 from loguru import logger
 
 from app.models.user import User
+from app.utils.user_cache import user_cache
 
 
 class ACLMiddleware(BaseMiddleware):
@@ -23,9 +24,10 @@ class ACLMiddleware(BaseMiddleware):
             )
             raise CancelHandler()
 
-        user = await User.get(user_id)
+        user = await user_cache.get_or_load(user_id)
         if user is None:
             user = await User.create(id=user_id)
+            user_cache.put(user)
             logger.info("User {user} created!", user=user)
 
         data["user"] = user
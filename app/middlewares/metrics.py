@@ -0,0 +1,16 @@
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from app.utils.metrics import current_update
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Names the update being processed after the handler it is passed to
+    """
+
+    async def trigger(self, action, args):
+        update = current_update.get()
+        # set by the dispatcher once the update reaches handlers of its type
+        if update is not None and action.startswith("process_"):
+            update.handler = current_handler.get().__name__
@@ -1,20 +1,27 @@
 import aiohttp
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, types
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 from loguru import logger
 
 from app import config
+from app.utils.dispatcher import BatchDispatcher
 
 proxy_auth = aiohttp.BasicAuth(
     login=config.PROXY_USERNAME, password=config.PROXY_PASSWORD
 )
 
+server = TELEGRAM_PRODUCTION
+if config.BOT_API_SERVER:
+    server = TelegramAPIServer.from_base(config.BOT_API_SERVER)
+
 bot = Bot(
     token=config.BOT_TOKEN,
     proxy=config.PROXY_URL,
     proxy_auth=proxy_auth,
     parse_mode=types.ParseMode.HTML,
+    server=server,
 )
-dp = Dispatcher(bot)
+dp = BatchDispatcher(bot, workers=config.UPDATE_WORKERS)
 
 
 def setup():
@@ -3,8 +3,19 @@
 
 from .apscheduler import APSchedulerJob
 from .db import db
-from .reminders import BedtimeReminder
+from .reminders import ReminderDelivery, ReminderMinute, WakeupReminder
 from .sleep_record import SleepRecord
+from .sleep_stats import SleepDailyStats, SleepMonthlyStats
 from .user import User
 
-__all__ = ("db", "User", "SleepRecord", "APSchedulerJob", "BedtimeReminder")
+__all__ = (
+    "db",
+    "User",
+    "SleepRecord",
+    "SleepDailyStats",
+    "SleepMonthlyStats",
+    "APSchedulerJob",
+    "WakeupReminder",
+    "ReminderMinute",
+    "ReminderDelivery",
+)
@@ -8,6 +8,7 @@ from gino import Gino
 from loguru import logger
 
 from app import config
+from app.utils.metrics import current_update, metrics
 
 db = Gino()
 
@@ -41,9 +42,23 @@ class TimedBaseModel(BaseModel):
     )
 
 
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    update = current_update.get()
+    if update is None:
+        metrics.count("db_queries", "background")
+    else:
+        update.db_queries += 1
+
+
 async def on_startup(dispatcher: Union[Dispatcher, None]):
     logger.info("Setup PostgreSQL Connection")
-    await db.set_bind(config.POSTGRES_URI)
+    await db.set_bind(
+        config.POSTGRES_URI,
+        min_size=config.POSTGRES_POOL_SIZE,
+        max_size=config.POSTGRES_POOL_SIZE,
+    )
+    # gino compiles every query with sqlalchemy, which reports it here
+    sa.event.listen(db.bind._sa_engine, "before_cursor_execute", count_query)
 
 
 async def on_shutdown(dispatcher: Union[Dispatcher, None]):
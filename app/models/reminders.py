@@ -1,11 +1,42 @@
-from app.models.apscheduler import APSchedulerJobsRelatedModel
-from app.models.db import TimedBaseModel
+from app.models.db import BaseModel, db
 from app.models.user import UserRelatedModel
 
 
-class BedtimeReminder(APSchedulerJobsRelatedModel, UserRelatedModel, TimedBaseModel):
-    __tablename__ = "bedtime_reminders"
+class WakeupReminder(UserRelatedModel):
+    __tablename__ = "wakeup_reminders"
 
+    fire_at = db.Column(db.DateTime(True), nullable=False, index=True)
+    # replica sending the reminder, see app.utils.claims
+    claimed_by = db.Column(db.String(32))
+    claimed_until = db.Column(db.DateTime(True))
 
-class WakeupReminder(APSchedulerJobsRelatedModel, UserRelatedModel, TimedBaseModel):
-    __tablename__ = "wakeup_reminders"
+    _pk = db.PrimaryKeyConstraint("user_id", name="wakeup_reminders_pkey")
+
+
+class ReminderMinute(BaseModel):
+    """
+    Minute of the reminder wheel claimed or sent by a replica
+    """
+
+    __tablename__ = "reminder_minutes"
+
+    minute_at = db.Column(db.DateTime(True), primary_key=True)
+    claimed_by = db.Column(db.String(32), nullable=False)
+    claimed_until = db.Column(db.DateTime(True), nullable=False)
+    done = db.Column(db.Boolean, nullable=False, default=False)
+
+
+class ReminderDelivery(BaseModel):
+    """
+    User reminded in a claimed minute, not reminded again by a replica
+    taking the minute over
+    """
+
+    __tablename__ = "reminder_deliveries"
+
+    minute_at = db.Column(
+        db.DateTime(True),
+        db.ForeignKey("reminder_minutes.minute_at", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    user_id = db.Column(db.Integer, primary_key=True)
@@ -7,12 +7,22 @@ from app.models.user import UserRelatedModel
 class SleepRecord(UserRelatedModel, TimedBaseModel):
     __tablename__ = "sleep_records"
 
-    id = db.Column(db.Integer, primary_key=True, index=True, unique=True)
+    id = db.Column(db.Integer, primary_key=True)
     wakeup_time = db.Column(db.DateTime(True))
     mood = db.Column(db.String)
     emoji = db.Column(db.String)
     note = db.Column(db.String)
 
+    _user_id_created_at_idx = db.Index(
+        "ix_sleep_records_user_id_created_at", "user_id", "created_at"
+    )
+    _user_id_open_idx = db.Index(
+        "ux_sleep_records_user_id_open",
+        "user_id",
+        unique=True,
+        postgresql_where=db.text("wakeup_time IS NULL"),
+    )
+
 
 class SleepRecordRelatedModel(BaseModel):
     __abstract__ = True
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from app.models.db import TimedBaseModel, db
+from app.models.user import UserRelatedModel
+
+
+class SleepDailyStats(UserRelatedModel, TimedBaseModel):
+    __tablename__ = "sleep_daily_stats"
+
+    day = db.Column(db.Date, nullable=False)
+    total_seconds = db.Column(db.Integer, nullable=False, server_default="0")
+    records = db.Column(db.Integer, nullable=False, server_default="0")
+
+    _pk = db.PrimaryKeyConstraint("user_id", "day")
+
+
+class SleepMonthlyStats(UserRelatedModel, TimedBaseModel):
+    __tablename__ = "sleep_monthly_stats"
+
+    month = db.Column(db.Date, nullable=False)
+    total_seconds = db.Column(db.BigInteger, nullable=False, server_default="0")
+    days = db.Column(db.Integer, nullable=False, server_default="0")
+    records = db.Column(db.Integer, nullable=False, server_default="0")
+
+    _pk = db.PrimaryKeyConstraint("user_id", "month")
@@ -8,11 +8,13 @@ from app.models.db import BaseModel, TimedBaseModel, db
 class User(TimedBaseModel):
     __tablename__ = "users"
 
-    id = db.Column(db.Integer, primary_key=True, index=True, unique=True)
+    id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String)
     language = db.Column(db.String(12), default="ru")
     timezone = db.Column(db.String, default="+00:00")
     reminder = db.Column(db.String, default="-")
+    # minute of the UTC day reminder is sent at, see app.utils.reminder_wheel
+    reminder_minute = db.Column(db.SmallInteger, index=True)
     is_superuser = db.Column(db.Boolean, server_default=expression.false())
     conversation_started = db.Column(db.Boolean, server_default=expression.true())
     active = db.Column(db.Boolean, server_default=expression.true())
@@ -5,32 +5,28 @@ from loguru import logger
 from pendulum import DateTime
 from pendulum.tz.timezone import FixedTimezone
 
-from app.filters.sleep_tracker import UserAwakeFilter
 from app.middlewares.i18n import i18n
-from app.misc import bot
-from app.models.reminders import BedtimeReminder
 from app.models.user import User
 from app.utils.datetime import parse_time, parse_tz
+from app.utils.fanout import Message
 from app.utils.sleep_tracker import get_sleep_markup
+from app.utils.user_cache import update_user
 
+MINUTES_PER_DAY = 24 * 60
 _ = i18n.gettext
 
 
+def reminder_minute(time: DateTime, tz: FixedTimezone) -> int:
+    """
+    Minute of the UTC day a reminder at local time fires at
+    """
+    return (time.hour * 60 + time.minute - tz.offset // 60) % MINUTES_PER_DAY
+
+
 async def delete_bedtime_reminder(user: User):
     logger.info(f"Removing bedtime reminder for user {user.id}")
-    reminder: BedtimeReminder = await BedtimeReminder.query.where(
-        BedtimeReminder.user_id == user.id
-    ).gino.first()
-    if reminder:
-        from app.utils.scheduler import (
-            JOBSTORE_DEFAULT,
-            scheduler,
-        )
-
-        scheduler.remove_job(reminder.job_id, JOBSTORE_DEFAULT)
-        await BedtimeReminder.delete.where(
-            BedtimeReminder.job_id == reminder.job_id
-        ).apply()
+    if user.reminder_minute is not None:
+        await update_user(user, reminder_minute=None)
 
 
 async def schedule_bedtime_reminder(
@@ -44,27 +40,19 @@ async def schedule_bedtime_reminder(
             # no reminder set for user, no need to reschedule job
             return
         time: DateTime = parse_time(user.reminder)
-        time = time.set(tz=tz)
     logger.info(f"Time: {time.to_time_string()}, tz: {tz.name}")
 
-    reminder: BedtimeReminder = await BedtimeReminder.query.where(
-        BedtimeReminder.user_id == user.id
-    ).gino.first()
-    job_id = reminder.job_id if reminder else None
-
-    from app.utils.scheduler import scheduler, schedule_job
-
-    time = time.in_tz(scheduler.timezone)
-    await schedule_job(job_id, BedtimeReminder, time, bedtime_reminder_func, user)
+    minute = reminder_minute(time, tz)
+    if user.reminder_minute != minute:
+        await update_user(user, reminder_minute=minute)
 
 
-async def bedtime_reminder_func(user: User):
-    logger.info(f"Sending bedtime reminder to user {user.id}")
-    if await UserAwakeFilter(user_awake=True, user=user).check():
-        markup = get_sleep_markup(_("I'm going to sleep"), "sleep")
-        await bot.send_message(
-            user.id,
-            hitalic(_("Hey!.. Time to sleep, my dear friend.")),
-            disable_notification=user.do_not_disturb,
-            reply_markup=markup,
-        )
+def bedtime_reminder_message(user: User) -> Message:
+    locale = user.language or i18n.default
+    markup = get_sleep_markup(_("I'm going to sleep", locale=locale), "sleep")
+    text = hitalic(_("Hey!.. Time to sleep, my dear friend.", locale=locale))
+    return (
+        user.id,
+        text,
+        dict(disable_notification=user.do_not_disturb, reply_markup=markup),
+    )
@@ -0,0 +1,28 @@
+import uuid
+from datetime import timedelta
+
+from sqlalchemy import Interval, cast, func
+
+from app import config
+
+# identifies this replica in claims of due reminders
+INSTANCE_ID = uuid.uuid4().hex
+# seconds between renewals of claims of a burst in flight,
+# and between records of users it reached
+CLAIM_RENEW_INTERVAL = 1
+
+
+def claim_lease() -> timedelta:
+    """
+    Claims are renewed while their burst is sent,
+    other replicas take over claims of a replica that died once they expire
+    """
+    return timedelta(seconds=config.SCHEDULER_CLAIM_LEASE)
+
+
+def before_now(delta: timedelta):
+    """
+    now() - delta, with delta cast to interval,
+    postgres takes an untyped parameter for a timestamp otherwise
+    """
+    return func.now() - cast(delta, Interval)
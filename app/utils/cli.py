@@ -1,4 +1,6 @@
+import asyncio
 import functools
+import sys
 
 import click
 from aiogram.__main__ import SysInfo
@@ -74,3 +76,168 @@ def webhook():
     from app import config
 
     runner.start_webhook(webhook_path=config.WEBHOOK_PATH, port=config.BOT_PUBLIC_PORT)
+
+
+@cli.command()
+@click.option(
+    "--batch-size", default=1000, show_default=True, help="Users per transaction"
+)
+@click.option(
+    "--concurrency", default=4, show_default=True, help="Batches processed at once"
+)
+def rollups(batch_size: int, concurrency: int):
+    """
+    Rebuild sleep statistics rollups from sleep records
+    """
+    from app.models import db
+    from app.utils import sleep_rollups
+
+    async def main():
+        await db.on_startup(None)
+        try:
+            await sleep_rollups.backfill(batch_size, concurrency)
+        finally:
+            await db.on_shutdown(None)
+
+    asyncio.run(main())
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8081, show_default=True)
+@click.option(
+    "--rate", default=30.0, show_default=True, help="Messages per second, 0 - no limit"
+)
+@click.option(
+    "--chat-rate",
+    default=1.0,
+    show_default=True,
+    help="Messages per second to one chat, 0 - no limit",
+)
+@click.option(
+    "--latency", default=0.0, show_default=True, help="Seconds added to every call"
+)
+def fake_api(host: str, port: int, rate: float, chat_rate: float, latency: float):
+    """
+    Run fake Telegram Bot API server, point BOT_API_SERVER at it
+    """
+    from aiohttp import web
+    from app.utils.fake_bot_api import FakeBotAPI
+
+    api = FakeBotAPI(rate=rate, chat_rate=chat_rate, latency=latency)
+    app = api.make_app()
+
+    async def on_shutdown(app: web.Application):
+        api.log()
+
+    app.on_shutdown.append(on_shutdown)
+    web.run_app(app, host=host, port=port)
+
+
+@cli.command()
+@click.option("--users", default=10000, show_default=True)
+@click.option("--days", default=1, show_default=True)
+@click.option(
+    "--day-seconds",
+    default=600.0,
+    show_default=True,
+    help="Seconds a simulated day takes",
+)
+@click.option(
+    "--start-hour", default=12.0, show_default=True, help="UTC hour the run starts at"
+)
+@click.option("--webhook", is_flag=True, default=False, help="Push updates to webhook")
+@click.option("--bedtime", default=23.0, show_default=True, help="Local hour")
+@click.option("--bedtime-spread", default=1.0, show_default=True, help="Hours")
+@click.option("--sleep-hours", default=7.5, show_default=True)
+@click.option("--sleep-spread", default=1.0, show_default=True, help="Hours")
+@click.option(
+    "--mood-rate", default=0.7, show_default=True, help="Share of mornings with mood"
+)
+@click.option(
+    "--stats-per-day", default=0.5, show_default=True, help="Stats commands of a user"
+)
+@click.option(
+    "--settings-rate",
+    default=0.02,
+    show_default=True,
+    help="Share of users changing time zone a day",
+)
+@click.option(
+    "--timezones",
+    default="+00:00,+03:00",
+    show_default=True,
+    help="Time zones users are spread over",
+)
+@click.option("--seed", default=0, show_default=True)
+@click.option(
+    "--rate",
+    default=0.0,
+    show_default=True,
+    help="Bot API messages per second, 0 - no limit",
+)
+@click.option(
+    "--chat-rate",
+    default=1.0,
+    show_default=True,
+    help="Bot API messages per second to one chat, 0 - no limit",
+)
+@click.option(
+    "--latency", default=0.05, show_default=True, help="Seconds per Bot API call"
+)
+@click.option("--verbose", is_flag=True, default=False, help="Log every update")
+def loadtest(
+    users: int,
+    days: int,
+    day_seconds: float,
+    start_hour: float,
+    webhook: bool,
+    bedtime: float,
+    bedtime_spread: float,
+    sleep_hours: float,
+    sleep_spread: float,
+    mood_rate: float,
+    stats_per_day: float,
+    settings_rate: float,
+    timezones: str,
+    seed: int,
+    rate: float,
+    chat_rate: float,
+    latency: float,
+    verbose: bool,
+):
+    """
+    Replay days of simulated users against local postgres and redis
+    with a fake Telegram Bot API, report latency of handlers
+    """
+    from app.utils import loadtest
+
+    if not verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+    profile = loadtest.Profile(
+        bedtime=bedtime,
+        bedtime_spread=bedtime_spread,
+        sleep_hours=sleep_hours,
+        sleep_spread=sleep_spread,
+        mood_rate=mood_rate,
+        stats_per_day=stats_per_day,
+        settings_rate=settings_rate,
+        timezones=timezones.split(","),
+    )
+    try:
+        lines = loadtest.run(
+            users,
+            days,
+            day_seconds,
+            start_hour,
+            webhook,
+            profile,
+            seed,
+            rate,
+            chat_rate,
+            latency,
+        )
+    except loadtest.DatabaseInUseError as e:
+        raise click.ClickException(str(e))
+    click.echo("\n".join(lines or []))
@@ -1,15 +1,27 @@
-from typing import Union
+import re
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Callable, Dict, List, Union
 
 import pendulum
 from loguru import logger
 from pendulum import DateTime, Duration
+from pendulum.locales.locale import Locale
 from pendulum.tz.timezone import FixedTimezone
 
 datetime_fmtr = pendulum.Formatter()
 latenight_offset = Duration(hours=5)
 VISUAL_GRACE_TIME = 0.1
 
+LOCALES = ("en", "ru")
+# same tokenizer as pendulum so patterns are split identically
+TOKENS_RE = re.compile(pendulum.Formatter._TOKENS)
+NAMED_TOKENS = ("MMMM", "MMM", "dd", "d")
 
+Render = Callable[[datetime], str]
+
+
+@lru_cache(maxsize=1024)
 def parse_tz(timezone: str) -> Union[FixedTimezone, None]:
     try:
         sign = timezone[0]
@@ -39,29 +51,132 @@ def parse_time(time: str) -> Union[DateTime, None]:
         raise e
 
 
+@lru_cache(maxsize=None)
+def locale_tables(locale: str) -> Dict[str, Dict[int, str]]:
+    """
+    Month and weekday names of locale, weekdays are indexed from sunday
+    like pendulum's day_of_week
+    """
+    loaded = Locale.load(locale)
+    return {
+        "months_wide": loaded.get("translations.months.wide"),
+        "months_abbreviated": loaded.get("translations.months.abbreviated"),
+        "days_short": loaded.get("translations.days.short"),
+    }
+
+
+for _locale in LOCALES:
+    locale_tables(_locale)
+
+
+def _day_of_week(dt: datetime) -> int:
+    return dt.isoweekday() % 7
+
+
+NUMERIC_FIELDS = {
+    "YYYY": "{0.year:d}",
+    "MM": "{0.month:02d}",
+    "M": "{0.month:d}",
+    "DD": "{0.day:02d}",
+    "D": "{0.day:d}",
+    "HH": "{0.hour:02d}",
+    "H": "{0.hour:d}",
+    "mm": "{0.minute:02d}",
+    "m": "{0.minute:d}",
+    "ss": "{0.second:02d}",
+    "s": "{0.second:d}",
+}
+
+
+def _named_getter(token: str, tables: Dict[str, Dict[int, str]]) -> Render:
+    if token == "MMMM":
+        months_wide = tables["months_wide"]
+        return lambda dt: months_wide[dt.month]
+    if token == "MMM":
+        months_abbreviated = tables["months_abbreviated"]
+        return lambda dt: months_abbreviated[dt.month]
+    if token == "dd":
+        days_short = tables["days_short"]
+        return lambda dt: days_short[_day_of_week(dt)]
+    return lambda dt: str(_day_of_week(dt))
+
+
+@lru_cache(maxsize=256)
+def compile_format(fmt: str, locale: str = "en") -> Render:
+    """
+    Turn pattern into a single str.format template with locale names
+    already looked up, output is the same as pendulum.Formatter.format
+    """
+    template = []
+    getters: List[Render] = []
+    position = 0
+    for match in TOKENS_RE.finditer(fmt):
+        start = match.start()
+        prefix = _escape(fmt[position:start])
+        literal, escaped, token = match.group(1, 2, 3)
+        if token is None:
+            template.append(
+                prefix + _escape(literal if literal is not None else escaped)
+            )
+        elif token in NUMERIC_FIELDS:
+            template.append(prefix + NUMERIC_FIELDS[token])
+        elif token in NAMED_TOKENS:
+            getters.append(_named_getter(token, locale_tables(locale)))
+            template.append(prefix + f"{{{len(getters)}}}")
+        else:
+            # rarely used tokens are left to pendulum
+            return lambda dt: datetime_fmtr.format(pendulum.instance(dt), fmt, locale)
+        position = match.end()
+    template.append(_escape(fmt[position:]))
+    return _renderer("".join(template), getters)
+
+
+def _escape(literal: str) -> str:
+    return literal.replace("{", "{{").replace("}", "}}")
+
+
+def _renderer(template: str, getters: List[Render]) -> Render:
+    if not getters:
+        return template.format
+    return lambda dt: template.format(dt, *[getter(dt) for getter in getters])
+
+
+@lru_cache(maxsize=1024)
+def _stdlib_tz(tz: tzinfo) -> tzinfo:
+    if isinstance(tz, FixedTimezone):
+        return timezone(timedelta(seconds=tz.offset))
+    return tz
+
+
+def format_in_tz(dt: datetime, tz, fmt: str, locale: str = "en") -> str:
+    # converting with stdlib timezone keeps the C fast path
+    # and works for both pendulum and asyncpg datetimes
+    return compile_format(fmt, locale)(datetime.astimezone(dt, _stdlib_tz(tz)))
+
+
 def as_short_date(dt: DateTime, tz, locale):
-    return datetime_fmtr.format(dt.in_tz(tz), "D MMM", locale)
+    return format_in_tz(dt, tz, "D MMM", locale)
 
 
 def as_month(dt: DateTime, tz, locale):
-    return datetime_fmtr.format(dt.in_tz(tz), "MMMM YYYY", locale)
+    return format_in_tz(dt, tz, "MMMM YYYY", locale)
 
 
 def as_datetime(dt: DateTime, tz, locale):
-    return datetime_fmtr.format(dt.in_tz(tz), "D MMMM, dd HH:mm:ss", locale)
+    return format_in_tz(dt, tz, "D MMMM, dd HH:mm:ss", locale)
 
 
 def as_time(dt: DateTime, tz):
-    return datetime_fmtr.format(dt.in_tz(tz), "HH:mm:ss")
+    return format_in_tz(dt, tz, "HH:mm:ss")
 
 
 def as_weekday(dt: DateTime, tz, locale):
-    return datetime_fmtr.format(dt.in_tz(tz), "dd", locale)
+    return format_in_tz(dt, tz, "dd", locale)
 
 
 def as_weekday_int(dt: DateTime, tz):
-    return datetime_fmtr.format(dt.in_tz(tz), "d")
+    return format_in_tz(dt, tz, "d")
 
 
 def as_day(dt: DateTime, tz):
-    return datetime_fmtr.format(dt.in_tz(tz), "D")
+    return format_in_tz(dt, tz, "D")
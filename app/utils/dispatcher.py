@@ -0,0 +1,120 @@
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Dispatcher, types
+
+from app.utils.metrics import UpdateStats, current_update, metrics
+from app.utils.user_cache import user_cache
+
+# last update of the user queued before, done when it is, and this one
+Lane = Tuple[Optional[asyncio.Future], asyncio.Future]
+
+
+def get_private_user_id(update: types.Update) -> Optional[int]:
+    if update.message:
+        if update.message.chat.type == types.ChatType.PRIVATE:
+            return update.message.from_user.id
+    elif update.callback_query:
+        message = update.callback_query.message
+        if not message or message.chat.type == types.ChatType.PRIVATE:
+            return update.callback_query.from_user.id
+    return None
+
+
+def get_batch_user_ids(updates: Iterable[types.Update]) -> List[int]:
+    user_ids = {get_private_user_id(update) for update in updates}
+    user_ids.discard(None)
+    return list(user_ids)
+
+
+class BatchDispatcher(Dispatcher):
+    """
+    Dispatcher resolving users of the whole updates batch before processing it.
+    Updates of one user are processed one by one in order they came in, updates
+    of different users at once, by at most `workers` at a time
+    """
+
+    def __init__(self, *args, workers: int = 10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workers = workers
+        self._workers: Optional[asyncio.Semaphore] = None
+        # last update of each user queued or being processed, done when it is
+        self._lanes: Dict[int, asyncio.Future] = {}
+        # lanes joined by batches for their updates, by update id
+        self._reserved: Dict[int, Lane] = {}
+
+    async def process_updates(self, updates, fast: bool = True):
+        # polling hands batches over without waiting for the previous one,
+        # lanes are joined before the prefetch, so a batch of cached users
+        # does not overtake an earlier one still loading its users
+        reserved = []
+        for update in updates:
+            user_id = get_private_user_id(update)
+            if user_id is not None and update.update_id not in self._reserved:
+                self._reserved[update.update_id] = self._join_lane(user_id)
+                reserved.append((update.update_id, user_id))
+        try:
+            if user_ids := get_batch_user_ids(updates):
+                await user_cache.prefetch(user_ids)
+            return await super().process_updates(updates, fast)
+        finally:
+            # updates not processed because of an error or cancellation
+            for update_id, user_id in reserved:
+                if (lane := self._reserved.pop(update_id, None)) is not None:
+                    self._release_lane(user_id, *lane)
+
+    async def process_update(self, update: types.Update):
+        received = time.perf_counter()
+        user_id = get_private_user_id(update)
+        if user_id is None:
+            return await self._process_update(update, received)
+        if self._workers is None:
+            self._workers = asyncio.Semaphore(self.workers)
+        # joins the lane before the first await unless its batch did,
+        # so updates of a batch keep their order
+        lane = self._reserved.pop(update.update_id, None)
+        previous, done = lane or self._join_lane(user_id)
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            async with self._workers:
+                return await self._process_update(update, received)
+        finally:
+            self._release_lane(user_id, previous, done)
+
+    async def _process_update(self, update: types.Update, received: float):
+        stats = UpdateStats()
+        token = current_update.set(stats)
+        started = time.perf_counter()
+        try:
+            return await super().process_update(update)
+        finally:
+            current_update.reset(token)
+            metrics.observe("update_wait", stats.handler, started - received)
+            metrics.observe(
+                "update_latency", stats.handler, time.perf_counter() - started
+            )
+            metrics.count("db_queries", stats.handler, stats.db_queries)
+
+    def _join_lane(self, user_id: int) -> Lane:
+        previous = self._lanes.get(user_id)
+        done = asyncio.get_event_loop().create_future()
+        self._lanes[user_id] = done
+        return previous, done
+
+    def _release_lane(
+        self, user_id: int, previous: Optional[asyncio.Future], done: asyncio.Future
+    ):
+        if previous is None or previous.done():
+            self._leave_lane(user_id, done)
+        else:
+            # cancelled while waiting, next update still waits for previous
+            previous.add_done_callback(
+                lambda _previous: self._leave_lane(user_id, done)
+            )
+
+    def _leave_lane(self, user_id: int, done: asyncio.Future):
+        done.set_result(None)
+        if self._lanes.get(user_id) is done:
+            del self._lanes[user_id]
@@ -11,7 +11,16 @@ from app import config
 from app.misc import dp
 from app.models import db
 from app.models.user import User
-from app.utils import redis, scheduler
+from app.utils import (
+    fanout,
+    interaction,
+    redis,
+    reminder_wheel,
+    scheduler,
+    sleep_index,
+    user_cache,
+    wakeup_reminder,
+)
 
 runner = Executor(dp)
 
@@ -35,9 +44,19 @@ async def on_startup_notify(dispatcher: Dispatcher):
 
 def setup():
     logger.info("Configure executor...")
+    # shutdown callbacks run in order, jobs and reminder bursts
+    # are stopped before database and redis connections they use are closed
+    runner.on_shutdown(scheduler.on_shutdown)
+    runner.on_shutdown(wakeup_reminder.on_shutdown)
+    runner.on_shutdown(fanout.on_shutdown)
     db.setup(runner)
     redis.setup(runner)
+    user_cache.setup(runner)
     scheduler.setup(runner)
+    reminder_wheel.setup(runner)
+    wakeup_reminder.setup(runner)
+    sleep_index.setup(runner)
+    interaction.setup(runner)
     runner.on_startup(on_startup_webhook, webhook=True, polling=False)
     if config.SUPERUSER_STARTUP_NOTIFIER:
         runner.on_startup(on_startup_notify)
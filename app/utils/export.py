@@ -0,0 +1,112 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, Sequence
+
+from aiogram import types
+
+from app import config
+from app.models.db import db
+from app.models.sleep_record import SleepRecord
+
+FORMATS = ("csv", "json")
+COMPRESSION = "gz"
+COLUMNS = (
+    SleepRecord.id,
+    SleepRecord.created_at,
+    SleepRecord.wakeup_time,
+    SleepRecord.mood,
+    SleepRecord.emoji,
+    SleepRecord.note,
+)
+# telegram bot api upload limit
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+
+async def iterate_records(
+    user_id: int, chunk_size: int = config.EXPORT_CHUNK_SIZE
+) -> AsyncIterator[Sequence[tuple]]:
+    """
+    Chunks of user's sleep records read through a server-side cursor
+    """
+    query = (
+        db.select(list(COLUMNS))
+        .where(SleepRecord.user_id == user_id)
+        .order_by(SleepRecord.created_at)
+    )
+    async with db.transaction():
+        cursor = await db.iterate(query)
+        while True:
+            rows = await cursor.many(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+def _localize(value, tz):
+    if isinstance(value, datetime):
+        return datetime.astimezone(value, tz).isoformat()
+    return value
+
+
+def _csv_chunk(rows: Sequence[tuple], tz) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [[_localize(value, tz) for value in row] for row in rows]
+    )
+    return buffer.getvalue()
+
+
+def _json_chunk(rows: Sequence[tuple], tz) -> str:
+    names = [column.name for column in COLUMNS]
+    return "".join(
+        json.dumps(
+            {name: _localize(value, tz) for name, value in zip(names, row)},
+            ensure_ascii=False,
+        )
+        + "\n"
+        for row in rows
+    )
+
+
+async def write_export(
+    chunks: AsyncIterator[Sequence[tuple]], fmt: str, compress: bool, tz
+) -> SpooledTemporaryFile:
+    """
+    Write chunks as CSV or newline delimited JSON into a temporary file
+    which stays in memory while small, rewound and ready to be sent
+    """
+    spool = SpooledTemporaryFile(max_size=config.EXPORT_SPOOL_SIZE)
+    target = gzip.GzipFile(fileobj=spool, mode="wb") if compress else spool
+    render = _csv_chunk if fmt == "csv" else _json_chunk
+    if fmt == "csv":
+        target.write(_csv_chunk([[column.name for column in COLUMNS]], tz).encode())
+
+    async for rows in chunks:
+        target.write(render(rows, tz).encode())
+
+    if compress:
+        target.close()
+    spool.seek(0)
+    return spool
+
+
+def export_size(spool: SpooledTemporaryFile) -> int:
+    spool.seek(0, io.SEEK_END)
+    size = spool.tell()
+    spool.seek(0)
+    return size
+
+
+def export_filename(fmt: str, compress: bool) -> str:
+    extension = "csv" if fmt == "csv" else "ndjson"
+    return f"sleep_records.{extension}" + (f".{COMPRESSION}" if compress else "")
+
+
+def as_input_file(spool: SpooledTemporaryFile, filename: str) -> types.InputFile:
+    # SpooledTemporaryFile is not an io.IOBase until python 3.11,
+    # hand over the BytesIO or real file behind it instead
+    return types.InputFile(spool._file, filename=filename)
@@ -0,0 +1,415 @@
+import asyncio
+import json
+import math
+import time
+from collections import Counter, deque
+from contextlib import suppress
+from itertools import islice
+from typing import AsyncIterable, Dict, Iterable, Optional, Tuple, Union
+
+from aiohttp import ClientSession, web
+from loguru import logger
+
+from app.utils.metrics import Metrics
+
+BOT_USER = {
+    "id": 123456,
+    "is_bot": True,
+    "first_name": "Sleep tracker",
+    "username": "fake_sleep_tracker_bot",
+}
+# methods counted against message limits of telegram
+LIMITED_METHODS = {"sendMessage", "sendDocument", "editMessageText"}
+# messages to one chat going at once before chat_rate applies
+CHAT_BURST = 3
+# connections telegram opens to a webhook by default
+WEBHOOK_CONNECTIONS = 40
+
+Updates = Union[Iterable[dict], AsyncIterable[dict]]
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code: int, description: str, retry_after: Optional[int] = None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+    def as_json(self) -> dict:
+        body = {"ok": False, "error_code": self.code, "description": self.description}
+        if self.retry_after is not None:
+            body["parameters"] = {"retry_after": self.retry_after}
+        return body
+
+
+class RateLimit:
+    """
+    Token bucket refilled with rate tokens per second up to capacity
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait(self, now: float) -> float:
+        """
+        Seconds until a token is available
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self):
+        self.tokens -= 1
+
+
+class FakeBotAPI:
+    """
+    Stand-in for the Telegram Bot API to run the bot and its benchmarks
+    without network.
+
+    Messages are kept so edits and deletions of unknown ones fail like in
+    telegram, sending more than rate messages per second overall or
+    chat_rate per second to one chat is answered with 429 and retry_after.
+    Updates pushed are delivered to the webhook if the bot set one,
+    to getUpdates otherwise. Latency of every call is recorded in metrics,
+    latency seconds are added to each of them like for a distant server
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = 30,
+        chat_rate: Optional[float] = None,
+        latency: float = 0.0,
+    ):
+        # a second worth of messages may go at once
+        self.limit = RateLimit(rate, rate) if rate else None
+        self.chat_rate = chat_rate
+        self.chat_limits: Dict[int, RateLimit] = {}
+        self.latency = latency
+        self.methods = {
+            "getMe": self.get_me,
+            "getUpdates": self.get_updates,
+            "setWebhook": self.set_webhook,
+            "deleteWebhook": self.delete_webhook,
+            "getWebhookInfo": self.get_webhook_info,
+            "sendMessage": self.send_message,
+            "sendDocument": self.send_document,
+            "editMessageText": self.edit_message_text,
+            "deleteMessage": self.delete_message,
+            "answerCallbackQuery": self.answer_callback_query,
+        }
+
+        # text and keyboard of messages by chat and message id
+        self.messages: Dict[Tuple[int, int], Tuple[str, Optional[dict]]] = {}
+        self.last_message_ids: Counter = Counter()
+        self.updates = deque()
+        self.new_updates = asyncio.Event()
+        self.last_update_id = 0
+        self.webhook_url: Optional[str] = None
+        self.session: Optional[ClientSession] = None
+        self.runner: Optional[web.AppRunner] = None
+
+        self.metrics = Metrics()
+        self.calls: Counter = Counter()
+        self.sent = 0
+        self.too_many = 0
+        self.webhook_replies = 0
+        # arrival times of the last second, for the highest observed rate
+        self.window = deque()
+        self.max_per_second = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Serve in background, returns base url for TelegramAPIServer.from_base
+        """
+        self.runner = web.AppRunner(self.make_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def on_cleanup(self, app: web.Application):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        started = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = dict(await request.post())
+        try:
+            response = web.json_response(
+                {"ok": True, "result": await self.call(method, params)}
+            )
+        except FakeAPIError as e:
+            response = web.json_response(e.as_json(), status=e.code)
+        self.metrics.observe("bot_api_latency", method, time.perf_counter() - started)
+        return response
+
+    async def call(self, method: str, params: dict):
+        self.calls[method] += 1
+        handler = self.methods.get(method)
+        if handler is None:
+            raise FakeAPIError(404, "Not Found: method not found")
+        if method in LIMITED_METHODS:
+            self.check_limits(int(params["chat_id"]))
+        return await handler(params)
+
+    def check_limits(self, chat_id: int):
+        now = time.monotonic()
+        limits = []
+        if self.limit is not None:
+            limits.append(self.limit)
+        if self.chat_rate:
+            chat_limit = self.chat_limits.get(chat_id)
+            if chat_limit is None:
+                chat_limit = self.chat_limits[chat_id] = RateLimit(
+                    self.chat_rate, max(self.chat_rate, CHAT_BURST)
+                )
+            limits.append(chat_limit)
+        wait = max((limit.wait(now) for limit in limits), default=0)
+        if wait > 0:
+            self.too_many += 1
+            retry_after = max(1, math.ceil(wait))
+            raise FakeAPIError(
+                429, f"Too Many Requests: retry after {retry_after}", retry_after
+            )
+        for limit in limits:
+            limit.take()
+        while self.window and self.window[0] <= now - 1:
+            self.window.popleft()
+        self.window.append(now)
+        self.max_per_second = max(self.max_per_second, len(self.window))
+        self.sent += 1
+
+    def new_message(
+        self, chat_id: int, user: dict, text: str, reply_markup: Optional[dict] = None
+    ) -> dict:
+        self.last_message_ids[chat_id] += 1
+        message_id = self.last_message_ids[chat_id]
+        self.messages[chat_id, message_id] = (text, reply_markup)
+        return self.as_message(chat_id, message_id, user)
+
+    def as_message(self, chat_id: int, message_id: int, user: dict = BOT_USER):
+        text, reply_markup = self.messages[chat_id, message_id]
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": user,
+            "text": text,
+        }
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        return message
+
+    @staticmethod
+    def chat_user(chat_id: int) -> dict:
+        return {
+            "id": chat_id,
+            "is_bot": False,
+            "first_name": f"User {chat_id}",
+            "language_code": "en",
+        }
+
+    def next_update_id(self) -> int:
+        self.last_update_id += 1
+        return self.last_update_id
+
+    def message_update(self, chat_id: int, text: str) -> dict:
+        """
+        Update with a message user sends to the bot
+        """
+        message = self.new_message(chat_id, self.chat_user(chat_id), text)
+        return {"update_id": self.next_update_id(), "message": message}
+
+    def callback_update(self, chat_id: int, message_id: int, data: str) -> dict:
+        """
+        Update with a button of the bot message pressed by user
+        """
+        update_id = self.next_update_id()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self.chat_user(chat_id),
+                "message": self.as_message(chat_id, message_id),
+                "chat_instance": str(chat_id),
+                "data": data,
+            },
+        }
+
+    async def push(self, update: dict):
+        if self.webhook_url is None:
+            self.updates.append(update)
+            self.new_updates.set()
+            return
+        if self.session is None:
+            self.session = ClientSession()
+        with self.metrics.timer("webhook_latency", "update"):
+            async with self.session.post(self.webhook_url, json=update) as response:
+                body = None
+                if response.content_type == "application/json":
+                    body = await response.json()
+        if body and "method" in body:
+            # sent by telegram, errors are not reported to the bot
+            self.webhook_replies += 1
+            with suppress(FakeAPIError):
+                await self.call(body.pop("method"), body)
+
+    async def feed(self, updates: Updates, connections: int = WEBHOOK_CONNECTIONS):
+        """
+        Push updates from a generator, over at most that many
+        connections at once to a webhook
+        """
+        semaphore = asyncio.Semaphore(connections)
+        pushes = set()
+
+        async def push(update: dict):
+            try:
+                await self.push(update)
+            finally:
+                semaphore.release()
+
+        async def schedule(update: dict):
+            await semaphore.acquire()
+            task = asyncio.create_task(push(update))
+            pushes.add(task)
+            task.add_done_callback(pushes.discard)
+
+        if isinstance(updates, AsyncIterable):
+            async for update in updates:
+                await schedule(update)
+        else:
+            for update in updates:
+                await schedule(update)
+        if pushes:
+            await asyncio.gather(*pushes)
+
+    async def get_me(self, params: dict):
+        return BOT_USER
+
+    async def get_updates(self, params: dict):
+        if self.webhook_url is not None:
+            raise FakeAPIError(
+                409,
+                "Conflict: can't use getUpdates method while webhook is active; "
+                "use deleteWebhook to delete the webhook first",
+            )
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 100))
+        timeout = float(params.get("timeout", 0))
+        if offset < 0:
+            while len(self.updates) > -offset:
+                self.updates.popleft()
+        else:
+            # updates before offset are confirmed
+            while self.updates and self.updates[0]["update_id"] < offset:
+                self.updates.popleft()
+        if not self.updates and timeout:
+            self.new_updates.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+        return list(islice(self.updates, limit))
+
+    async def set_webhook(self, params: dict):
+        self.webhook_url = params.get("url") or None
+        return True
+
+    async def delete_webhook(self, params: dict):
+        self.webhook_url = None
+        if params.get("drop_pending_updates") in ("true", "True", True):
+            self.updates.clear()
+        return True
+
+    async def get_webhook_info(self, params: dict):
+        return {
+            "url": self.webhook_url or "",
+            "has_custom_certificate": False,
+            "pending_update_count": len(self.updates),
+        }
+
+    async def send_message(self, params: dict):
+        return self.new_message(
+            int(params["chat_id"]),
+            BOT_USER,
+            params["text"],
+            self.parse_markup(params.get("reply_markup")),
+        )
+
+    async def send_document(self, params: dict):
+        document = params["document"]
+        file_name, size = "document", 0
+        if isinstance(document, web.FileField):
+            file_name = document.filename
+            size = len(document.file.read())
+        message = self.new_message(
+            int(params["chat_id"]), BOT_USER, params.get("caption", "")
+        )
+        message["document"] = {
+            "file_id": f"file{message['message_id']}",
+            "file_unique_id": f"file{message['message_id']}",
+            "file_name": file_name,
+            "file_size": size,
+        }
+        return message
+
+    async def edit_message_text(self, params: dict):
+        key = int(params["chat_id"]), int(params["message_id"])
+        if key not in self.messages:
+            raise FakeAPIError(400, "Bad Request: message to edit not found")
+        edited = (params["text"], self.parse_markup(params.get("reply_markup")))
+        if self.messages[key] == edited:
+            raise FakeAPIError(
+                400,
+                "Bad Request: message is not modified: specified new message "
+                "content and reply markup are exactly the same as a current "
+                "content and reply markup of the message",
+            )
+        self.messages[key] = edited
+        return self.as_message(*key)
+
+    async def delete_message(self, params: dict):
+        key = int(params["chat_id"]), int(params["message_id"])
+        if self.messages.pop(key, None) is None:
+            raise FakeAPIError(400, "Bad Request: message to delete not found")
+        return True
+
+    async def answer_callback_query(self, params: dict):
+        return True
+
+    @staticmethod
+    def parse_markup(reply_markup: Union[str, dict, None]) -> Optional[dict]:
+        if isinstance(reply_markup, str):
+            return json.loads(reply_markup)
+        return reply_markup
+
+    def log(self):
+        logger.info(
+            "Fake Bot API: {calls} calls, {sent} messages, {too_many} answered "
+            "with 429, {replies} webhook replies, max {max} messages in a second",
+            calls=sum(self.calls.values()),
+            sent=self.sent,
+            too_many=self.too_many,
+            replies=self.webhook_replies,
+            max=self.max_per_second,
+        )
+        for line in self.metrics.summary():
+            logger.info(line)
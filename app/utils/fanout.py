@@ -0,0 +1,255 @@
+import asyncio
+import time
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.utils.exceptions import RetryAfter
+from loguru import logger
+
+from app import config
+from app.misc import bot
+from app.utils.claims import CLAIM_RENEW_INTERVAL
+from app.utils.metrics import metrics
+
+# chat id, text, send_message kwargs
+Message = Tuple[int, str, dict]
+# awaited with chat ids done since its previous call while a burst is sent
+Progress = Callable[[List[int]], Awaitable]
+
+# RetryAfter answers for one message before it is counted as failed
+MAX_RETRIES = 5
+
+
+class TokenBucket:
+    """
+    Allows rate acquisitions per second on average and up to capacity at once.
+    Waiters reserve tokens ahead, so they are served in order without polling
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._pauses = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            pauses = self._pauses
+            elapsed = now - self.updated
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                await asyncio.sleep(-self.tokens / self.rate)
+            # reservations made before a pause are void
+            if pauses == self._pauses:
+                return
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens for seconds, e.g. on RetryAfter
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+        self._pauses += 1
+
+
+@dataclass
+class BurstReport:
+    name: str
+    total: int
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    # seconds from due time to delivery of each sent message
+    latencies: List[float] = field(default_factory=list)
+    # chat ids of messages sent or given up on
+    done: List[int] = field(default_factory=list)
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(int(len(latencies) * q), len(latencies) - 1)]
+
+    def log(self):
+        logger.info(
+            "Burst {name}: {sent}/{total} sent, {failed} failed, {retried} retried, "
+            "latency p50 {p50:.2f}s, p95 {p95:.2f}s, max {max:.2f}s",
+            name=self.name,
+            sent=self.sent,
+            total=self.total,
+            failed=self.failed,
+            retried=self.retried,
+            p50=self.percentile(0.5),
+            p95=self.percentile(0.95),
+            max=self.percentile(1),
+        )
+
+
+class Fanout:
+    """
+    Sends bursts of messages through a shared rate limiter
+    with a bounded number of requests in flight
+    """
+
+    def __init__(self, bot: Bot, limiter: TokenBucket, concurrency: int):
+        self.bot = bot
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self._bursts: Set[asyncio.Task] = set()
+
+    def submit(
+        self,
+        name: str,
+        messages: List[Message],
+        due: Optional[float] = None,
+        on_sent: Optional[Callable[[BurstReport], Awaitable]] = None,
+        on_progress: Optional[Progress] = None,
+    ):
+        """
+        Send in background, so a long burst does not hold its caller,
+        on_sent is awaited with the report once the burst is over
+        """
+        task = asyncio.create_task(
+            self._send_submitted(name, messages, due, on_sent, on_progress)
+        )
+        self._bursts.add(task)
+        task.add_done_callback(self._bursts.discard)
+
+    async def _send_submitted(self, name, messages, due, on_sent, on_progress):
+        report = await self.send(name, messages, due, on_progress)
+        if on_sent is not None:
+            try:
+                await on_sent(report)
+            except Exception:
+                logger.exception("Failed to finish burst {name}", name=name)
+
+    async def join(self):
+        """
+        Wait for bursts submitted so far to be sent
+        """
+        await asyncio.gather(*self._bursts, return_exceptions=True)
+
+    async def close(self):
+        bursts = list(self._bursts)
+        for task in bursts:
+            task.cancel()
+        for task in bursts:
+            with suppress(asyncio.CancelledError):
+                await task
+
+    async def send(
+        self,
+        name: str,
+        messages: List[Message],
+        due: Optional[float] = None,
+        on_progress: Optional[Progress] = None,
+    ) -> BurstReport:
+        """
+        Deliver messages, latency is measured from due timestamp.
+        on_progress is awaited every CLAIM_RENEW_INTERVAL seconds
+        until the burst is over, the last time with the rest of chat ids
+        """
+        due = time.time() if due is None else due
+        report = BurstReport(name, total=len(messages))
+        if not messages:
+            return report
+        started = time.perf_counter()
+        queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait((message, 0))
+        workers = [
+            asyncio.create_task(self._worker(queue, report, due))
+            for _ in range(min(self.concurrency, len(messages)))
+        ]
+        joined = asyncio.create_task(queue.join())
+        reported = 0
+        try:
+            while not joined.done():
+                await asyncio.wait({joined}, timeout=CLAIM_RENEW_INTERVAL)
+                if on_progress is not None:
+                    reported = await self._report_progress(
+                        report, on_progress, reported
+                    )
+        finally:
+            joined.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        metrics.observe("reminder_burst_duration", name, time.perf_counter() - started)
+        report.log()
+        return report
+
+    @staticmethod
+    async def _report_progress(
+        report: BurstReport, on_progress: Progress, reported: int
+    ) -> int:
+        """
+        Pass chat ids done after the first reported ones to on_progress,
+        returns how many are reported now
+        """
+        done = report.done[reported:]
+        try:
+            await on_progress(done)
+        except Exception:
+            logger.exception(
+                "Failed to record progress of burst {name}", name=report.name
+            )
+            return reported
+        return reported + len(done)
+
+    async def _worker(self, queue: asyncio.Queue, report: BurstReport, due: float):
+        while True:
+            message, attempt = await queue.get()
+            chat_id, text, kwargs = message
+            try:
+                await self.limiter.acquire()
+                await self.bot.send_message(chat_id, text, **kwargs)
+            except RetryAfter as e:
+                self.limiter.pause(e.timeout)
+                metrics.count("reminder_retry_after", report.name)
+                if attempt < MAX_RETRIES:
+                    report.retried += 1
+                    queue.put_nowait((message, attempt + 1))
+                else:
+                    report.failed += 1
+                    report.done.append(chat_id)
+                    metrics.count("reminder_failed", report.name)
+                    logger.warning("Giving up on message to {chat}", chat=chat_id)
+            except Exception as e:
+                report.failed += 1
+                report.done.append(chat_id)
+                metrics.count("reminder_failed", report.name)
+                logger.warning(
+                    "Failed to send message to {chat}: {e}", chat=chat_id, e=e
+                )
+            else:
+                latency = time.time() - due
+                report.sent += 1
+                report.done.append(chat_id)
+                report.latencies.append(latency)
+                metrics.observe("reminder_delivery_lag", report.name, latency)
+            finally:
+                queue.task_done()
+
+
+fanout = Fanout(
+    bot,
+    TokenBucket(config.REMINDER_SEND_RATE, config.REMINDER_SEND_BURST),
+    config.REMINDER_SEND_CONCURRENCY,
+)
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    logger.info("Cancelling reminder bursts..")
+    await fanout.close()
@@ -0,0 +1,138 @@
+import asyncio
+from contextlib import suppress
+from typing import List, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.webhook import BaseResponse, SendMessage
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.exceptions import (
+    MessageCantBeDeleted,
+    MessageCantBeEdited,
+    MessageNotModified,
+    MessageToDeleteNotFound,
+    MessageToEditNotFound,
+)
+from aiogram.utils.executor import Executor
+
+from app import config
+from app.utils.datetime import VISUAL_GRACE_TIME
+from app.utils.metrics import metrics
+
+# keeps references to background deletions until they are done
+_cleanups: Set[asyncio.Task] = set()
+# set on startup in webhook mode
+webhook_replies = False
+
+
+class Reply:
+    """
+    What a handler answers with, sent in as few Bot API calls as possible:
+    text parts are joined into one message with the last keyboard added,
+    a message being replaced is edited in place and messages to clean up
+    are deleted in background after VISUAL_GRACE_TIME
+    """
+
+    def __init__(
+        self,
+        name: str,
+        chat_id: int,
+        edit_message_id: Optional[int] = None,
+        reply_to_message_id: Optional[int] = None,
+    ):
+        self.name = name
+        self.chat_id = chat_id
+        self.edit_message_id = edit_message_id
+        self.reply_to_message_id = reply_to_message_id
+        self.parts: List[str] = []
+        self.reply_markup: Optional[InlineKeyboardMarkup] = None
+        self.garbage: List[int] = []
+
+    def add(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        self.parts.append(text)
+        if reply_markup is not None:
+            self.reply_markup = reply_markup
+        return self
+
+    def delete(self, message_id: int):
+        self.garbage.append(message_id)
+        return self
+
+    async def send(self):
+        bot = Bot.get_current()
+        calls = len(self.garbage)
+        self._cleanup_later(bot)
+        if self.parts:
+            calls += await self._send(bot, "\n\n".join(self.parts))
+        metrics.count("interactions", self.name)
+        metrics.count("interaction_api_calls", self.name, calls)
+
+    async def respond(self) -> Optional[BaseResponse]:
+        """
+        In webhook mode new message is not sent but returned, the handler
+        returns it as the webhook response and Telegram sends it without
+        another request from the bot, deletions still go out as requests.
+        Edits are sent right away, they may have to fall back to a new message
+        """
+        if not webhook_replies or self.edit_message_id is not None or not self.parts:
+            await self.send()
+            return None
+        self._cleanup_later(Bot.get_current())
+        metrics.count("interactions", self.name)
+        metrics.count("interaction_api_calls", self.name, len(self.garbage))
+        metrics.count("interaction_webhook_replies", self.name)
+        return SendMessage(
+            self.chat_id,
+            "\n\n".join(self.parts),
+            reply_to_message_id=self.reply_to_message_id,
+            reply_markup=self.reply_markup,
+        )
+
+    async def _send(self, bot: Bot, text: str) -> int:
+        """
+        Send text, returns number of Bot API calls it took
+        """
+        if self.edit_message_id is not None:
+            try:
+                await bot.edit_message_text(
+                    text,
+                    self.chat_id,
+                    self.edit_message_id,
+                    reply_markup=self.reply_markup,
+                )
+                return 1
+            except MessageNotModified:
+                return 1
+            except (MessageCantBeEdited, MessageToEditNotFound):
+                await bot.send_message(
+                    self.chat_id, text, reply_markup=self.reply_markup
+                )
+                return 2
+        await bot.send_message(
+            self.chat_id,
+            text,
+            reply_to_message_id=self.reply_to_message_id,
+            reply_markup=self.reply_markup,
+        )
+        return 1
+
+    def _cleanup_later(self, bot: Bot):
+        if not self.garbage:
+            return
+        task = asyncio.create_task(self._cleanup(bot, self.garbage))
+        _cleanups.add(task)
+        task.add_done_callback(_cleanups.discard)
+
+    async def _cleanup(self, bot: Bot, message_ids: List[int]):
+        await asyncio.sleep(VISUAL_GRACE_TIME)
+        for message_id in message_ids:
+            with suppress(MessageCantBeDeleted, MessageToDeleteNotFound):
+                await bot.delete_message(self.chat_id, message_id)
+
+
+async def on_startup_webhook(dispatcher: Dispatcher):
+    global webhook_replies
+    webhook_replies = config.WEBHOOK_REPLIES
+
+
+def setup(executor: Executor):
+    executor.on_startup(on_startup_webhook, webhook=True, polling=False)
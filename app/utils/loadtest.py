@@ -0,0 +1,416 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.dispatcher.webhook import get_new_configured_app
+from aiohttp import web
+from loguru import logger
+
+from app import config
+from app.misc import bot, dp
+from app.models.db import db
+from app.models.user import User
+from app.utils import interaction
+from app.utils.executor import runner
+from app.utils.fake_bot_api import FakeBotAPI
+from app.utils.metrics import metrics
+from app.utils.sleep_tracker import cb_moods
+from app.utils.user_settings import cb_user_settings
+
+# the load test refuses to run against a database with users below that id,
+# so its users never collide with real ones; ids stay positive to be kept
+# in the sleep index like ids of real users, up to two million users
+LOADTEST_USER_ID = 2 ** 31 - 2_000_000
+DAY = 24 * 3600
+HOUR = 3600
+WEBHOOK_PATH = "/loadtest"
+# bot messages looked through for a button to press
+BUTTON_SEARCH_DEPTH = 10
+# seconds of simulated time between steps of a flow
+STEP_TIME = 20
+# seconds to wait for the bot to process the last updates
+DRAIN_TIMEOUT = 60
+# updates put into queue before letting the bot run
+REPLAY_CHUNK_SIZE = 1000
+
+SLEEP, WAKEUP, MOOD, STATS, SETTINGS, TIMEZONE_BUTTON, TIMEZONE = range(7)
+ACTIONS = ["-", "+", "mood", "stats", "/settings", "time zone button", "time zone"]
+STATS_COMMANDS = ["!", "!m", "! -1", "!m -1", "!m -2", "!y", "!all"]
+STATS_WEIGHTS = [0.45, 0.2, 0.1, 0.1, 0.05, 0.05, 0.05]
+# bot API methods the bot calls to receive updates, not to answer them
+SERVICE_METHODS = {
+    "getMe",
+    "getUpdates",
+    "setWebhook",
+    "deleteWebhook",
+    "getWebhookInfo",
+}
+
+
+class DatabaseInUseError(RuntimeError):
+    """database has users the load test did not create"""
+
+
+@dataclass
+class Profile:
+    """
+    Daily habits of simulated users, hours are of their local day
+    """
+
+    bedtime: float = 23.0
+    bedtime_spread: float = 1.0
+    sleep_hours: float = 7.5
+    sleep_spread: float = 1.0
+    mood_rate: float = 0.7
+    stats_per_day: float = 0.5
+    settings_rate: float = 0.02
+    timezones: List[str] = field(default_factory=lambda: ["+00:00", "+03:00"])
+
+
+@dataclass
+class Schedule:
+    """
+    Actions of simulated users sorted by seconds since start of the run
+    """
+
+    times: np.ndarray
+    users: np.ndarray
+    actions: np.ndarray
+
+    def __len__(self):
+        return len(self.times)
+
+
+def tz_hours(timezone: str) -> float:
+    hours, minutes = timezone[1:].split(":")
+    sign = -1 if timezone[0] == "-" else 1
+    return sign * (int(hours) + int(minutes) / 60)
+
+
+def make_schedule(
+    users: int, days: int, start_hour: float, profile: Profile, rng
+) -> Tuple[Schedule, np.ndarray]:
+    """
+    Returns schedule and index of timezone in profile.timezones of each user
+    """
+    zones = rng.integers(len(profile.timezones), size=users)
+    # local hour of each user at start of the run
+    local_start = start_hour + np.array([tz_hours(tz) for tz in profile.timezones])
+    start = local_start[zones] * HOUR
+    times, who, actions = [], [], []
+
+    def add(at: np.ndarray, users_at: np.ndarray, action: int):
+        times.append(at)
+        who.append(users_at)
+        actions.append(np.full(len(at), action, dtype=np.int8))
+
+    everyone = np.arange(users)
+    # night before the run ends within it
+    for day in range(-1, days + 1):
+        day_start = day * DAY - start
+        bedtime = day_start + HOUR * rng.normal(
+            profile.bedtime, profile.bedtime_spread, users
+        )
+        wakeup = bedtime + HOUR * np.clip(
+            rng.normal(profile.sleep_hours, profile.sleep_spread, users), 1, 16
+        )
+        add(bedtime, everyone, SLEEP)
+        add(wakeup, everyone, WAKEUP)
+        moody = rng.random(users) < profile.mood_rate
+        add(wakeup[moody] + rng.exponential(60, moody.sum()), everyone[moody], MOOD)
+
+        # stats and settings between waking up and going to bed
+        browsing = np.repeat(everyone, rng.poisson(profile.stats_per_day, users))
+        add(
+            wakeup[browsing] + rng.random(len(browsing)) * 12 * HOUR, browsing, STATS,
+        )
+        tuning = everyone[rng.random(users) < profile.settings_rate]
+        at = wakeup[tuning] + rng.random(len(tuning)) * 12 * HOUR
+        for step, action in enumerate([SETTINGS, TIMEZONE_BUTTON, TIMEZONE]):
+            add(at + step * STEP_TIME, tuning, action)
+
+    times = np.concatenate(times)
+    who = np.concatenate(who)
+    actions = np.concatenate(actions)
+    within = (times >= 0) & (times < days * DAY)
+    times, who, actions = times[within], who[within], actions[within]
+    order = np.argsort(times, kind="stable")
+    return Schedule(times[order], who[order], actions[order]), zones
+
+
+class Simulation:
+    """
+    Turns scheduled actions of users into updates of the fake Bot API,
+    pressing buttons of the messages the bot sent them
+    """
+
+    def __init__(self, api: FakeBotAPI, profile: Profile, rng):
+        self.api = api
+        self.profile = profile
+        self.rng = rng
+        self.pushed = 0
+        self.skipped: Dict[str, int] = {}
+
+    def find_button(
+        self, chat_id: int, matches: Callable[[str], bool]
+    ) -> Optional[Tuple[int, List[str]]]:
+        """
+        Latest bot message in chat with buttons matching, and their data
+        """
+        last = self.api.last_message_ids[chat_id]
+        for message_id in range(last, max(0, last - BUTTON_SEARCH_DEPTH), -1):
+            message = self.api.messages.get((chat_id, message_id))
+            if message is None or not message[1]:
+                continue
+            buttons = [
+                button.get("callback_data", "")
+                for row in message[1].get("inline_keyboard", [])
+                for button in row
+            ]
+            buttons = [data for data in buttons if matches(data)]
+            if buttons:
+                return message_id, buttons
+        return None
+
+    def make_update(self, user_id: int, action: int) -> Optional[dict]:
+        if action == SLEEP:
+            return self.api.message_update(user_id, "-")
+        if action == WAKEUP:
+            return self.api.message_update(user_id, "+")
+        if action == STATS:
+            text = self.rng.choice(STATS_COMMANDS, p=STATS_WEIGHTS)
+            return self.api.message_update(user_id, str(text))
+        if action == SETTINGS:
+            return self.api.message_update(user_id, "/settings")
+        if action == TIMEZONE:
+            timezone = self.rng.choice(self.profile.timezones)
+            return self.api.message_update(user_id, str(timezone))
+
+        if action == MOOD:
+            found = self.find_button(user_id, is_mood)
+        else:
+            data = cb_user_settings.new(property="time_zone", value="set")
+            found = self.find_button(user_id, data.__eq__)
+        if found is None:
+            return None
+        message_id, buttons = found
+        data = buttons[self.rng.integers(len(buttons))]
+        return self.api.callback_update(user_id, message_id, data)
+
+    async def replay(self, schedule: Schedule, day_seconds: float, updates):
+        """
+        Put updates into queue when they are due, a day passing in day_seconds
+        """
+        scale = day_seconds / DAY
+        started = time.monotonic()
+        index = 0
+        while index < len(schedule):
+            now = (time.monotonic() - started) / scale
+            due = int(np.searchsorted(schedule.times, now, side="right"))
+            if due == index:
+                await asyncio.sleep((schedule.times[index] - now) * scale)
+                continue
+            for user, action in zip(
+                schedule.users[index:due], schedule.actions[index:due]
+            ):
+                update = self.make_update(LOADTEST_USER_ID + int(user), int(action))
+                if update is None:
+                    name = ACTIONS[action]
+                    self.skipped[name] = self.skipped.get(name, 0) + 1
+                    continue
+                self.pushed += 1
+                await updates.put(update)
+                if self.pushed % REPLAY_CHUNK_SIZE == 0:
+                    await asyncio.sleep(0)
+            index = due
+        await updates.put(None)
+
+
+def is_mood(data: str) -> bool:
+    try:
+        cb_moods.parse(data)
+    except ValueError:
+        return False
+    return True
+
+
+async def queued(updates: asyncio.Queue):
+    while (update := await updates.get()) is not None:
+        yield update
+
+
+def processed() -> int:
+    return sum(
+        histogram.count
+        for (name, _label), histogram in metrics.histograms.items()
+        if name == "update_latency"
+    )
+
+
+async def seed_users(users: int, zones: np.ndarray, profile: Profile):
+    async with db.acquire() as conn:
+        await conn.raw_connection.copy_records_to_table(
+            User.__tablename__,
+            records=(
+                (LOADTEST_USER_ID + user, "en", profile.timezones[zone])
+                for user, zone in enumerate(zones.tolist())
+            ),
+            columns=["id", "language", "timezone"],
+        )
+
+
+async def count_other_users() -> int:
+    """
+    Users the load test did not create, it seeds and removes users
+    and runs scheduled jobs, so it only runs against a database without them
+    """
+    async with db.with_bind(config.POSTGRES_URI):
+        return await (
+            db.select([db.func.count()]).where(User.id < LOADTEST_USER_ID).gino.scalar()
+        )
+
+
+async def remove_users(users: int):
+    # sleep records, rollups and reminders go with their users
+    await User.delete.where(
+        User.id.between(LOADTEST_USER_ID, LOADTEST_USER_ID + users - 1)
+    ).gino.status()
+
+
+def report(
+    users: int, days: int, elapsed: float, api: FakeBotAPI, simulation: Simulation,
+) -> List[str]:
+    total = processed()
+    lines = [
+        f"{users} users, {days} days in {elapsed:.1f}s: {total}/{simulation.pushed} "
+        f"updates processed, {total / elapsed:.1f} updates/s",
+        "",
+        f"{'handler':<32}{'updates':>9}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'wait p95':>9}{'db/upd':>8}",
+    ]
+    for (name, handler), histogram in sorted(metrics.histograms.items()):
+        if name != "update_latency":
+            continue
+        wait = metrics.histograms["update_wait", handler]
+        queries = metrics.counters["db_queries", handler] / histogram.count
+        lines.append(
+            f"{handler:<32}{histogram.count:>9}"
+            f"{histogram.quantile(0.5) * 1000:>9.1f}"
+            f"{histogram.quantile(0.95) * 1000:>9.1f}"
+            f"{histogram.quantile(0.99) * 1000:>9.1f}"
+            f"{wait.quantile(0.95) * 1000:>9.1f}{queries:>8.2f}"
+        )
+    answers = sum(
+        count for method, count in api.calls.items() if method not in SERVICE_METHODS
+    )
+    lines.extend(
+        [
+            "",
+            f"Bot API calls per update: {answers / max(total, 1):.2f} "
+            f"({api.webhook_replies} of {answers} as webhook replies), "
+            f"{api.too_many} answered with 429, "
+            f"max {api.max_per_second} messages in a second",
+            f"DB queries in background: {metrics.counters['db_queries', 'background']}",
+        ]
+    )
+    if simulation.skipped:
+        skipped = ", ".join(f"{n} {a}" for a, n in simulation.skipped.items())
+        lines.append(f"Skipped, bot message with the button not found: {skipped}")
+    return lines
+
+
+async def drive(
+    api: FakeBotAPI,
+    users: int,
+    days: int,
+    day_seconds: float,
+    start_hour: float,
+    webhook: bool,
+    profile: Profile,
+    seed: int,
+) -> List[str]:
+    rng = np.random.default_rng(seed)
+    schedule, zones = make_schedule(users, days, start_hour, profile, rng)
+    logger.warning(
+        "Load test of {users} users: {count} updates in {seconds}s",
+        users=users,
+        count=len(schedule),
+        seconds=day_seconds * days,
+    )
+    # left by a run that did not finish
+    await remove_users(users)
+    await seed_users(users, zones, profile)
+    webhook_runner = None
+    try:
+        if webhook:
+            webhook_runner = web.AppRunner(
+                get_new_configured_app(dp, WEBHOOK_PATH), access_log=None
+            )
+            await webhook_runner.setup()
+            site = web.TCPSite(webhook_runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            interaction.webhook_replies = config.WEBHOOK_REPLIES
+            await bot.set_webhook(f"http://127.0.0.1:{port}{WEBHOOK_PATH}")
+            polling = None
+        else:
+            polling = asyncio.create_task(dp.start_polling(timeout=1))
+
+        simulation = Simulation(api, profile, rng)
+        updates = asyncio.Queue()
+        started = time.perf_counter()
+        feeding = asyncio.create_task(api.feed(queued(updates)))
+        await simulation.replay(schedule, day_seconds, updates)
+        await feeding
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while processed() < simulation.pushed and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - started
+        while interaction._cleanups:
+            await asyncio.gather(*interaction._cleanups)
+
+        if polling is not None:
+            dp.stop_polling()
+            await polling
+        return report(users, days, elapsed, api, simulation)
+    finally:
+        if webhook_runner is not None:
+            await webhook_runner.cleanup()
+        await remove_users(users)
+
+
+def run(
+    users: int,
+    days: int,
+    day_seconds: float,
+    start_hour: float,
+    webhook: bool,
+    profile: Profile,
+    seed: int,
+    rate: float,
+    chat_rate: float,
+    latency: float,
+) -> List[str]:
+    """
+    Run the bot against local postgres and redis with a fake Bot API,
+    replaying days of simulated users compressed to day_seconds each
+    """
+    others = runner.loop.run_until_complete(count_other_users())
+    if others:
+        raise DatabaseInUseError(
+            f"Database {config.POSTGRES_DB} has {others} users "
+            "the load test did not create, run it against an empty database"
+        )
+    api = FakeBotAPI(rate=rate, chat_rate=chat_rate, latency=latency)
+    bot.server = TelegramAPIServer.from_base(
+        runner.loop.run_until_complete(api.start())
+    )
+    try:
+        return runner.start(
+            drive(api, users, days, day_seconds, start_hour, webhook, profile, seed)
+        )
+    finally:
+        runner.loop.run_until_complete(api.stop())
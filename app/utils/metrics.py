@@ -0,0 +1,122 @@
+import bisect
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# upper bounds of histogram buckets in seconds, from a tenth of a millisecond
+# for job store operations up to half an hour for reminder bursts
+BUCKETS = (
+    0.0001,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1,
+    5,
+    10,
+    30,
+    60,
+    300,
+    600,
+    1800,
+    float("inf"),
+)
+
+
+class Histogram:
+    """
+    Counts of observed durations per bucket, quantiles are
+    reported as upper bounds of their buckets
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.sum / max(self.count, 1),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Histograms and counters of this process, labelled by e.g. reminder kind
+    """
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Counter = Counter()
+
+    def observe(self, name: str, label: str, value: float):
+        histogram = self.histograms.get((name, label))
+        if histogram is None:
+            histogram = self.histograms[name, label] = Histogram()
+        histogram.observe(value)
+
+    def count(self, name: str, label: str, value: int = 1):
+        self.counters[name, label] += value
+
+    @contextmanager
+    def timer(self, name: str, label: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label, time.perf_counter() - started)
+
+    def summary(self) -> List[str]:
+        lines = []
+        for (name, label), histogram in sorted(self.histograms.items()):
+            lines.append(
+                "{name}[{label}]: {count} observed, mean {mean:.3f}s, "
+                "p50 {p50:.3f}s, p95 {p95:.3f}s, p99 {p99:.3f}s, "
+                "max {max:.3f}s".format(name=name, label=label, **histogram.summary())
+            )
+        for (name, label), value in sorted(self.counters.items()):
+            lines.append(f"{name}[{label}]: {value}")
+        return lines
+
+
+@dataclass
+class UpdateStats:
+    """
+    Handler of the update being processed and database queries it took
+    """
+
+    handler: str = "unhandled"
+    db_queries: int = 0
+
+
+current_update: ContextVar[Optional[UpdateStats]] = ContextVar(
+    "current_update", default=None
+)
+metrics = Metrics()
@@ -42,17 +42,22 @@ class BaseRedis:
 storage = RedisStorage2(
     host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB
 )
+connector = BaseRedis(
+    host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB
+)
 
 
 async def on_startup(dispatcher: Dispatcher):
     logger.info("Setup Redis2 Storage")
     dispatcher.storage = storage
+    await connector.connect()
 
 
 async def on_shutdown(dispatcher: Dispatcher):
     logger.info("Close Redis Connection")
     await dispatcher.storage.close()
     await dispatcher.storage.wait_closed()
+    await connector.disconnect()
 
 
 def setup(executor: Executor):
@@ -0,0 +1,278 @@
+import time
+from datetime import timedelta
+from functools import partial
+from typing import Dict, List, Optional, Set
+
+import pendulum
+from aiogram import Dispatcher
+from aiogram.utils.executor import Executor
+from apscheduler.triggers.cron import CronTrigger
+from loguru import logger
+from sqlalchemy import and_, func
+from sqlalchemy.dialects.postgresql import insert
+
+from app import config
+from app.models.db import db
+from app.models.reminders import ReminderDelivery, ReminderMinute
+from app.models.user import User
+from app.utils import sleep_index
+from app.utils.bedtime_reminder import MINUTES_PER_DAY, bedtime_reminder_message
+from app.utils.claims import INSTANCE_ID, before_now, claim_lease
+from app.utils.fanout import BurstReport, fanout
+from app.utils.metrics import metrics
+
+TICK_JOB_ID = "reminder_wheel_tick"
+# minutes missed because of a restart or a slow tick are still sent,
+# same as misfire_grace_time of scheduler jobs
+MAX_CATCH_UP_MINUTES = 5
+# minutes claimed by a replica that died are sent by another one
+# if their claim expires within that time
+MAX_RECOVERY_TIME = timedelta(minutes=30)
+CLAIMS_KEPT = timedelta(days=1)
+
+
+def minute_at(minute: int) -> pendulum.DateTime:
+    return pendulum.from_timestamp(minute * 60)
+
+
+async def claim_minutes(
+    minutes: List[int], lease: Optional[timedelta] = None
+) -> List[int]:
+    """
+    Claim minutes no other replica claimed yet, along with minutes
+    whose claim expired before they were sent
+    """
+    lease = lease or claim_lease()
+    now = func.now()
+    expired = (
+        await db.select([ReminderMinute.minute_at])
+        .where(
+            and_(
+                ReminderMinute.done == False,  # noqa
+                ReminderMinute.claimed_until < now,
+                ReminderMinute.minute_at >= before_now(MAX_RECOVERY_TIME),
+            )
+        )
+        .gino.all()
+    )
+    candidates = {minute_at(minute) for minute in minutes}
+    candidates.update(row[0] for row in expired)
+    if not candidates:
+        return []
+    query = insert(ReminderMinute.__table__).values(
+        [
+            dict(
+                minute_at=candidate,
+                claimed_by=INSTANCE_ID,
+                claimed_until=now + lease,
+                done=False,
+            )
+            # same order in all replicas, so they do not deadlock
+            for candidate in sorted(candidates)
+        ]
+    )
+    # concurrent claims of a minute wait for each other on its primary key,
+    # only one of them inserts it or takes over an expired claim
+    query = query.on_conflict_do_update(
+        index_elements=[ReminderMinute.minute_at],
+        set_={
+            "claimed_by": query.excluded.claimed_by,
+            "claimed_until": query.excluded.claimed_until,
+        },
+        where=and_(
+            ReminderMinute.done == False, ReminderMinute.claimed_until < now,  # noqa
+        ),
+    ).returning(ReminderMinute.minute_at)
+    rows = await query.gino.all()
+    return sorted(int(row[0].timestamp()) // 60 for row in rows)
+
+
+async def extend_minutes(minutes: List[int], lease: timedelta):
+    await ReminderMinute.update.values(claimed_until=func.now() + lease).where(
+        and_(
+            ReminderMinute.minute_at.in_([minute_at(minute) for minute in minutes]),
+            ReminderMinute.claimed_by == INSTANCE_ID,
+        )
+    ).gino.status()
+
+
+async def delivered_users(minutes: List[int]) -> Set[int]:
+    """
+    Users already reminded in minutes, by a replica that claimed them before
+    """
+    rows = (
+        await db.select([ReminderDelivery.user_id])
+        .where(
+            ReminderDelivery.minute_at.in_([minute_at(minute) for minute in minutes])
+        )
+        .gino.all()
+    )
+    return {row[0] for row in rows}
+
+
+async def record_deliveries(
+    minutes: List[int], user_minutes: Dict[int, int], user_ids: List[int]
+):
+    """
+    Renew claims of minutes while their burst is sent
+    and record users it reached meanwhile
+    """
+    if user_ids:
+        await insert(ReminderDelivery.__table__).values(
+            [
+                dict(minute_at=minute_at(user_minutes[user_id]), user_id=user_id)
+                for user_id in user_ids
+            ]
+        ).on_conflict_do_nothing().gino.status()
+    await extend_minutes(minutes, claim_lease())
+
+
+async def record_minutes(minutes: List[int]):
+    """
+    Minutes sent by the only replica, so they are not sent again after a restart
+    """
+    now = func.now()
+    await insert(ReminderMinute.__table__).values(
+        [
+            dict(
+                minute_at=minute_at(minute),
+                claimed_by=INSTANCE_ID,
+                claimed_until=now,
+                done=True,
+            )
+            for minute in minutes
+        ]
+    ).on_conflict_do_nothing().gino.status()
+    await ReminderMinute.delete.where(
+        ReminderMinute.minute_at < before_now(CLAIMS_KEPT)
+    ).gino.status()
+
+
+async def last_claimed_minute(first: int, last: int) -> Optional[int]:
+    """
+    Latest minute from first to last claimed or sent by any replica
+    """
+    claimed = (
+        await db.select([func.max(ReminderMinute.minute_at)])
+        .where(ReminderMinute.minute_at.between(minute_at(first), minute_at(last)))
+        .gino.scalar()
+    )
+    return None if claimed is None else int(claimed.timestamp()) // 60
+
+
+async def finish_minutes(minutes: List[int], report: Optional[BurstReport] = None):
+    claimed = [minute_at(minute) for minute in minutes]
+    await ReminderMinute.update.values(done=True).where(
+        and_(
+            ReminderMinute.minute_at.in_(claimed),
+            ReminderMinute.claimed_by == INSTANCE_ID,
+        )
+    ).gino.status()
+    # done minutes are not taken over
+    await ReminderDelivery.delete.where(
+        ReminderDelivery.minute_at.in_(claimed)
+    ).gino.status()
+    await ReminderMinute.delete.where(
+        ReminderMinute.minute_at < before_now(CLAIMS_KEPT)
+    ).gino.status()
+
+
+class ReminderWheel:
+    """
+    Sends bedtime reminders of all users due in a minute with one query,
+    users are bucketed by User.reminder_minute
+    """
+
+    def __init__(self, catch_up: int = MAX_CATCH_UP_MINUTES):
+        self.catch_up = catch_up
+        # minutes since epoch
+        self.last_minute: Optional[int] = None
+
+    def due_minutes(self, now_minute: int) -> List[int]:
+        """
+        Minutes since epoch not processed yet
+        """
+        first = now_minute
+        if self.last_minute is not None:
+            first = max(self.last_minute + 1, now_minute - self.catch_up + 1)
+        return list(range(first, now_minute + 1))
+
+    async def restore_last_minute(self, now_minute: int) -> int:
+        """
+        Minutes missed while the bot was down are sent after a restart,
+        except ones claimed or sent before it
+        """
+        first = now_minute - self.catch_up
+        claimed = await last_claimed_minute(first + 1, now_minute)
+        return first if claimed is None else claimed
+
+    async def tick(self):
+        now_minute = int(time.time() // 60)
+        if self.last_minute is None:
+            self.last_minute = await self.restore_last_minute(now_minute)
+        minutes = self.due_minutes(now_minute)
+        # minutes past catch up are not sent
+        skipped = now_minute - self.last_minute - len(minutes)
+        if skipped > 0:
+            metrics.count("reminder_misfires", "bedtime", skipped)
+        self.last_minute = now_minute
+        if config.SCHEDULER_DISTRIBUTED:
+            minutes = await claim_minutes(minutes)
+        if minutes:
+            await self.remind(minutes)
+            if not config.SCHEDULER_DISTRIBUTED:
+                await record_minutes(minutes)
+
+    @staticmethod
+    async def remind(minutes: List[int]):
+        now = time.time()
+        for minute in minutes:
+            metrics.observe("reminder_fire_lag", "bedtime", now - minute * 60)
+        day_minutes = sorted({minute % MINUTES_PER_DAY for minute in minutes})
+        users = await User.query.where(User.reminder_minute.in_(day_minutes)).gino.all()
+        if config.SCHEDULER_DISTRIBUTED:
+            # minutes taken over from a replica that died are partly sent
+            delivered = await delivered_users(minutes)
+            users = [user for user in users if user.id not in delivered]
+        # only awake users are reminded to go to sleep
+        asleep = await sleep_index.asleep_users([user.id for user in users])
+        messages = [
+            bedtime_reminder_message(user) for user in users if user.id not in asleep
+        ]
+        logger.info(
+            "Sending {count} bedtime reminders for minutes {minutes}",
+            count=len(messages),
+            minutes=day_minutes,
+        )
+        on_sent = on_progress = None
+        if config.SCHEDULER_DISTRIBUTED:
+            by_day_minute = {minute % MINUTES_PER_DAY: minute for minute in minutes}
+            user_minutes = {
+                user.id: by_day_minute[user.reminder_minute] for user in users
+            }
+            on_progress = partial(record_deliveries, minutes, user_minutes)
+            on_sent = partial(finish_minutes, minutes)
+        # latency is counted from the first due minute
+        fanout.submit(
+            "bedtime",
+            messages,
+            due=minutes[0] * 60,
+            on_sent=on_sent,
+            on_progress=on_progress,
+        )
+
+
+wheel = ReminderWheel()
+
+
+async def on_startup(dispatcher: Dispatcher):
+    from app.utils.scheduler import scheduler
+
+    logger.info("Starting reminder wheel..")
+    scheduler.add_job(
+        wheel.tick, CronTrigger(second=0), id=TICK_JOB_ID, replace_existing=True,
+    )
+
+
+def setup(executor: Executor):
+    executor.on_startup(on_startup)
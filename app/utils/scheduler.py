@@ -1,37 +1,65 @@
-from typing import Union
+import time
+from datetime import datetime
+from typing import Dict, Tuple
 
-import pendulum
 from aiogram import Dispatcher
 from aiogram.utils.executor import Executor
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+    JobExecutionEvent,
+    JobSubmissionEvent,
+)
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
 from loguru import logger
 
-from app import config
-from app.models.reminders import BedtimeReminder, WakeupReminder
-from app.models.user import User
-from app.utils.bedtime_reminder import bedtime_reminder_func
-from app.utils.wakeup_reminder import wakeup_reminder_func
+from app.utils.metrics import metrics
 
+# reminders are sent by app.utils.reminder_wheel and app.utils.wakeup_reminder,
+# the few jobs left are added on startup, so they are only kept in memory
 scheduler = AsyncIOScheduler()
-JOBSTORE_DEFAULT = "default"
+# submission time of runs being executed, by job id and scheduled run time
+_running: Dict[Tuple[str, datetime], float] = {}
 
 
-async def execute_job_func(func, *args):
-    return await func(*args)
+def on_job_submitted(event: JobSubmissionEvent):
+    now = time.time()
+    if event.code == EVENT_JOB_MAX_INSTANCES:
+        metrics.count("scheduler_skipped", event.job_id)
+        return
+    for run_time in event.scheduled_run_times:
+        lag = max(now - run_time.timestamp(), 0)
+        metrics.observe("scheduler_fire_lag", event.job_id, lag)
+        _running[event.job_id, run_time] = now
+
+
+def on_job_done(event: JobExecutionEvent):
+    submitted = _running.pop((event.job_id, event.scheduled_run_time), None)
+    if event.code == EVENT_JOB_MISSED:
+        # run was later than misfire_grace_time and is dropped
+        metrics.count("scheduler_misfires", event.job_id)
+        return
+    if event.code == EVENT_JOB_ERROR:
+        metrics.count("scheduler_errors", event.job_id)
+    if submitted is not None:
+        duration = time.time() - submitted
+        metrics.observe("scheduler_job_duration", event.job_id, duration)
 
 
 async def on_startup(dispatcher: Dispatcher):
     logger.info("Configuring scheduler..")
-    jobstores = {JOBSTORE_DEFAULT: SQLAlchemyJobStore(url=config.POSTGRES_URI)}
     job_defaults = {"misfire_grace_time": 300}
-    scheduler.configure(
-        jobstores=jobstores, job_defaults=job_defaults,
+    scheduler.configure(job_defaults=job_defaults)
+    scheduler.add_listener(
+        on_job_submitted, EVENT_JOB_SUBMITTED | EVENT_JOB_MAX_INSTANCES
     )
-    scheduler.start(paused=True)
-    await update_jobs_callables(scheduler, JOBSTORE_DEFAULT)
-    scheduler.resume()
+    scheduler.add_listener(
+        on_job_done, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED
+    )
+    scheduler.start()
 
 
 async def on_shutdown(dispatcher: Dispatcher):
@@ -40,45 +68,5 @@ async def on_shutdown(dispatcher: Dispatcher):
 
 
 def setup(executor: Executor):
+    # on_shutdown is registered by executor before connections it needs
     executor.on_startup(on_startup)
-    executor.on_shutdown(on_shutdown)
-
-
-async def update_jobs_callables(s: AsyncIOScheduler, jobstore):
-    logger.info("Migrating jobs for scheduler")
-    for reminder in await BedtimeReminder.query.gino.all():
-        user: User = await User.get(reminder.user_id)
-        s.modify_job(
-            reminder.job_id,
-            jobstore,
-            func=execute_job_func,
-            args=(bedtime_reminder_func, user),
-        )
-    for reminder in await WakeupReminder.query.gino.all():
-        user: User = await User.get(reminder.user_id)
-        s.modify_job(
-            reminder.job_id,
-            jobstore,
-            func=execute_job_func,
-            args=(wakeup_reminder_func, user),
-        )
-
-
-async def schedule_job(
-    job_id: Union[str, None],
-    reminder_cls: Union[type(BedtimeReminder), type(WakeupReminder)],
-    time,
-    func,
-    user,
-):
-    trigger = CronTrigger(hour=time.hour, minute=time.minute,)
-    if job_id:
-        scheduler.reschedule_job(
-            job_id, JOBSTORE_DEFAULT, trigger,
-        )
-        await reminder_cls.update.values(updated_at=pendulum.now()).where(
-            reminder_cls.job_id == job_id
-        ).gino.status()
-    else:
-        job = scheduler.add_job(execute_job_func, trigger, args=(func, user))
-        await reminder_cls.create(job_id=job.id, user_id=user.id)
@@ -0,0 +1,192 @@
+import csv
+import gzip
+import io
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import chain
+from operator import itemgetter
+from typing import IO, Awaitable, Callable, Iterator, List, Optional, Tuple
+
+from app import config
+from app.models.db import db
+
+COLUMNS = ("created_at", "wakeup_time", "mood", "emoji", "note")
+STAGING_TABLE = "sleep_records_import"
+GZIP_MAGIC = b"\x1f\x8b"
+# telegram bot api download limit
+MAX_DOCUMENT_SIZE = 20 * 1024 * 1024
+
+CREATE_STAGING_SQL = f"""
+CREATE TEMP TABLE {STAGING_TABLE} (
+    created_at timestamptz NOT NULL,
+    wakeup_time timestamptz NOT NULL,
+    mood varchar,
+    emoji varchar,
+    note varchar
+) ON COMMIT DROP
+"""
+MERGE_SQL = f"""
+WITH inserted AS (
+    INSERT INTO sleep_records (user_id, created_at, wakeup_time, mood, emoji, note)
+    SELECT DISTINCT ON (s.created_at)
+           :user_id, s.created_at, s.wakeup_time, s.mood, s.emoji, s.note
+    FROM {STAGING_TABLE} s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM sleep_records r
+        WHERE r.user_id = :user_id AND r.created_at = s.created_at
+    )
+    ORDER BY s.created_at
+    RETURNING 1
+)
+SELECT count(*) FROM inserted
+"""
+DROP_STAGING_SQL = f"DROP TABLE {STAGING_TABLE}"
+
+Row = Tuple[datetime, datetime, Optional[str], Optional[str], Optional[str]]
+RawRow = Tuple[Optional[str], ...]
+
+
+@dataclass
+class ImportStats:
+    parsed: int = 0
+    skipped: int = 0
+    loaded: int = 0
+    inserted: int = 0
+
+    @property
+    def duplicates(self) -> int:
+        return self.loaded - self.inserted
+
+
+def open_document(fileobj: IO[bytes]) -> IO[str]:
+    """
+    Text stream over uploaded file, gzip is detected by its magic bytes
+    """
+    compressed = fileobj.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    fileobj.seek(0)
+    if compressed:
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode="rb")
+    return io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+
+
+def offset_suffix(offset: int) -> str:
+    sign = "-" if offset < 0 else "+"
+    hours, minutes = divmod(abs(offset) // 60, 60)
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+
+def parse_timestamp(value: str, default_offset: str) -> datetime:
+    """
+    ISO 8601 timestamp, naive ones are in user's time zone
+    """
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        value = value.strip()
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        # parsing again is cheaper than datetime.replace(tzinfo=...)
+        dt = datetime.fromisoformat(value + default_offset)
+    return dt
+
+
+def parse_row(values: RawRow, default_offset: str, now: datetime) -> Optional[Row]:
+    if values is None:
+        return None
+    created_at, wakeup_time, mood, emoji, note = values
+    try:
+        created_at = parse_timestamp(created_at, default_offset)
+        wakeup_time = parse_timestamp(wakeup_time, default_offset)
+    except (TypeError, ValueError, AttributeError):
+        return None
+    if not created_at < wakeup_time <= now:
+        return None
+    return created_at, wakeup_time, mood or None, emoji or None, note or None
+
+
+def _json_lines(lines: Iterator[str]) -> Iterator[Optional[RawRow]]:
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = None
+        if isinstance(item, dict):
+            yield tuple(item.get(column) for column in COLUMNS)
+        else:
+            yield None
+
+
+def _csv_lines(header: List[str], reader: Iterator[List[str]]) -> Iterator[RawRow]:
+    # missing optional columns point to the empty value appended to each row
+    get_columns = itemgetter(
+        *[header.index(column) if column in header else -1 for column in COLUMNS]
+    )
+    for values in reader:
+        if len(values) != len(header):
+            yield None
+            continue
+        values.append("")
+        yield get_columns(values)
+
+
+def iterate_documents(stream: IO[str]) -> Iterator[Optional[RawRow]]:
+    """
+    Values of COLUMNS from CSV with header or newline delimited JSON,
+    as written by /export, None for malformed rows
+    """
+    first_line = stream.readline()
+    if first_line.lstrip().startswith("{"):
+        yield from _json_lines(chain([first_line], stream))
+        return
+    header = next(csv.reader([first_line]), [])
+    yield from _csv_lines(header, csv.reader(stream))
+
+
+def iterate_rows(stream: IO[str], tz) -> Iterator[Optional[Row]]:
+    default_offset = offset_suffix(tz.offset)
+    now = datetime.now(timezone.utc)
+    for values in iterate_documents(stream):
+        yield parse_row(values, default_offset, now)
+
+
+async def import_records(
+    user_id: int,
+    rows: Iterator[Optional[Row]],
+    progress: Callable[[ImportStats], Awaitable],
+    chunk_size: int = config.IMPORT_CHUNK_SIZE,
+) -> ImportStats:
+    """
+    COPY valid rows into temporary staging table in chunks and merge them
+    into sleep_records with one statement skipping already known records
+    """
+    stats = ImportStats()
+    async with db.transaction() as tx:
+        conn = tx.connection.raw_connection
+        await conn.execute(CREATE_STAGING_SQL)
+        chunk: List[Row] = []
+        for row in rows:
+            stats.parsed += 1
+            if row is None:
+                stats.skipped += 1
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                await _copy(conn, chunk, stats)
+                await progress(stats)
+                chunk = []
+        if chunk:
+            await _copy(conn, chunk, stats)
+        await progress(stats)
+        stats.inserted = await db.scalar(db.text(MERGE_SQL), user_id=user_id)
+        await conn.execute(DROP_STAGING_SQL)
+    return stats
+
+
+async def _copy(conn, chunk: List[Row], stats: ImportStats):
+    await conn.copy_records_to_table(STAGING_TABLE, records=chunk, columns=COLUMNS)
+    stats.loaded += len(chunk)
@@ -0,0 +1,238 @@
+from typing import List, Optional, Set
+
+from aiogram import Dispatcher
+from aiogram.utils.executor import Executor
+from apscheduler.triggers.interval import IntervalTrigger
+from loguru import logger
+from sqlalchemy import and_
+
+from app import config
+from app.models.db import db
+from app.models.sleep_record import SleepRecord
+from app.utils import redis
+from app.utils.claims import INSTANCE_ID
+
+ASLEEP_KEY = "sleep_records:asleep"
+ASLEEP_REBUILD_KEY = "sleep_records:asleep:rebuild"
+READY_KEY = "sleep_records:asleep:ready"
+# held by the replica rebuilding the index, marks are recorded meanwhile
+REBUILD_LOCK_KEY = "sleep_records:asleep:rebuilding"
+# user id -> bit of users marked while the index is rebuilt
+REBUILD_MARKS_KEY = "sleep_records:asleep:marks"
+# claimed by the replica reconciling the index in the current interval
+RECONCILED_KEY = "sleep_records:asleep:reconciled"
+# rebuilds taking longer are abandoned
+REBUILD_TIMEOUT = 600
+# redis bitmaps are limited to 2^32 bits
+MAX_OFFSET = 2 ** 32 - 1
+REBUILD_CHUNK_SIZE = 10000
+# asyncpg allows at most 32767 query arguments
+QUERY_CHUNK_SIZE = 10000
+RECONCILE_JOB_ID = "sleep_index_reconcile"
+
+# KEYS: index, rebuild lock, rebuild marks; ARGV: user id, bit
+MARK_SCRIPT = """
+redis.call("SETBIT", KEYS[1], ARGV[1], ARGV[2])
+if redis.call("EXISTS", KEYS[2]) == 1 then
+    redis.call("HSET", KEYS[3], ARGV[1], ARGV[2])
+end
+"""
+# KEYS: rebuilt index, index, rebuild marks, rebuild lock, ready flag;
+# ARGV: instance id holding the lock
+SWAP_SCRIPT = """
+if redis.call("GET", KEYS[4]) ~= ARGV[1] then
+    return 0
+end
+local marks = redis.call("HGETALL", KEYS[3])
+for i = 1, #marks, 2 do
+    redis.call("SETBIT", KEYS[1], marks[i], marks[i + 1])
+end
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    redis.call("RENAME", KEYS[1], KEYS[2])
+else
+    redis.call("DEL", KEYS[2])
+end
+redis.call("DEL", KEYS[3], KEYS[4])
+redis.call("SET", KEYS[5], 1)
+return 1
+"""
+
+
+def _indexable(user_id: int) -> bool:
+    return 0 <= user_id <= MAX_OFFSET
+
+
+async def is_asleep(user_id: int) -> Optional[bool]:
+    """
+    Look user up in "currently asleep" bitmap,
+    None means index is not available and caller should ask DB
+    """
+    if not _indexable(user_id):
+        return None
+    try:
+        pipe = redis.connector.redis.pipeline()
+        pipe.exists(READY_KEY)
+        pipe.getbit(ASLEEP_KEY, user_id)
+        ready, bit = await pipe.execute()
+    except Exception as e:
+        logger.warning("Sleep index lookup failed: {e}", e=e)
+        return None
+    if not ready:
+        return None
+    return bool(bit)
+
+
+async def asleep_users(user_ids: List[int]) -> Set[int]:
+    """
+    Users among user_ids who are asleep, with one index lookup
+    or falling back to a query per QUERY_CHUNK_SIZE users
+    """
+    if all(map(_indexable, user_ids)):
+        try:
+            pipe = redis.connector.redis.pipeline()
+            pipe.exists(READY_KEY)
+            for user_id in user_ids:
+                pipe.getbit(ASLEEP_KEY, user_id)
+            ready, *bits = await pipe.execute()
+        except Exception as e:
+            logger.warning("Sleep index lookup failed: {e}", e=e)
+            ready = False
+        if ready:
+            return {user_id for user_id, bit in zip(user_ids, bits) if bit}
+    asleep = set()
+    for start in range(0, len(user_ids), QUERY_CHUNK_SIZE):
+        end = start + QUERY_CHUNK_SIZE
+        rows = (
+            await db.select([SleepRecord.user_id])
+            .where(
+                and_(
+                    SleepRecord.user_id.in_(user_ids[start:end]),
+                    SleepRecord.wakeup_time == None,  # noqa
+                )
+            )
+            .gino.all()
+        )
+        asleep.update(row[0] for row in rows)
+    return asleep
+
+
+async def _set(user_id: int, value: int):
+    if not _indexable(user_id):
+        return
+    try:
+        await redis.connector.redis.eval(
+            MARK_SCRIPT,
+            keys=[ASLEEP_KEY, REBUILD_LOCK_KEY, REBUILD_MARKS_KEY],
+            args=[user_id, value],
+        )
+    except Exception as e:
+        logger.warning("Sleep index update failed, dropping index: {e}", e=e)
+        await _drop_ready()
+
+
+async def _drop_ready():
+    try:
+        await redis.connector.redis.delete(READY_KEY)
+    except Exception as e:
+        logger.warning("Failed to mark sleep index as stale: {e}", e=e)
+
+
+async def mark_asleep(user_id: int):
+    await _set(user_id, 1)
+
+
+async def mark_awake(user_id: int):
+    await _set(user_id, 0)
+
+
+async def rebuild() -> bool:
+    """
+    Rebuild bitmap from open sleep records and atomically swap it in.
+
+    Users marked after open sleep records are read are recorded while
+    the rebuild lock is held and replayed onto the new bitmap on swap,
+    so the swap does not overwrite them. Returns False if another replica
+    holds the lock
+    """
+    conn = redis.connector.redis
+    locked = await conn.set(
+        REBUILD_LOCK_KEY,
+        INSTANCE_ID,
+        expire=REBUILD_TIMEOUT,
+        exist=conn.SET_IF_NOT_EXIST,
+    )
+    if not locked:
+        logger.info("Sleep index is being rebuilt by another replica")
+        return False
+    try:
+        # marks recorded before this are already in the database
+        await conn.delete(ASLEEP_REBUILD_KEY, REBUILD_MARKS_KEY)
+        rows = (
+            await db.select([SleepRecord.user_id])
+            .where(SleepRecord.wakeup_time == None)  # noqa
+            .distinct()
+            .gino.all()
+        )
+        user_ids = [row[0] for row in rows if _indexable(row[0])]
+        for start in range(0, len(user_ids), REBUILD_CHUNK_SIZE):
+            end = start + REBUILD_CHUNK_SIZE
+            pipe = conn.pipeline()
+            for user_id in user_ids[start:end]:
+                pipe.setbit(ASLEEP_REBUILD_KEY, user_id, 1)
+            await pipe.execute()
+    except Exception:
+        await conn.delete(REBUILD_LOCK_KEY)
+        raise
+
+    swapped = await conn.eval(
+        SWAP_SCRIPT,
+        keys=[
+            ASLEEP_REBUILD_KEY,
+            ASLEEP_KEY,
+            REBUILD_MARKS_KEY,
+            REBUILD_LOCK_KEY,
+            READY_KEY,
+        ],
+        args=[INSTANCE_ID],
+    )
+    if not swapped:
+        logger.warning(
+            "Sleep index rebuild took over {timeout}s, abandoned",
+            timeout=REBUILD_TIMEOUT,
+        )
+        return False
+    logger.info("Sleep index rebuilt, {count} users asleep", count=len(user_ids))
+    return True
+
+
+async def reconcile():
+    """
+    Rebuild index on the first replica claiming the current interval
+    """
+    conn = redis.connector.redis
+    claimed = await conn.set(
+        RECONCILED_KEY,
+        INSTANCE_ID,
+        expire=config.SLEEP_INDEX_RECONCILE_MINUTES * 60,
+        exist=conn.SET_IF_NOT_EXIST,
+    )
+    if claimed:
+        await rebuild()
+
+
+async def on_startup(dispatcher: Dispatcher):
+    logger.info("Rebuilding sleep index..")
+    await rebuild()
+
+    from app.utils.scheduler import scheduler
+
+    scheduler.add_job(
+        reconcile,
+        IntervalTrigger(minutes=config.SLEEP_INDEX_RECONCILE_MINUTES),
+        id=RECONCILE_JOB_ID,
+        replace_existing=True,
+    )
+
+
+def setup(executor: Executor):
+    executor.on_startup(on_startup)
@@ -0,0 +1,139 @@
+import asyncio
+from datetime import date
+from typing import List, Optional
+
+from loguru import logger
+from pendulum import Duration
+from sqlalchemy import and_
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models.db import db
+from app.models.sleep_record import SleepRecord
+from app.models.sleep_stats import SleepDailyStats, SleepMonthlyStats
+from app.models.user import User
+from app.utils.datetime import latenight_offset
+from app.utils.sleep_tracker import get_sleep_days
+
+DELETE_DAILY_SQL = "DELETE FROM sleep_daily_stats WHERE user_id = ANY(:user_ids)"
+DELETE_MONTHLY_SQL = "DELETE FROM sleep_monthly_stats WHERE user_id = ANY(:user_ids)"
+REBUILD_DAILY_SQL = f"""
+INSERT INTO sleep_daily_stats (user_id, day, total_seconds, records)
+SELECT r.user_id,
+       (r.created_at AT TIME ZONE 'UTC' + u.timezone::interval
+        - interval '{latenight_offset.in_seconds()} seconds')::date,
+       sum(floor(extract(epoch FROM r.wakeup_time - r.created_at))),
+       count(*)
+FROM sleep_records r
+JOIN users u ON u.id = r.user_id
+WHERE r.user_id = ANY(:user_ids) AND r.wakeup_time IS NOT NULL
+GROUP BY 1, 2
+"""
+REBUILD_MONTHLY_SQL = """
+INSERT INTO sleep_monthly_stats (user_id, month, total_seconds, days, records)
+SELECT user_id, date_trunc('month', day)::date, sum(total_seconds), count(*),
+       sum(records)
+FROM sleep_daily_stats
+WHERE user_id = ANY(:user_ids)
+GROUP BY 1, 2
+"""
+
+
+async def add_sleep_record(record: SleepRecord, tz):
+    """
+    Account closed sleep record in daily and monthly rollups
+    """
+    ((day, seconds),) = get_sleep_days([record], tz).pairs()
+    # whole seconds of each record, same as REBUILD_DAILY_SQL sums
+    seconds = int(seconds)
+
+    daily = insert(SleepDailyStats.__table__).values(
+        user_id=record.user_id, day=day, total_seconds=seconds, records=1
+    )
+    daily = daily.on_conflict_do_update(
+        index_elements=[SleepDailyStats.user_id, SleepDailyStats.day],
+        set_={
+            "total_seconds": SleepDailyStats.total_seconds
+            + daily.excluded.total_seconds,
+            "records": SleepDailyStats.records + 1,
+            "updated_at": db.func.now(),
+        },
+    ).returning(SleepDailyStats.records)
+
+    async with db.transaction():
+        day_records = await daily.gino.scalar()
+        new_day = int(day_records == 1)
+        monthly = insert(SleepMonthlyStats.__table__).values(
+            user_id=record.user_id,
+            month=day.replace(day=1),
+            total_seconds=seconds,
+            days=new_day,
+            records=1,
+        )
+        monthly = monthly.on_conflict_do_update(
+            index_elements=[SleepMonthlyStats.user_id, SleepMonthlyStats.month],
+            set_={
+                "total_seconds": SleepMonthlyStats.total_seconds
+                + monthly.excluded.total_seconds,
+                "days": SleepMonthlyStats.days + monthly.excluded.days,
+                "records": SleepMonthlyStats.records + 1,
+                "updated_at": db.func.now(),
+            },
+        )
+        await monthly.gino.status()
+
+
+async def get_monthly_stats(
+    user_id: int, start: Optional[date] = None, end: Optional[date] = None
+) -> List[SleepMonthlyStats]:
+    conditions = [SleepMonthlyStats.user_id == user_id]
+    if start:
+        conditions.append(SleepMonthlyStats.month >= start)
+    if end:
+        conditions.append(SleepMonthlyStats.month < end)
+    return (
+        await SleepMonthlyStats.query.where(and_(*conditions))
+        .order_by(SleepMonthlyStats.month)
+        .gino.all()
+    )
+
+
+def rollup_average(total_seconds: int, days: int) -> Duration:
+    return Duration(seconds=total_seconds / max(days, 1))
+
+
+async def rebuild(user_ids: List[int]):
+    """
+    Recompute rollups of given users from their sleep records
+    """
+    async with db.transaction():
+        await db.status(db.text(DELETE_DAILY_SQL), user_ids=user_ids)
+        await db.status(db.text(DELETE_MONTHLY_SQL), user_ids=user_ids)
+        await db.status(db.text(REBUILD_DAILY_SQL), user_ids=user_ids)
+        await db.status(db.text(REBUILD_MONTHLY_SQL), user_ids=user_ids)
+
+
+async def backfill(batch_size: int, concurrency: int):
+    """
+    Rebuild rollups of all users in parallel batches
+    """
+    rows = await db.select([User.id]).order_by(User.id).gino.all()
+    user_ids = [row[0] for row in rows]
+    batches = []
+    for start in range(0, len(user_ids), batch_size):
+        end = start + batch_size
+        batches.append(user_ids[start:end])
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def worker(batch: List[int]):
+        nonlocal done
+        async with semaphore:
+            await rebuild(batch)
+            done += len(batch)
+            logger.info(
+                "Rebuilt rollups for {done}/{total} users",
+                done=done,
+                total=len(user_ids),
+            )
+
+    await asyncio.gather(*(worker(batch) for batch in batches))
@@ -0,0 +1,140 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from app.utils.datetime import latenight_offset
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+EPOCH_ORDINAL = EPOCH.toordinal()
+MICROSECOND = timedelta(microseconds=1)
+SECOND = 10 ** 6
+DAY = 86400 * SECOND
+
+Offset = Union[int, np.ndarray]
+
+
+def to_epoch(dt: datetime) -> int:
+    """
+    Microseconds since epoch, exact for aware datetimes
+    """
+    # plain datetime arithmetic, pendulum's overloaded __sub__ is much slower
+    return datetime.__sub__(dt, EPOCH) // MICROSECOND
+
+
+def records_to_arrays(records) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Start and end epochs of closed sleep records as int64 arrays
+    """
+    count = len(records)
+    start = np.fromiter(
+        (to_epoch(record.created_at) for record in records), np.int64, count
+    )
+    end = np.fromiter(
+        (to_epoch(record.wakeup_time) for record in records), np.int64, count
+    )
+    return start, end
+
+
+def local_days(start: np.ndarray, utc_offset: Offset) -> np.ndarray:
+    """
+    Day numbers since epoch the sleep belongs to in user's time zone,
+    utc_offset in seconds is either scalar or per record array
+    """
+    shift = (np.asarray(utc_offset, np.int64) - latenight_offset.in_seconds()) * SECOND
+    return (start + shift) // DAY
+
+
+def local_day(dt: datetime, utc_offset: int) -> int:
+    return int(local_days(np.int64(to_epoch(dt)), utc_offset))
+
+
+def day_to_date(day: int) -> date:
+    return date.fromordinal(EPOCH_ORDINAL + int(day))
+
+
+def date_to_day(value: date) -> int:
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+@dataclass
+class SleepDays:
+    """
+    Local day and sleep duration (microseconds) of each record
+    """
+
+    days: np.ndarray
+    durations: np.ndarray
+
+    @classmethod
+    def from_arrays(cls, start: np.ndarray, end: np.ndarray, utc_offset: Offset):
+        return cls(local_days(start, utc_offset), end - start)
+
+    @classmethod
+    def from_daily(cls, days: List[date], total_seconds: List[int]):
+        """
+        Per-day totals aggregated elsewhere, one entry per day
+        """
+        return cls(
+            np.fromiter(map(date_to_day, days), np.int64, len(days)),
+            np.asarray(total_seconds, np.int64).reshape(-1) * SECOND,
+        )
+
+    def __len__(self):
+        return len(self.days)
+
+    def __getitem__(self, item: slice) -> "SleepDays":
+        return SleepDays(self.days[item], self.durations[item])
+
+    def between(self, start_day: int, end_day: int) -> "SleepDays":
+        """
+        Entries of local days in [start_day, end_day)
+        """
+        mask = (self.days >= start_day) & (self.days < end_day)
+        return SleepDays(self.days[mask], self.durations[mask])
+
+    def daily_totals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distinct days and whole seconds slept on each of them
+        """
+        days, inverse = np.unique(self.days, return_inverse=True)
+        totals = np.zeros(len(days), np.int64)
+        np.add.at(totals, inverse, self.durations)
+        return days, totals // SECOND
+
+    def average(self) -> float:
+        """
+        Average seconds slept per day with any sleep recorded
+        """
+        _, totals = self.daily_totals()
+        totals = totals[totals > 0]
+        return int(totals.sum()) / max(len(totals), 1)
+
+    def pairs(self) -> List[Tuple[date, float]]:
+        return [
+            (day_to_date(day), duration / SECOND)
+            for day, duration in zip(self.days.tolist(), self.durations.tolist())
+        ]
+
+
+def average_by_user(
+    user_ids: np.ndarray, start: np.ndarray, end: np.ndarray, utc_offset: Offset
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Average seconds slept per day for many users at once,
+    returns distinct user ids and their averages
+    """
+    days = local_days(start, utc_offset)
+    keys = np.stack([user_ids.astype(np.int64), days], axis=1)
+    keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    totals = np.zeros(len(keys), np.int64)
+    np.add.at(totals, inverse, end - start)
+    totals //= SECOND
+
+    slept = totals > 0
+    users, user_index = np.unique(keys[slept, 0], return_inverse=True)
+    sums = np.bincount(user_index, weights=totals[slept])
+    counts = np.bincount(user_index)
+    return users, sums / counts
@@ -1,22 +1,17 @@
-from typing import List
+from typing import List, Tuple
 
-import pendulum
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.callback_data import CallbackData
 from aiogram.utils.markdown import hbold
 from loguru import logger
-from pendulum import DateTime, Duration, Period
+from pendulum import DateTime, Duration
+from sqlalchemy import and_
 
 from app.middlewares.i18n import i18n
+from app.models.db import db
 from app.models.sleep_record import SleepRecord
-from app.utils.datetime import (
-    as_day,
-    as_short_date,
-    as_time,
-    as_weekday,
-    as_weekday_int,
-    latenight_offset,
-)
+from app.utils.datetime import as_short_date, as_time, as_weekday, latenight_offset
+from app.utils.sleep_stats import SleepDays, records_to_arrays
 
 _ = i18n.gettext
 cb_moods = CallbackData("user", "record_id", "mood", "emoji")
@@ -76,18 +71,18 @@ def subtract_from(date: DateTime, diff: str, period: str) -> DateTime:
             new_dt = date.subtract(months=diff)
         elif period == "week":
             new_dt = date.subtract(weeks=diff)
+        elif period == "year":
+            new_dt = date.subtract(years=diff)
     return new_dt
 
 
 def get_records_stats(records: List[SleepRecord], tz, language):
     result = []
     for record in records:
-        dt_start = pendulum.instance(record.created_at)
-        dt_start_fixed_weekday = dt_start.subtract(
-            seconds=latenight_offset.in_seconds()
-        )
-        dt_end = pendulum.instance(record.wakeup_time)
-        interval = Period(dt_start, dt_end).as_interval()
+        dt_start = record.created_at
+        dt_start_fixed_weekday = dt_start - latenight_offset
+        dt_end = record.wakeup_time
+        interval = Duration(seconds=(dt_end - dt_start).total_seconds())
         result.append(
             f"{as_weekday(dt_start_fixed_weekday, tz, language)}, "
             + f"{as_short_date(dt_start_fixed_weekday, tz, language)} "
@@ -105,38 +100,69 @@ def get_records_stats(records: List[SleepRecord], tz, language):
     return result
 
 
-def get_stats_grouped_by_day(
-    records: List[SleepRecord], tz, language, mode="week", days=7
-):
-    if mode == "week":
-        get_day_func = as_weekday_int
-    elif mode == "month":
-        days = days + 1
-        get_day_func = as_day
-    else:
-        return []
-    tmp_res = [Duration() for i in range(days)]
-    result = []
-    for record in records:
-        dt_start = pendulum.instance(record.created_at)
-        dt_start_fixed_weekday = dt_start.subtract(
-            seconds=latenight_offset.in_seconds()
-        )
-        dt_end = pendulum.instance(record.wakeup_time)
-        interval = Period(dt_start, dt_end).as_interval()
-        i = int(get_day_func(dt_start_fixed_weekday, tz))
-        tmp_res[i] = tmp_res[i] + interval
-    for x in filter(lambda a: a.in_seconds() > 0, tmp_res):
-        result.append(x)
-    return result
+def get_month_weeks(start_dt: DateTime) -> List[Tuple[DateTime, DateTime]]:
+    """
+    Split month starting at start_dt into (start, end) windows ending on mondays
+    """
+    weeks = []
+    end_dt = start_dt.add(weeks=1)
+    end_dt = end_dt.subtract(days=max(end_dt.day_of_week - 1, 0))
+    while end_dt.month == start_dt.month:
+        weeks.append((start_dt, end_dt))
+        start_dt = end_dt
+        end_dt = end_dt.add(weeks=1)
+    weeks.append((start_dt, end_dt.subtract(days=end_dt.day - 1)))
+    return weeks
 
 
-def get_average_sleep(records: List[SleepRecord], tz, language, mode="week", days=7):
-    grouped_by_day = get_stats_grouped_by_day(
-        records, tz, language, mode=mode, days=days
+def closed_between(user_id: int, start_dt: DateTime, end_dt: DateTime):
+    return and_(
+        SleepRecord.user_id == user_id,
+        SleepRecord.created_at >= start_dt,
+        SleepRecord.created_at <= end_dt,
+        SleepRecord.wakeup_time != None,  # noqa
     )
-    avg_sleep_per_day = Duration(
-        seconds=sum(map(lambda x: x.in_seconds(), grouped_by_day))
-        / max(len(grouped_by_day), 1)
+
+
+async def get_sleep_records(
+    user_id: int, start_dt: DateTime, end_dt: DateTime
+) -> List[SleepRecord]:
+    return (
+        await SleepRecord.query.where(closed_between(user_id, start_dt, end_dt))
+        .order_by(SleepRecord.created_at)
+        .gino.all()
     )
-    return avg_sleep_per_day
+
+
+async def get_listed_records(user_id: int, start_dt: DateTime, end_dt: DateTime):
+    """
+    Only columns of closed records shown by get_records_stats
+    """
+    return (
+        await db.select(
+            [SleepRecord.created_at, SleepRecord.wakeup_time, SleepRecord.emoji]
+        )
+        .where(closed_between(user_id, start_dt, end_dt))
+        .order_by(SleepRecord.created_at)
+        .gino.all()
+    )
+
+
+def get_sleep_days(records: List[SleepRecord], tz) -> SleepDays:
+    """
+    Local day and sleep duration of each closed record
+    """
+    return SleepDays.from_arrays(*records_to_arrays(records), tz.offset)
+
+
+def average_sleep(sleep_days: SleepDays) -> Duration:
+    return Duration(seconds=sleep_days.average())
+
+
+def get_stats_grouped_by_day(records: List[SleepRecord], tz) -> List[Duration]:
+    _days, totals = get_sleep_days(records, tz).daily_totals()
+    return [Duration(seconds=seconds) for seconds in totals[totals > 0].tolist()]
+
+
+def get_average_sleep(records: List[SleepRecord], tz) -> Duration:
+    return average_sleep(get_sleep_days(records, tz))
@@ -4,3 +4,4 @@ from aiogram.dispatcher.filters.state import State, StatesGroup
 class States(StatesGroup):
     SET_TIMEZONE = State()
     SET_BEDTIME_REMINDER = State()
+    IMPORT_SLEEP_RECORDS = State()
@@ -0,0 +1,99 @@
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from pendulum import DateTime
+
+from app import config
+from app.models.db import db
+from app.models.sleep_record import SleepRecord
+from app.utils.datetime import latenight_offset
+from app.utils.sleep_stats import SleepDays
+from app.utils.sleep_tracker import (
+    get_listed_records,
+    get_sleep_days,
+    get_sleep_records,
+)
+
+DAILY_TOTALS_SQL = """
+SELECT (created_at AT TIME ZONE 'UTC' + CAST(:shift AS interval))::date AS day,
+       floor(extract(epoch FROM sum(wakeup_time - created_at)))::bigint
+FROM sleep_records
+WHERE user_id = :user_id
+  AND created_at >= :start_dt AND created_at <= :end_dt
+  AND wakeup_time IS NOT NULL
+GROUP BY 1
+ORDER BY 1
+"""
+
+
+class PythonStatsBackend:
+    """
+    Sums durations of sleep records loaded into the bot
+    """
+
+    name = "python"
+
+    async def get_sleep_days(
+        self,
+        user_id: int,
+        tz,
+        start_dt: DateTime,
+        end_dt: DateTime,
+        records: Optional[List[SleepRecord]] = None,
+    ) -> SleepDays:
+        if records is None:
+            records = await get_sleep_records(user_id, start_dt, end_dt)
+        return get_sleep_days(records, tz)
+
+    async def get_period_stats(
+        self, user_id: int, tz, start_dt: DateTime, end_dt: DateTime
+    ) -> Tuple[List[SleepRecord], SleepDays]:
+        """
+        Records listed in stats and sleep days summed from them
+        """
+        records = await get_sleep_records(user_id, start_dt, end_dt)
+        return records, get_sleep_days(records, tz)
+
+
+class SQLStatsBackend:
+    """
+    Lets Postgres group records by local day, one row per day is returned
+    """
+
+    name = "sql"
+
+    async def get_sleep_days(
+        self, user_id: int, tz, start_dt: DateTime, end_dt: DateTime
+    ) -> SleepDays:
+        rows = await db.all(
+            db.text(DAILY_TOTALS_SQL),
+            shift=timedelta(seconds=tz.offset) - latenight_offset,
+            user_id=user_id,
+            start_dt=start_dt,
+            end_dt=end_dt,
+        )
+        return SleepDays.from_daily([row[0] for row in rows], [row[1] for row in rows])
+
+    async def get_period_stats(
+        self, user_id: int, tz, start_dt: DateTime, end_dt: DateTime
+    ) -> Tuple[List, SleepDays]:
+        """
+        Only columns listed in stats are loaded, sleep days are summed by Postgres
+        """
+        records = await get_listed_records(user_id, start_dt, end_dt)
+        return records, await self.get_sleep_days(user_id, tz, start_dt, end_dt)
+
+
+BACKENDS = {backend.name: backend for backend in (PythonStatsBackend, SQLStatsBackend)}
+
+
+def get_stats_backend(name: str):
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown stats backend {name!r}, expected one of {', '.join(BACKENDS)}"
+        )
+
+
+stats_backend = get_stats_backend(config.STATS_BACKEND)
@@ -0,0 +1,57 @@
+from typing import Optional
+
+from loguru import logger
+
+from app import config
+from app.models.user import User
+from app.utils import redis
+
+KEY_PREFIX = "stats"
+
+
+def _key(user: User, kind: str, period: str) -> str:
+    return f"{KEY_PREFIX}:{user.id}:{kind}:{period}:{user.language}:{user.timezone}"
+
+
+def _index_key(user_id: int) -> str:
+    return f"{KEY_PREFIX}:{user_id}:keys"
+
+
+async def get(user: User, kind: str, period: str) -> Optional[str]:
+    """
+    Rendered stats message for absolute period (week start date, month etc.)
+    """
+    try:
+        return await redis.connector.redis.get(
+            _key(user, kind, period), encoding="utf-8"
+        )
+    except Exception as e:
+        logger.warning("Stats cache lookup failed: {e}", e=e)
+        return None
+
+
+async def put(user: User, kind: str, period: str, text: str):
+    key = _key(user, kind, period)
+    index_key = _index_key(user.id)
+    try:
+        tr = redis.connector.redis.multi_exec()
+        tr.set(key, text, expire=config.STATS_CACHE_TTL)
+        tr.sadd(index_key, key)
+        tr.expire(index_key, config.STATS_CACHE_TTL)
+        await tr.execute()
+    except Exception as e:
+        logger.warning("Stats cache update failed: {e}", e=e)
+
+
+async def invalidate(user_id: int):
+    """
+    Drop all cached stats messages of user
+    """
+    index_key = _index_key(user_id)
+    try:
+        keys = await redis.connector.redis.smembers(index_key)
+        await redis.connector.redis.delete(index_key, *keys)
+    except Exception as e:
+        logger.warning(
+            "Stats cache invalidation failed for user {user}: {e}", user=user_id, e=e
+        )
@@ -1,6 +1,7 @@
 from loguru import logger
 
 from app.models.user import User
+from app.utils.user_cache import user_cache
 
 
 async def create_super_user(user_id: int, remove: bool) -> bool:
@@ -15,6 +16,7 @@ async def create_super_user(user_id: int, remove: bool) -> bool:
         register_date=user.created_at,
     )
     await user.update(is_superuser=not remove).apply()
+    await user_cache.invalidate(user.id)
     if remove:
         logger.warning("User {user} now IS NOT superuser", user=user_id)
     else:
@@ -0,0 +1,213 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Dict, Iterable, Optional, Tuple
+
+from aiogram import Dispatcher
+from aiogram.utils.executor import Executor
+from loguru import logger
+from sqlalchemy.dialects.postgresql import insert
+
+from app import config
+from app.models.user import User
+from app.utils import redis
+
+INVALIDATION_CHANNEL = "users:invalidate"
+# seconds before resubscribing once the channel was closed, doubled on failures
+RESUBSCRIBE_DELAY = 1
+MAX_RESUBSCRIBE_DELAY = 30
+
+
+class UserCache:
+    """
+    Bounded LRU cache of User rows with per-entry TTL,
+    invalidated across replicas via Redis pub/sub
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.instance_id = uuid.uuid4().hex
+        self._data: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup(self, user_id: int) -> Optional[User]:
+        entry = self._data.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._data[user_id]
+            return None
+        self._data.move_to_end(user_id)
+        return entry[1]
+
+    def get(self, user_id: int) -> Optional[User]:
+        user = self._lookup(user_id)
+        if user is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return user
+
+    def put(self, user: User):
+        self._data[user.id] = (time.monotonic() + self.ttl, user)
+        self._data.move_to_end(user.id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def discard(self, user_id: int):
+        self._data.pop(user_id, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "prefetched": self.prefetched,
+        }
+
+    async def get_or_load(self, user_id: int) -> Optional[User]:
+        user = self.get(user_id)
+        if user is None:
+            user = await User.get(user_id)
+            if user is not None:
+                self.put(user)
+        return user
+
+    async def prefetch(self, user_ids: Iterable[int]):
+        """
+        Load all missing users with one query and create unknown ones with another
+        """
+        missing = {user_id for user_id in user_ids if self._lookup(user_id) is None}
+        if not missing:
+            return
+        users = await User.query.where(User.id.in_(missing)).gino.all()
+        missing.difference_update(user.id for user in users)
+        if missing:
+            created = (
+                await insert(User.__table__)
+                .values([{"id": user_id} for user_id in sorted(missing)])
+                .on_conflict_do_nothing()
+                .returning(*User.__table__.columns)
+                .gino.load(User)
+                .all()
+            )
+            for user in created:
+                logger.info("User {user} created!", user=user)
+            users.extend(created)
+        for user in users:
+            self.put(user)
+        self.prefetched += len(users)
+
+    async def invalidate(self, user_id: int):
+        """
+        Drop user from local cache and notify other replicas
+        """
+        self.discard(user_id)
+        await self.publish(user_id)
+
+    async def publish(self, user_id: int):
+        try:
+            await redis.connector.redis.publish(
+                INVALIDATION_CHANNEL, f"{self.instance_id}:{user_id}"
+            )
+        except Exception as e:
+            logger.warning(
+                "Failed to publish cache invalidation for user {user}: {e}",
+                user=user_id,
+                e=e,
+            )
+
+    async def listen(self):
+        channel = await self._subscribe()
+        self._listener = asyncio.create_task(self._listen(channel))
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._listener
+            self._listener = None
+        if not redis.connector.closed:
+            await redis.connector.redis.unsubscribe(INVALIDATION_CHANNEL)
+
+    @staticmethod
+    async def _subscribe():
+        (channel,) = await redis.connector.redis.subscribe(INVALIDATION_CHANNEL)
+        return channel
+
+    async def _listen(self, channel):
+        """
+        Read invalidations until shutdown, the channel is closed when
+        connection to redis drops, then it is subscribed to again
+        """
+        while True:
+            await self._reader(channel)
+            if redis.connector.closed:
+                return
+            logger.warning("User cache invalidation channel closed, resubscribing..")
+            channel = await self._resubscribe()
+            # invalidations published while the channel was closed are lost
+            self.clear()
+            logger.info("Resubscribed to user cache invalidations, cache cleared")
+
+    async def _resubscribe(self):
+        delay = RESUBSCRIBE_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                return await self._subscribe()
+            except Exception as e:
+                delay = min(delay * 2, MAX_RESUBSCRIBE_DELAY)
+                logger.warning(
+                    "Failed to resubscribe to user cache invalidations: {e}, "
+                    "retrying in {delay}s",
+                    e=e,
+                    delay=delay,
+                )
+
+    async def _reader(self, channel):
+        while await channel.wait_message():
+            message = await channel.get(encoding="utf-8")
+            sender, _, user_id = message.partition(":")
+            if sender != self.instance_id and user_id.isdigit():
+                self.discard(int(user_id))
+
+
+user_cache = UserCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+
+async def update_user(user: User, **values):
+    """
+    Apply changes to user and keep caches of all replicas coherent
+    """
+    await user.update(**values).apply()
+    user_cache.put(user)
+    await user_cache.publish(user.id)
+
+
+async def on_startup(dispatcher: Dispatcher):
+    logger.info("Subscribe to user cache invalidations")
+    await user_cache.listen()
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    logger.info("Unsubscribe from user cache invalidations")
+    await user_cache.stop()
+
+
+def setup(executor: Executor):
+    executor.on_startup(on_startup)
+    executor.on_shutdown(on_shutdown)
@@ -1,13 +1,30 @@
+import asyncio
+import heapq
+import time
+from contextlib import suppress
+from datetime import timedelta
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+import pendulum
+from aiogram import Dispatcher
+from aiogram.utils.executor import Executor
 from aiogram.utils.markdown import hitalic
 from loguru import logger
 from pendulum import DateTime, Duration
 from pendulum.tz.timezone import FixedTimezone
+from sqlalchemy import and_, func, or_
+from sqlalchemy.dialects.postgresql import insert
 
-from app.filters.sleep_tracker import UserAwakeFilter
+from app import config
 from app.middlewares.i18n import i18n
-from app.misc import bot
+from app.models.db import db
 from app.models.reminders import WakeupReminder
 from app.models.user import User
+from app.utils import sleep_index
+from app.utils.claims import INSTANCE_ID, before_now, claim_lease
+from app.utils.fanout import BurstReport, Message, fanout
+from app.utils.metrics import metrics
 
 SLEEP_HOURS = 6
 SLEEP_MINUTES = 30
@@ -15,29 +32,255 @@ SLEEP_SECONDS = 0
 sleep_duration = Duration(
     hours=SLEEP_HOURS, minutes=SLEEP_MINUTES, seconds=SLEEP_SECONDS
 )
+# reminders missed by more than that while bot was down are dropped,
+# same as misfire_grace_time of scheduler jobs
+MISFIRE_GRACE_TIME = 300
+# timers handled at once, keeps queries below asyncpg's argument limit
+BATCH_SIZE = 10000
 _ = i18n.gettext
 
 
+class WakeupTimers:
+    """
+    One-shot timers in a min-heap ordered by fire time, at most one per user.
+    Cancelled timers stay in the heap and are skipped when they come up
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        # user id -> fire time of the live timer
+        self._timers: Dict[int, float] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._timers)
+
+    def push(self, user_id: int, fire_at: float):
+        self._timers[user_id] = fire_at
+        heapq.heappush(self._heap, (fire_at, user_id))
+        # drop cancelled timers once they outnumber live ones
+        if len(self._heap) > 2 * len(self._timers) + 1024:
+            self._heap = [(t, u) for u, t in self._timers.items()]
+            heapq.heapify(self._heap)
+        if self._changed and self._heap[0] == (fire_at, user_id):
+            self._changed.set()
+
+    def cancel(self, user_id: int) -> bool:
+        return self._timers.pop(user_id, None) is not None
+
+    def pop_due(self, now: float, limit: int = BATCH_SIZE) -> List[Tuple[float, int]]:
+        """
+        Fire times and user ids of due timers, earliest first
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < limit:
+            fire_at, user_id = heapq.heappop(self._heap)
+            if self._timers.get(user_id) == fire_at:
+                del self._timers[user_id]
+                due.append((fire_at, user_id))
+        return due
+
+    def next_fire_time(self) -> Optional[float]:
+        while self._heap:
+            fire_at, user_id = self._heap[0]
+            if self._timers.get(user_id) == fire_at:
+                return fire_at
+            heapq.heappop(self._heap)
+        return None
+
+    def start(self):
+        self._changed = asyncio.Event()
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._runner
+        self._runner = None
+
+    async def _run(self):
+        while True:
+            self._changed.clear()
+            try:
+                await self._fire()
+            except Exception:
+                logger.exception("Failed to send wakeup reminders")
+            fire_at = self.next_fire_time()
+            timeout = None if fire_at is None else max(fire_at - time.time(), 0)
+            if config.SCHEDULER_DISTRIBUTED:
+                # timers set on other replicas are found by polling
+                interval = config.SCHEDULER_CLAIM_INTERVAL
+                timeout = interval if timeout is None else min(timeout, interval)
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._changed.wait(), timeout)
+
+    async def _fire(self):
+        due = self.pop_due(time.time())
+        if config.SCHEDULER_DISTRIBUTED:
+            # local timers only wake this replica up in time,
+            # due reminders are sent by the replica claiming them
+            due = await claim_wakeup_reminders()
+            if len(due) == BATCH_SIZE:
+                self._changed.set()
+        now = time.time()
+        for fire_at, _user_id in due:
+            metrics.observe("reminder_fire_lag", "wakeup", max(now - fire_at, 0))
+        if due:
+            await send_wakeup_reminders([user_id for _fire_at, user_id in due])
+
+
+timers = WakeupTimers()
+
+
 async def schedule_wakeup_reminder(
     user: User, time: DateTime, tz: FixedTimezone,
 ):
     logger.info(f"Scheduling wakeup reminder for user {user.id}")
     logger.info(f"Time: {time.to_time_string()}, tz: {tz.name}")
 
-    reminder: WakeupReminder = await WakeupReminder.query.where(
-        WakeupReminder.user_id == user.id
-    ).gino.first()
-    job_id = reminder.job_id if reminder else None
+    query = insert(WakeupReminder.__table__).values(user_id=user.id, fire_at=time)
+    await query.on_conflict_do_update(
+        index_elements=[WakeupReminder.user_id],
+        set_={
+            "fire_at": query.excluded.fire_at,
+            "claimed_by": None,
+            "claimed_until": None,
+        },
+    ).gino.status()
+    timers.push(user.id, time.timestamp())
+
+
+async def cancel_wakeup_reminder(user: User):
+    # in distributed mode the timer may be set on another replica
+    if timers.cancel(user.id) or config.SCHEDULER_DISTRIBUTED:
+        logger.info(f"Cancelling wakeup reminder for user {user.id}")
+        await WakeupReminder.delete.where(
+            WakeupReminder.user_id == user.id
+        ).gino.status()
 
-    from app.utils.scheduler import scheduler, schedule_job
 
-    time = time.in_tz(scheduler.timezone)
-    await schedule_job(job_id, WakeupReminder, time, wakeup_reminder_func, user)
+async def send_wakeup_reminders(user_ids: List[int]):
+    """
+    Send reminders of all timers due at once as one burst
+    """
+    on_sent = on_progress = None
+    if config.SCHEDULER_DISTRIBUTED:
+        # claimed reminders are kept until sent for another replica to take over
+        on_sent = partial(release_wakeup_reminders, user_ids)
+        on_progress = partial(renew_wakeup_reminders, user_ids)
+    else:
+        await WakeupReminder.delete.where(
+            WakeupReminder.user_id.in_(user_ids)
+        ).gino.status()
+    users = await User.query.where(User.id.in_(user_ids)).gino.all()
+    # only users still asleep are asked if they woke up
+    asleep = await sleep_index.asleep_users([user.id for user in users])
+    messages = [wakeup_reminder_message(user) for user in users if user.id in asleep]
+    logger.info("Sending {count} wakeup reminders", count=len(messages))
+    fanout.submit("wakeup", messages, on_sent=on_sent, on_progress=on_progress)
 
 
-async def wakeup_reminder_func(user: User):
-    if await UserAwakeFilter(user_awake=False, user=user).check():
-        logger.info(f"Sending wakeup reminder to user {user.id}")
-        await bot.send_message(
-            user.id, hitalic(_("Did you wake up?")), disable_notification=True,
+async def claim_wakeup_reminders(
+    limit: int = BATCH_SIZE, lease: Optional[timedelta] = None
+) -> List[Tuple[float, int]]:
+    """
+    Claim due reminders nobody claimed or whose claim expired,
+    rows locked by concurrent claims of other replicas are skipped.
+    Returns fire times and user ids of claimed reminders
+    """
+    lease = lease or claim_lease()
+    now = func.now()
+    misfired = before_now(timedelta(seconds=MISFIRE_GRACE_TIME))
+    due = (
+        db.select([WakeupReminder.user_id])
+        .where(
+            and_(
+                WakeupReminder.fire_at <= now,
+                or_(
+                    and_(
+                        WakeupReminder.claimed_by == None,  # noqa
+                        WakeupReminder.fire_at >= misfired,
+                    ),
+                    WakeupReminder.claimed_until < now,
+                ),
+            )
         )
+        .order_by(WakeupReminder.fire_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    claimed = (
+        await WakeupReminder.update.values(
+            claimed_by=INSTANCE_ID, claimed_until=now + lease
+        )
+        .where(WakeupReminder.user_id.in_(due))
+        .returning(WakeupReminder.fire_at, WakeupReminder.user_id)
+        .gino.all()
+    )
+    return [(reminder.fire_at.timestamp(), reminder.user_id) for reminder in claimed]
+
+
+async def renew_wakeup_reminders(user_ids: List[int], reminded: List[int]):
+    """
+    Renew claims of reminders while their burst is sent, reminders of users
+    it reached meanwhile are released, so a replica taking the rest over
+    does not send them again
+    """
+    if reminded:
+        await release_wakeup_reminders(reminded)
+    await WakeupReminder.update.values(claimed_until=func.now() + claim_lease()).where(
+        and_(
+            WakeupReminder.user_id.in_(user_ids),
+            WakeupReminder.claimed_by == INSTANCE_ID,
+        )
+    ).gino.status()
+
+
+async def release_wakeup_reminders(
+    user_ids: List[int], report: Optional[BurstReport] = None
+):
+    # reminder may be claimed by another replica or set again meanwhile
+    await WakeupReminder.delete.where(
+        and_(
+            WakeupReminder.user_id.in_(user_ids),
+            WakeupReminder.claimed_by == INSTANCE_ID,
+        )
+    ).gino.status()
+
+
+def wakeup_reminder_message(user: User) -> Message:
+    locale = user.language or i18n.default
+    text = hitalic(_("Did you wake up?", locale=locale))
+    return user.id, text, dict(disable_notification=True)
+
+
+async def on_startup(dispatcher: Dispatcher):
+    logger.info("Loading wakeup reminders..")
+    misfired = time.time() - MISFIRE_GRACE_TIME
+    if not config.SCHEDULER_DISTRIBUTED:
+        for reminder in await WakeupReminder.query.gino.all():
+            fire_at = reminder.fire_at.timestamp()
+            if fire_at >= misfired:
+                timers.push(reminder.user_id, fire_at)
+    status, _rows = await WakeupReminder.delete.where(
+        and_(
+            WakeupReminder.fire_at < pendulum.from_timestamp(misfired),
+            WakeupReminder.claimed_by == None,  # noqa
+        )
+    ).gino.status()
+    # "DELETE <count>"
+    metrics.count("reminder_misfires", "wakeup", int(status.split()[-1]))
+    logger.info("Loaded {count} wakeup reminders", count=len(timers))
+    timers.start()
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    logger.info("Stopping wakeup reminders..")
+    await timers.stop()
+
+
+def setup(executor: Executor):
+    # on_shutdown is registered by executor before connections it needs
+    executor.on_startup(on_startup)
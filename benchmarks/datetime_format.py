@@ -0,0 +1,141 @@
+"""
+Equivalence check and timing of the precompiled date formatting layer
+against the generic pendulum.Formatter it replaced.
+
+    python -m benchmarks.datetime_format --records 10000
+"""
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import click
+import pendulum
+from aiogram.utils.markdown import hbold
+from pendulum import Duration
+
+from app.middlewares.i18n import i18n
+from app.utils.datetime import (
+    LOCALES,
+    as_datetime,
+    as_day,
+    as_month,
+    as_short_date,
+    as_time,
+    as_weekday,
+    as_weekday_int,
+    datetime_fmtr,
+    latenight_offset,
+    parse_tz,
+)
+from app.utils.sleep_tracker import get_records_stats
+
+TIMEZONES = ["+00:00", "+03:00", "-05:00", "+05:30", "-09:30", "+14:00"]
+PATTERNS = {
+    as_short_date: "D MMM",
+    as_month: "MMMM YYYY",
+    as_datetime: "D MMMM, dd HH:mm:ss",
+    as_weekday: "dd",
+}
+PLAIN_PATTERNS = {as_time: "HH:mm:ss", as_weekday_int: "d", as_day: "D"}
+
+
+def legacy_format(dt, tz, fmt, locale="en"):
+    return datetime_fmtr.format(pendulum.instance(dt).in_tz(tz), fmt, locale)
+
+
+def legacy_records_stats(records, tz, language):
+    result = []
+    for record in records:
+        dt_start = pendulum.instance(record.created_at)
+        dt_start_fixed_weekday = dt_start.subtract(
+            seconds=latenight_offset.in_seconds()
+        )
+        dt_end = pendulum.instance(record.wakeup_time)
+        interval = Duration(seconds=(dt_end - dt_start).total_seconds())
+        result.append(
+            f"{legacy_format(dt_start_fixed_weekday, tz, 'dd', language)}, "
+            + f"{legacy_format(dt_start_fixed_weekday, tz, 'D MMM', language)} "
+            + f"{legacy_format(dt_start, tz, 'HH:mm:ss')}"
+            + " - "
+            + f"{legacy_format(dt_end, tz, 'HH:mm:ss')}"
+            + " -- "
+            + hbold(
+                i18n.gettext("{hours}h {minutes}min").format(
+                    hours=interval.hours, minutes=interval.minutes,
+                )
+            )
+            + (f"({record.emoji})" if record.emoji else "")
+        )
+    return result
+
+
+def generate_records(count: int):
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    records = []
+    for _ in range(count):
+        created_at = start + timedelta(seconds=random.randrange(10 ** 9 // 3))
+        wakeup_time = created_at + timedelta(seconds=random.randrange(16 * 3600))
+        emoji = random.choice(["", "😴", "🙂"])
+        records.append(
+            SimpleNamespace(created_at=created_at, wakeup_time=wakeup_time, emoji=emoji)
+        )
+    return records
+
+
+def check_helpers(records):
+    for record in records:
+        dt = record.created_at
+        tz = parse_tz(random.choice(TIMEZONES))
+        for locale in LOCALES:
+            for helper, fmt in PATTERNS.items():
+                expected = legacy_format(dt, tz, fmt, locale)
+                assert helper(dt, tz, locale) == expected, (helper, dt, locale)
+        for helper, fmt in PLAIN_PATTERNS.items():
+            assert helper(dt, tz) == legacy_format(dt, tz, fmt), (helper, dt)
+
+
+def measure(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+@click.command()
+@click.option("--records", default=10000, type=int, help="Records to render")
+@click.option("--seed", default=0, type=int)
+def main(records: int, seed: int):
+    random.seed(seed)
+    data = generate_records(records)
+    check_helpers(data[:1000])
+    click.echo("Helpers match pendulum.Formatter output")
+
+    for locale in LOCALES:
+        tz_string = random.choice(TIMEZONES)
+        legacy_tz = pendulum.tz.fixed_timezone(
+            int(tz_string[0] + "1")
+            * (int(tz_string[1:3]) * 3600 + int(tz_string[4:]) * 60)
+        )
+        i18n.ctx_locale.set(locale)
+        legacy, legacy_time = measure(legacy_records_stats, data, legacy_tz, locale)
+        current, current_time = measure(
+            get_records_stats, data, parse_tz(tz_string), locale
+        )
+        assert legacy == current, "Rendered stats differ"
+
+        click.echo(
+            f"{locale}: legacy {legacy_time / records * 10 ** 6:.2f} us/record, "
+            f"current {current_time / records * 10 ** 6:.2f} us/record, "
+            f"x{legacy_time / current_time:.1f}"
+        )
+
+    started = time.perf_counter()
+    for _ in range(records):
+        parse_tz(random.choice(TIMEZONES))
+    click.echo(
+        f"parse_tz: {(time.perf_counter() - started) / records * 10 ** 6:.2f} us/call"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Memory and time of streaming sleep history export.
+
+Peak python memory must not grow with history length. Rows come either
+from a synthetic generator or from records seeded into postgres
+inside a rolled back transaction:
+
+    python -m benchmarks.export --records 100000
+    python -m benchmarks.export --records 100000 --db
+"""
+import asyncio
+import gzip
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import click
+
+from app import config
+from app.models.db import db
+from app.models.user import User
+from app.utils.datetime import parse_tz
+from app.utils.export import (
+    FORMATS,
+    export_size,
+    iterate_records,
+    write_export,
+)
+
+BENCH_USER_ID = 2 ** 31 - 2_000_000
+SEED_SQL = """
+INSERT INTO sleep_records (user_id, created_at, wakeup_time, mood, emoji)
+SELECT :user_id, t.ts, t.ts + interval '7 hours' + random() * interval '2 hours',
+       'good', '🙂'
+FROM generate_series(1, :records) n,
+     LATERAL (SELECT now() - n * interval '1 day') t(ts)
+"""
+
+
+def make_row(index: int):
+    created_at = datetime(2000, 1, 1, tzinfo=timezone.utc) + timedelta(days=index)
+    wakeup_time = created_at + timedelta(seconds=random.randrange(6 * 3600, 9 * 3600))
+    return index, created_at, wakeup_time, "good", "🙂", None
+
+
+async def synthetic_chunks(records: int):
+    chunk_size = config.EXPORT_CHUNK_SIZE
+    for start in range(0, records, chunk_size):
+        end = min(start + chunk_size, records)
+        yield [make_row(index) for index in range(start, end)]
+        await asyncio.sleep(0)
+
+
+async def export(records: int, fmt: str, compress: bool, use_db: bool):
+    chunks = iterate_records(BENCH_USER_ID) if use_db else synthetic_chunks(records)
+    return await write_export(chunks, fmt, compress, parse_tz("+03:00"))
+
+
+async def measure(records: int, fmt: str, compress: bool, use_db: bool) -> tuple:
+    started = time.perf_counter()
+    spool = await export(records, fmt, compress, use_db)
+    elapsed = time.perf_counter() - started
+    with spool:
+        size = export_size(spool)
+        # make sure the file is complete and readable
+        data = spool.read()
+        if compress:
+            data = gzip.decompress(data)
+        lines = data.count(b"\n")
+    expected = records + (fmt == "csv")
+    assert lines == expected, (lines, expected)
+
+    # separate run, tracing slows everything down
+    tracemalloc.start()
+    spool = await export(records, fmt, compress, use_db)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    spool.close()
+    return elapsed, peak, size
+
+
+async def run(records: int, use_db: bool):
+    click.echo(
+        f"{'records':>8} {'format':>8} {'time, s':>8} {'peak, KiB':>10} {'size, KiB':>10}"
+    )
+    for count in (records // 10, records):
+        if use_db:
+            await db.status(
+                "DELETE FROM sleep_records WHERE user_id = :user_id",
+                user_id=BENCH_USER_ID,
+            )
+            await db.status(db.text(SEED_SQL), user_id=BENCH_USER_ID, records=count)
+        for fmt in FORMATS:
+            for compress in (False, True):
+                elapsed, peak, size = await measure(count, fmt, compress, use_db)
+                name = fmt + (".gz" if compress else "")
+                click.echo(
+                    f"{count:>8} {name:>8} {elapsed:>8.2f} {peak / 1024:>10.0f} "
+                    f"{size / 1024:>10.0f}"
+                )
+
+
+async def main(records: int, use_db: bool):
+    if not use_db:
+        await run(records, use_db)
+        return
+    await db.set_bind(config.POSTGRES_URI)
+    try:
+        async with db.transaction() as tx:
+            await User.create(id=BENCH_USER_ID)
+            await run(records, use_db)
+            tx.raise_rollback()
+    finally:
+        await db.pop_bind().close()
+
+
+@click.command()
+@click.option("--records", default=100000, show_default=True)
+@click.option("--db", "use_db", is_flag=True, default=False, help="Read from postgres")
+def cli(records: int, use_db: bool):
+    asyncio.run(main(records, use_db))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,157 @@
+"""
+EXPLAIN ANALYZE of hot sleep_records and reminders queries
+before and after the 8f2d4b7c1e05 keys migration.
+
+Everything runs on temporary tables inside a rolled back transaction,
+real data is never touched:
+
+    python -m benchmarks.indexes --users 10000 --days 365
+"""
+import asyncio
+import json
+
+import click
+
+from app import config
+from app.models.db import db
+
+SEED_SQL = [
+    """
+    CREATE TEMP TABLE bench_sleep_records (
+        id serial PRIMARY KEY,
+        user_id integer NOT NULL,
+        created_at timestamptz DEFAULT now(),
+        updated_at timestamptz DEFAULT now(),
+        wakeup_time timestamptz,
+        mood varchar,
+        emoji varchar,
+        note varchar
+    )
+    """,
+    """
+    CREATE TEMP TABLE bench_bedtime_reminders (
+        job_id varchar(191) NOT NULL,
+        user_id integer NOT NULL,
+        created_at timestamptz DEFAULT now(),
+        updated_at timestamptz DEFAULT now()
+    )
+    """,
+    # index generated from `index=True` on the primary key
+    "CREATE UNIQUE INDEX bench_ix_sleep_records_id ON bench_sleep_records (id)",
+    """
+    INSERT INTO bench_sleep_records (user_id, created_at, wakeup_time)
+    SELECT u, t.ts,
+           CASE WHEN d = 0 AND u % 10 = 0 THEN NULL
+                ELSE t.ts + interval '6 hours' + random() * interval '3 hours'
+           END
+    FROM generate_series(1, {users}) u,
+         generate_series(0, {days} - 1) d,
+         LATERAL (
+             SELECT now() - d * interval '1 day' - random() * interval '3 hours'
+         ) t(ts)
+    """,
+    """
+    INSERT INTO bench_bedtime_reminders (job_id, user_id)
+    SELECT md5(u::text), u FROM generate_series(1, {users}) u
+    """,
+]
+
+MIGRATION_SQL = [
+    "DROP INDEX bench_ix_sleep_records_id",
+    "CREATE INDEX bench_ix_sleep_records_user_id_created_at "
+    "ON bench_sleep_records (user_id, created_at)",
+    "CREATE UNIQUE INDEX bench_ux_sleep_records_user_id_open "
+    "ON bench_sleep_records (user_id) WHERE wakeup_time IS NULL",
+    "ALTER TABLE bench_bedtime_reminders ADD PRIMARY KEY (user_id)",
+    "CREATE UNIQUE INDEX bench_ux_bedtime_reminders_job_id "
+    "ON bench_bedtime_reminders (job_id)",
+]
+
+QUERIES = {
+    "weekly stats": """
+        SELECT * FROM bench_sleep_records
+        WHERE user_id = {user_id}
+          AND created_at >= now() - interval '7 days' AND created_at <= now()
+        ORDER BY created_at
+    """,
+    "monthly stats": """
+        SELECT * FROM bench_sleep_records
+        WHERE user_id = {user_id}
+          AND created_at >= now() - interval '1 month' AND created_at <= now()
+        ORDER BY created_at
+    """,
+    "awake check": """
+        SELECT * FROM bench_sleep_records
+        WHERE user_id = {user_id} AND wakeup_time IS NULL
+        LIMIT 1
+    """,
+    "sleep index rebuild": """
+        SELECT DISTINCT user_id FROM bench_sleep_records WHERE wakeup_time IS NULL
+    """,
+    "reminder lookup": """
+        SELECT * FROM bench_bedtime_reminders WHERE user_id = {user_id} LIMIT 1
+    """,
+}
+
+
+async def explain(query: str, verbose: bool) -> float:
+    if verbose:
+        for (line,) in await db.all(f"EXPLAIN (ANALYZE, BUFFERS) {query}"):
+            click.echo(f"    {line}")
+    (plan,) = await db.scalar(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}")
+    if isinstance(plan, str):
+        plan = json.loads(plan)[0]
+    return plan["Execution Time"]
+
+
+async def run_queries(stage: str, user_id: int, verbose: bool) -> dict:
+    click.echo(f"\n=== {stage}")
+    timings = {}
+    for name, query in QUERIES.items():
+        click.echo(f"  -- {name}")
+        timings[name] = await explain(query.format(user_id=user_id), verbose)
+        click.echo(f"     {timings[name]:.3f} ms")
+    return timings
+
+
+async def main(users: int, days: int, verbose: bool):
+    await db.set_bind(config.POSTGRES_URI)
+    try:
+        async with db.transaction() as tx:
+            click.echo(f"Seeding {users} users x {days} days of sleep records..")
+            for sql in SEED_SQL:
+                await db.status(sql.format(users=users, days=days))
+            await db.status("ANALYZE bench_sleep_records")
+            await db.status("ANALYZE bench_bedtime_reminders")
+
+            user_id = users // 2 - users // 2 % 10
+            before = await run_queries("before", user_id, verbose)
+            for sql in MIGRATION_SQL:
+                await db.status(sql)
+            await db.status("ANALYZE bench_sleep_records")
+            await db.status("ANALYZE bench_bedtime_reminders")
+            after = await run_queries("after", user_id, verbose)
+
+            click.echo(
+                f"\n{'query':<22}{'before, ms':>12}{'after, ms':>12}{'speedup':>10}"
+            )
+            for name in QUERIES:
+                click.echo(
+                    f"{name:<22}{before[name]:>12.3f}{after[name]:>12.3f}"
+                    f"{before[name] / max(after[name], 0.001):>9.1f}x"
+                )
+            tx.raise_rollback()
+    finally:
+        await db.pop_bind().close()
+
+
+@click.command()
+@click.option("--users", default=10000, show_default=True)
+@click.option("--days", default=365, show_default=True, help="Records per user")
+@click.option("--verbose", is_flag=True, default=False, help="Print full plans")
+def cli(users: int, days: int, verbose: bool):
+    asyncio.run(main(users, days, verbose))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,200 @@
+"""
+Bot API calls and handler time of sleep and settings interactions, the
+bot handlers process updates of one user against the fake Bot API, local
+postgres and redis:
+
+    python -m benchmarks.interactions --rounds 20
+
+Calls are compared with the handlers before app.utils.interaction.Reply,
+which sent each text part as a message and deleted messages after
+VISUAL_GRACE_TIME sleeps. Exits with an error if an interaction does not
+take fewer calls than before or the chat does not end up with the messages
+the handlers are expected to leave.
+
+The user it creates is removed at the end together with its sleep records.
+"""
+import asyncio
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import click
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from loguru import logger
+
+from app import misc
+from app.misc import bot, dp
+from app.models.user import User
+from app.utils import interaction
+from app.utils.executor import runner
+from app.utils.fake_bot_api import FakeBotAPI
+from app.utils.loadtest import LOADTEST_USER_ID
+from app.utils.user_settings import cb_user_settings
+from benchmarks.reminder_fanout import HOST
+
+# first user of the load test, never an id of a real user
+BENCH_USER_ID = LOADTEST_USER_ID
+# Bot API calls of an interaction before Reply
+BASELINE_CALLS = {
+    # sleep summary and mood question sent apart
+    "sleep_end": 2,
+    # callback answered, summary and mood question sent, button message deleted
+    "wakeup_button": 4,
+    # settings message and user's answer deleted, settings sent again
+    "set_timezone": 3,
+}
+TIMEZONES = ["+03:00", "+00:00"]
+
+
+class Chat:
+    """
+    Chat of the user with the bot, updates are processed one at a time
+    """
+
+    def __init__(self, api: FakeBotAPI, user_id: int):
+        self.api = api
+        self.user_id = user_id
+        self.calls: Counter = Counter()
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.problems: List[str] = []
+
+    async def process(self, update: dict, name: Optional[str] = None):
+        calls = sum(self.api.calls.values())
+        started = time.perf_counter()
+        await dp.process_update(types.Update.to_object(update))
+        elapsed = time.perf_counter() - started
+        # background deletions are counted too
+        while interaction._cleanups:
+            await asyncio.gather(*interaction._cleanups)
+        if name is not None:
+            self.calls[name] += sum(self.api.calls.values()) - calls
+            self.timings[name].append(elapsed)
+
+    async def send(self, text: str, name: Optional[str] = None) -> int:
+        """
+        Send text as the user, returns id of the message
+        """
+        update = self.api.message_update(self.user_id, text)
+        await self.process(update, name)
+        return update["message"]["message_id"]
+
+    async def press(self, message_id: int, data: str, name: Optional[str] = None):
+        update = self.api.callback_update(self.user_id, message_id, data)
+        await self.process(update, name)
+
+    def last_message(self) -> Tuple[int, str, Optional[dict]]:
+        message_id = self.api.last_message_ids[self.user_id]
+        text, markup = self.api.messages.get((self.user_id, message_id), ("", None))
+        return message_id, text, markup
+
+    def message(self, message_id: int) -> Optional[Tuple[str, Optional[dict]]]:
+        return self.api.messages.get((self.user_id, message_id))
+
+    def check(self, ok: bool, problem: str):
+        if not ok:
+            self.problems.append(problem)
+
+
+def is_summary(text: str, markup: Optional[dict]) -> bool:
+    """
+    Sleep summary with the mood question and its buttons
+    """
+    return "Good morning!" in text and "How do you feel?" in text and bool(markup)
+
+
+async def sleep_end(chat: Chat):
+    await chat.send("-")
+    typed = await chat.send("+", "sleep_end")
+    message_id, text, markup = chat.last_message()
+    chat.check(
+        message_id == typed + 1 and is_summary(text, markup),
+        "sleep_end did not answer with one message of the summary and moods",
+    )
+
+
+async def wakeup_button(chat: Chat):
+    await chat.send("-")
+    message_id, text, markup = chat.last_message()
+    if not markup:
+        chat.problems.append("sleep_start did not answer with the wakeup button")
+        return
+    data = markup["inline_keyboard"][0][0]["callback_data"]
+    await chat.press(message_id, data, "wakeup_button")
+    last_id, text, markup = chat.last_message()
+    chat.check(
+        last_id == message_id and is_summary(text, markup),
+        "wakeup button message was not replaced by the summary and moods",
+    )
+
+
+async def set_timezone(chat: Chat, timezone: str):
+    await chat.send("/settings")
+    settings_id = chat.last_message()[0]
+    data = cb_user_settings.new(property="time_zone", value="set")
+    await chat.press(settings_id, data)
+    typed = await chat.send(timezone, "set_timezone")
+    settings = chat.message(settings_id)
+    chat.check(
+        chat.last_message()[0] == typed
+        and settings is not None
+        and f"Time zone changed to {timezone}" in settings[0],
+        "set_timezone did not edit the settings message",
+    )
+    chat.check(chat.message(typed) is None, "set_timezone did not delete the answer")
+
+
+async def remove_user():
+    # sleep records, rollups and reminders go with the user
+    await User.delete.where(User.id == BENCH_USER_ID).gino.status()
+
+
+async def main(api: FakeBotAPI, rounds: int) -> Chat:
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    # left by a run that did not finish
+    await remove_user()
+    await User.create(id=BENCH_USER_ID, language="en", timezone="+00:00")
+    chat = Chat(api, BENCH_USER_ID)
+    try:
+        for round_ in range(rounds):
+            await sleep_end(chat)
+            await wakeup_button(chat)
+            await set_timezone(chat, TIMEZONES[round_ % len(TIMEZONES)])
+    finally:
+        await remove_user()
+    return chat
+
+
+@click.command()
+@click.option("--rounds", default=20, show_default=True)
+def cli(rounds: int):
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    misc.setup()
+    api = FakeBotAPI(rate=None)
+    bot.server = TelegramAPIServer.from_base(
+        runner.loop.run_until_complete(api.start(HOST))
+    )
+    try:
+        chat = runner.start(main(api, rounds))
+    finally:
+        runner.loop.run_until_complete(api.stop())
+
+    problems = list(dict.fromkeys(chat.problems))
+    for name, baseline in BASELINE_CALLS.items():
+        calls = chat.calls[name] / rounds
+        elapsed = sum(chat.timings[name]) / rounds
+        click.echo(
+            f"{name:>14}: {baseline} -> {calls:.1f} calls, "
+            f"handler {elapsed * 1000:.1f} ms"
+        )
+        if calls >= baseline:
+            problems.append(f"{name} did not take fewer Bot API calls")
+    if problems:
+        raise click.ClickException("; ".join(problems))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,74 @@
+"""
+Reminder burst sent through the fan-out to a local fake Bot API,
+which answers 429 with retry_after like Telegram when messages
+arrive faster than --rate per second, allowing for a second worth of
+jitter:
+
+    python -m benchmarks.reminder_fanout --reminders 50000 --rate 30
+    python -m benchmarks.reminder_fanout --reminders 5000 --rate 30 --unlimited
+
+--unlimited sends with the same concurrency but without the token bucket.
+Sending 50k reminders at 30 per second takes about half an hour,
+a higher --rate shows the same behaviour sooner.
+"""
+import asyncio
+import time
+
+import click
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer
+
+from app.utils.fake_bot_api import FakeBotAPI
+from app.utils.fanout import Fanout, TokenBucket
+
+HOST = "127.0.0.1"
+TOKEN = "123456:fake"
+
+
+class NoLimit:
+    async def acquire(self):
+        pass
+
+    def pause(self, seconds: float):
+        pass
+
+
+async def main(reminders: int, rate: int, concurrency: int, unlimited: bool):
+    api = FakeBotAPI(rate)
+    bot = Bot(TOKEN, server=TelegramAPIServer.from_base(await api.start(HOST)))
+    limiter = NoLimit() if unlimited else TokenBucket(rate)
+    fanout = Fanout(bot, limiter, concurrency)
+    messages = [(chat_id, "Hey!..", {}) for chat_id in range(1, reminders + 1)]
+    started = time.perf_counter()
+    try:
+        report = await fanout.send("benchmark", messages)
+    finally:
+        await bot.session.close()
+        await api.stop()
+    elapsed = time.perf_counter() - started
+
+    click.echo(
+        f"{report.sent}/{report.total} delivered, {report.failed} failed "
+        f"in {elapsed:.1f}s ({report.sent / elapsed:.1f}/s, limit {rate}/s)"
+    )
+    click.echo(
+        f"429 answers: {api.too_many}, retries: {report.retried}, "
+        f"max in any second: {api.max_per_second}"
+    )
+    click.echo(
+        f"latency p50 {report.percentile(0.5):.2f}s, "
+        f"p95 {report.percentile(0.95):.2f}s, max {report.percentile(1):.2f}s"
+    )
+
+
+@click.command()
+@click.option("--reminders", default=50000, show_default=True)
+@click.option("--rate", default=30, show_default=True)
+@click.option("--concurrency", default=50, show_default=True)
+@click.option("--unlimited", is_flag=True, default=False)
+def cli(reminders: int, rate: int, concurrency: int, unlimited: bool):
+    asyncio.run(main(reminders, rate, concurrency, unlimited))
+
+
+if __name__ == "__main__":
+    cli()
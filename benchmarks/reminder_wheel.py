@@ -0,0 +1,147 @@
+"""
+Scheduler bookkeeping per minute with one cron job per user and with
+the reminder wheel's single tick job:
+
+    python -m benchmarks.reminder_wheel -n 1000 -n 10000 -n 100000 -n 1000000
+
+Jobs live in a MemoryJobStore, so the cron figures leave out the
+persistence per user jobs paid for in production. With --database the wheel's query
+for one minute is timed against users seeded in a transaction that is
+rolled back at the end.
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from app import config
+from app.models.db import db
+from app.models.user import User
+from app.utils.bedtime_reminder import MINUTES_PER_DAY
+
+# far away from real telegram ids, room for a million users
+FIRST_USER_ID = 2 ** 31 - 1_000_000
+MINUTES = 30
+
+
+async def noop():
+    pass
+
+
+def make_store(jobs: int, triggers, start: datetime, rnd: random.Random):
+    store = MemoryJobStore()
+    scheduler = AsyncIOScheduler(timezone="UTC")
+    for index in range(jobs):
+        trigger = rnd.choice(triggers)
+        job = Job(
+            scheduler,
+            id=str(index),
+            func=noop,
+            args=(),
+            kwargs={},
+            trigger=trigger,
+            executor="default",
+            name=None,
+            misfire_grace_time=300,
+            coalesce=True,
+            max_instances=1,
+            next_run_time=trigger.get_next_fire_time(None, start),
+        )
+        store.add_job(job)
+    return store
+
+
+def process_minute(store: MemoryJobStore, now: datetime) -> int:
+    """
+    What the scheduler does for due jobs on each wakeup
+    """
+    due = store.get_due_jobs(now)
+    for job in due:
+        run_times = job._get_run_times(now)
+        job._modify(next_run_time=job.trigger.get_next_fire_time(run_times[-1], now))
+        store.update_job(job)
+    store.get_next_run_time()
+    return len(due)
+
+
+def bookkeeping(store: MemoryJobStore, start: datetime):
+    fired = 0
+    started = time.perf_counter()
+    for minute in range(1, MINUTES + 1):
+        fired += process_minute(store, start + timedelta(minutes=minute))
+    return (time.perf_counter() - started) / MINUTES, fired / MINUTES
+
+
+async def wheel_query(users: int, rnd: random.Random) -> float:
+    async with db.transaction() as tx:
+        conn = tx.connection.raw_connection
+        await conn.copy_records_to_table(
+            User.__tablename__,
+            records=[
+                (user_id, rnd.randrange(MINUTES_PER_DAY))
+                for user_id in range(FIRST_USER_ID, FIRST_USER_ID + users)
+            ],
+            columns=["id", "reminder_minute"],
+        )
+        await db.status(f"ANALYZE {User.__tablename__}")
+        started = time.perf_counter()
+        for minute in rnd.sample(range(MINUTES_PER_DAY), MINUTES):
+            await User.query.where(User.reminder_minute.in_([minute])).gino.all()
+        elapsed = (time.perf_counter() - started) / MINUTES
+        tx.raise_rollback()
+    return elapsed
+
+
+async def main(sizes, database: bool, seed_value: int):
+    rnd = random.Random(seed_value)
+    start = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    triggers = [
+        CronTrigger(hour=minute // 60, minute=minute % 60, timezone="UTC")
+        for minute in range(MINUTES_PER_DAY)
+    ]
+    if database:
+        await db.set_bind(config.POSTGRES_URI)
+    try:
+        for users in sizes:
+            cron = make_store(users, triggers, start, rnd)
+            cron_time, cron_fired = bookkeeping(cron, start)
+            wheel = make_store(1, [CronTrigger(second=0)], start, rnd)
+            wheel_time, _fired = bookkeeping(wheel, start)
+            line = (
+                f"{users:>8} users: cron jobs {cron_time * 1000:8.3f} ms/minute "
+                f"({cron_fired:.0f} jobs fired), "
+                f"wheel {wheel_time * 1000:6.3f} ms/minute (1 job fired)"
+            )
+            if database:
+                query_time = await wheel_query(users, rnd)
+                line += f", wheel query {query_time * 1000:.2f} ms"
+            click.echo(line)
+    finally:
+        if database:
+            await db.pop_bind().close()
+
+
+@click.command()
+@click.option(
+    "-n",
+    "--users",
+    "sizes",
+    multiple=True,
+    type=click.IntRange(1, 1_000_000),
+    default=[1000, 10000, 100000, 1000000],
+    show_default=True,
+)
+@click.option("--database/--no-database", default=False, show_default=True)
+@click.option("--seed", "seed_value", default=0, show_default=True)
+def cli(sizes, database: bool, seed_value: int):
+    asyncio.run(main(sizes, database, seed_value))
+
+
+if __name__ == "__main__":
+    cli()
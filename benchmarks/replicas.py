@@ -0,0 +1,284 @@
+"""
+Reminders sent by several replicas sharing one postgres database through
+a local fake Bot API, checks that every due wakeup reminder and every
+user of a wheel minute gets exactly one message:
+
+    python -m benchmarks.replicas --replicas 4 --reminders 5000 --rate 200
+
+Replicas send --rate messages per second each, a batch of --batch
+reminders takes longer than the --lease of its claim, which has to be
+renewed while the burst is sent. One more replica claims a batch and
+some minutes first and is killed in the middle of its bursts, like a
+replica that died, the others take over what it did not record as sent
+once its claims expire. Messages it sent after its last record are sent
+again, up to about --rate of them per claim renewal interval.
+
+Run it against a database no bot is running on, seeded users get
+negative ids, which are never ids of telegram users, and are removed at
+the end together with their reminders and claimed minutes.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+import click
+from sqlalchemy import and_
+
+from app import config
+from app.misc import bot
+from app.models.db import db
+from app.models.reminders import ReminderDelivery, ReminderMinute, WakeupReminder
+from app.models.sleep_record import SleepRecord
+from app.models.user import User
+from app.utils.bedtime_reminder import MINUTES_PER_DAY
+from app.utils.fake_bot_api import FakeBotAPI
+from app.utils.fanout import fanout
+from app.utils.reminder_wheel import ReminderWheel, claim_minutes, minute_at
+from app.utils.wakeup_reminder import claim_wakeup_reminders, send_wakeup_reminders
+
+HOST = "127.0.0.1"
+BENCH_USER_ID = -4_000_000
+MINUTES = 10
+# seconds to wait for a replica, one that failed never reports
+REPLICA_TIMEOUT = 300
+
+
+def bench_minutes():
+    now_minute = int(time.time() // 60)
+    return list(range(now_minute - MINUTES, now_minute))
+
+
+async def replica(minutes, batch: int, interval: float, crash: bool, results):
+    await db.set_bind(config.POSTGRES_URI)
+    sent_minutes = sent_reminders = 0
+    if crash:
+        minutes = minutes[: MINUTES // 2]
+    idle_since = time.monotonic()
+    idle_time = config.SCHEDULER_CLAIM_LEASE + 2
+    while time.monotonic() - idle_since < idle_time:
+        claimed_minutes = await claim_minutes(minutes)
+        if claimed_minutes:
+            sent_minutes += len(claimed_minutes)
+            await ReminderWheel.remind(claimed_minutes)
+        claimed = await claim_wakeup_reminders(batch)
+        if claimed:
+            sent_reminders += len(claimed)
+            await send_wakeup_reminders([user_id for _fire_at, user_id in claimed])
+        if crash:
+            # killed by the parent while sending
+            results.put(None)
+            await asyncio.Event().wait()
+        if claimed_minutes or claimed:
+            idle_since = time.monotonic()
+        await asyncio.sleep(interval)
+    await fanout.join()
+    results.put((sent_minutes, sent_reminders))
+    await bot.session.close()
+    await db.pop_bind().close()
+
+
+def run_replica(*args):
+    asyncio.run(replica(*args))
+
+
+async def seed(reminders: int, per_minute: int, minutes):
+    await db.set_bind(config.POSTGRES_URI)
+    # asleep users are asked if they woke up, awake ones to go to sleep
+    asleep = range(BENCH_USER_ID, BENCH_USER_ID + reminders)
+    awake = range(asleep.stop, asleep.stop + per_minute * len(minutes))
+    fire_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    async with db.acquire() as conn:
+        raw = conn.raw_connection
+        await raw.copy_records_to_table(
+            User.__tablename__,
+            records=[(user_id, None) for user_id in asleep]
+            + [
+                (user_id, minutes[i % len(minutes)] % MINUTES_PER_DAY)
+                for i, user_id in enumerate(awake)
+            ],
+            columns=["id", "reminder_minute"],
+        )
+        await raw.copy_records_to_table(
+            SleepRecord.__tablename__,
+            records=[(user_id,) for user_id in asleep],
+            columns=["user_id"],
+        )
+        await raw.copy_records_to_table(
+            WakeupReminder.__tablename__,
+            records=[(user_id, fire_at) for user_id in asleep],
+            columns=["user_id", "fire_at"],
+        )
+    await ReminderMinute.delete.where(
+        ReminderMinute.minute_at.in_([minute_at(minute) for minute in minutes])
+    ).gino.status()
+    await db.pop_bind().close()
+    return list(asleep) + list(awake)
+
+
+async def left_claimed(user_ids, minutes):
+    """
+    Users claimed by the killed replica it did not record as reminded
+    """
+    await db.set_bind(config.POSTGRES_URI)
+    bench = and_(
+        WakeupReminder.user_id >= user_ids[0], WakeupReminder.user_id <= user_ids[-1]
+    )
+    rows = (
+        await db.select([WakeupReminder.user_id])
+        .where(and_(bench, WakeupReminder.claimed_by != None))  # noqa
+        .gino.all()
+    )
+    reminders = {row[0] for row in rows}
+    rows = (
+        await db.select([ReminderMinute.minute_at])
+        .where(
+            and_(
+                ReminderMinute.minute_at.in_([minute_at(m) for m in minutes]),
+                ReminderMinute.done == False,  # noqa
+            )
+        )
+        .gino.all()
+    )
+    claimed = [int(row[0].timestamp()) // 60 for row in rows]
+    rows = (
+        await db.select([User.id])
+        .where(
+            and_(
+                User.id >= user_ids[0],
+                User.id <= user_ids[-1],
+                User.reminder_minute.in_([m % MINUTES_PER_DAY for m in claimed]),
+            )
+        )
+        .gino.all()
+    )
+    delivered = {
+        row[0]
+        for row in await db.select([ReminderDelivery.user_id])
+        .where(ReminderDelivery.minute_at.in_([minute_at(m) for m in claimed]))
+        .gino.all()
+    }
+    await db.pop_bind().close()
+    return reminders, {row[0] for row in rows} - delivered
+
+
+async def cleanup(user_ids, minutes):
+    await db.set_bind(config.POSTGRES_URI)
+    # sleep records and reminders go with their users
+    await User.delete.where(User.id.between(user_ids[0], user_ids[-1])).gino.status()
+    # deliveries go with their minutes
+    await ReminderMinute.delete.where(
+        ReminderMinute.minute_at.in_([minute_at(minute) for minute in minutes])
+    ).gino.status()
+    await db.pop_bind().close()
+
+
+async def main(
+    replicas: int,
+    reminders: int,
+    per_minute: int,
+    batch: int,
+    rate: float,
+    lease: int,
+    interval: float,
+    kill_after: float,
+):
+    api = FakeBotAPI(rate=None)
+    # read by app.config of replicas
+    os.environ.update(
+        BOT_API_SERVER=await api.start(HOST),
+        SCHEDULER_DISTRIBUTED="True",
+        SCHEDULER_CLAIM_LEASE=str(lease),
+        REMINDER_SEND_RATE=str(rate),
+    )
+    loop = asyncio.get_running_loop()
+    minutes = bench_minutes()
+    user_ids = await seed(reminders, per_minute, minutes)
+    try:
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        wait_result = partial(results.get, timeout=REPLICA_TIMEOUT)
+        args = (minutes, batch, interval)
+        crashed = context.Process(target=run_replica, args=(*args, True, results))
+        crashed.start()
+        await loop.run_in_executor(None, wait_result)
+        await asyncio.sleep(kill_after)
+        crashed.kill()
+        await loop.run_in_executor(None, crashed.join)
+        sent_before = sum(api.last_message_ids[user_id] > 0 for user_id in user_ids)
+        reminders_left, users_left = await left_claimed(user_ids, minutes)
+        click.echo(
+            f"killed replica sent {sent_before} messages in {kill_after:.1f}s, "
+            f"left {len(reminders_left)} wakeup reminders "
+            f"and {len(users_left)} bedtime reminders claimed"
+        )
+
+        processes = [
+            context.Process(target=run_replica, args=(*args, False, results))
+            for _ in range(replicas)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        for _ in processes:
+            sent_minutes, sent_reminders = await loop.run_in_executor(None, wait_result)
+            click.echo(
+                f"replica claimed {sent_minutes} minutes "
+                f"and {sent_reminders} wakeup reminders"
+            )
+        for process in processes:
+            await loop.run_in_executor(None, process.join)
+        elapsed = time.perf_counter() - started
+    finally:
+        await api.stop()
+        await cleanup(user_ids, minutes)
+
+    counts = [api.last_message_ids[user_id] for user_id in user_ids]
+    duplicated = {user_id for user_id, count in zip(user_ids, counts) if count > 1}
+    missed = sum(count == 0 for count in counts)
+    # only messages sent by the killed replica after its last record
+    # are sent again
+    unexpected = duplicated - reminders_left - users_left
+    click.echo(
+        f"{len(user_ids) - missed}/{len(user_ids)} users reminded "
+        f"in {elapsed:.1f}s after the kill, {missed} missed, "
+        f"{len(duplicated)} reminded twice, "
+        f"{len(unexpected)} of them not left claimed by the killed replica"
+    )
+    if missed or unexpected:
+        raise SystemExit(1)
+
+
+@click.command()
+@click.option("--replicas", default=4, show_default=True)
+@click.option("--reminders", default=5000, show_default=True)
+@click.option(
+    "--per-minute",
+    default=200,
+    show_default=True,
+    help="users reminded to go to sleep in each of the last minutes",
+)
+@click.option("--batch", default=1000, show_default=True)
+@click.option("--rate", default=200.0, show_default=True, help="messages per second")
+@click.option("--lease", default=2, show_default=True, help="seconds")
+@click.option("--interval", default=1.0, show_default=True, help="claim polling")
+@click.option("--kill-after", default=2.5, show_default=True, help="seconds")
+def cli(
+    replicas: int,
+    reminders: int,
+    per_minute: int,
+    batch: int,
+    rate: float,
+    lease: int,
+    interval: float,
+    kill_after: float,
+):
+    asyncio.run(
+        main(replicas, reminders, per_minute, batch, rate, lease, interval, kill_after)
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,108 @@
+"""
+Throughput of sleep history import: parsing an export-like file and,
+with --db, COPY into staging table plus merge into sleep_records
+inside a rolled back transaction:
+
+    python -m benchmarks.sleep_import --records 1000000
+    python -m benchmarks.sleep_import --records 1000000 --db
+"""
+import asyncio
+import csv
+import gzip
+import io
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+
+from app import config
+from app.models.db import db
+from app.models.user import User
+from app.utils.datetime import parse_tz
+from app.utils.sleep_import import import_records, iterate_rows, open_document
+
+BENCH_USER_ID = 2 ** 31 - 3_000_000
+TIMEZONE = "+03:00"
+
+
+def write_document(fileobj, records: int, compress: bool):
+    target = gzip.GzipFile(fileobj=fileobj, mode="wb") if compress else fileobj
+    stream = io.TextIOWrapper(target, encoding="utf-8", newline="")
+    writer = csv.writer(stream)
+    writer.writerow(["id", "created_at", "wakeup_time", "mood", "emoji", "note"])
+    start = datetime(1900, 1, 1, 23, tzinfo=timezone.utc)
+    for index in range(records):
+        # one record an hour keeps 1M distinct records in the past
+        created_at = start + timedelta(hours=index)
+        wakeup_time = created_at + timedelta(hours=7, minutes=index % 60)
+        # every other record is naive and must get user's time zone
+        if index % 2:
+            created_at = created_at.replace(tzinfo=None)
+            wakeup_time = wakeup_time.replace(tzinfo=None)
+        writer.writerow(
+            [index, created_at.isoformat(), wakeup_time.isoformat(), "good", "🙂", ""]
+        )
+    stream.flush()
+    stream.detach()
+    if compress:
+        target.close()
+    fileobj.seek(0)
+
+
+async def ignore_progress(stats):
+    pass
+
+
+async def run_import(data: bytes) -> float:
+    rows = iterate_rows(open_document(io.BytesIO(data)), parse_tz(TIMEZONE))
+    started = time.perf_counter()
+    stats = await import_records(BENCH_USER_ID, rows, ignore_progress)
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f"import: {elapsed:.2f} s, {stats.inserted} inserted, "
+        f"{stats.duplicates} duplicates, {stats.skipped} skipped"
+    )
+    return elapsed
+
+
+async def main(records: int, compress: bool, use_db: bool):
+    fileobj = io.BytesIO()
+    started = time.perf_counter()
+    write_document(fileobj, records, compress)
+    data = fileobj.getvalue()
+    click.echo(
+        f"generated {records} records, {len(data) / 1024 / 1024:.1f} MiB "
+        f"in {time.perf_counter() - started:.2f} s"
+    )
+
+    started = time.perf_counter()
+    rows = iterate_rows(open_document(io.BytesIO(data)), parse_tz(TIMEZONE))
+    valid = sum(row is not None for row in rows)
+    elapsed = time.perf_counter() - started
+    assert valid == records, (valid, records)
+    click.echo(f"parse: {elapsed:.2f} s, {records / elapsed:.0f} rows/s")
+    if not use_db:
+        return
+
+    await db.set_bind(config.POSTGRES_URI)
+    try:
+        async with db.transaction() as tx:
+            await User.create(id=BENCH_USER_ID)
+            await run_import(data)
+            # second run must only find duplicates
+            await run_import(data)
+            tx.raise_rollback()
+    finally:
+        await db.pop_bind().close()
+
+
+@click.command()
+@click.option("--records", default=1000000, show_default=True)
+@click.option("--gzip", "compress", is_flag=True, default=False)
+@click.option("--db", "use_db", is_flag=True, default=False, help="Load into postgres")
+def cli(records: int, compress: bool, use_db: bool):
+    asyncio.run(main(records, compress, use_db))
+
+
+if __name__ == "__main__":
+    cli()
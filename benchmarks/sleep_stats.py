@@ -0,0 +1,95 @@
+"""
+Timing of the numpy sleep statistics engine against the per-record
+pendulum implementation it replaced, which tests/test_sleep_stats.py
+checks it against:
+
+    python -m benchmarks.sleep_stats --days 1825 --users 1000
+"""
+import random
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import click
+import numpy as np
+import pendulum
+
+from app.utils.datetime import parse_tz
+from app.utils.sleep_stats import average_by_user, records_to_arrays
+from app.utils.sleep_tracker import get_average_sleep
+from tests import legacy_sleep_tracker as legacy
+
+TIMEZONES = ["+00:00", "+03:00", "-05:00", "+05:30", "-09:30", "+14:00"]
+
+
+def make_records(days: int, rnd: random.Random):
+    now = pendulum.now("UTC")
+    records = []
+    for day in range(days, 0, -1):
+        for _ in range(rnd.choice([1, 1, 1, 2])):
+            start = now.subtract(days=day, seconds=rnd.randint(0, 86400))
+            end = start.add(
+                seconds=rnd.randint(0, 11 * 3600), microseconds=rnd.randint(0, 999999)
+            )
+            # asyncpg returns plain datetimes
+            records.append(
+                SimpleNamespace(
+                    created_at=datetime.fromtimestamp(start.timestamp(), timezone.utc),
+                    wakeup_time=datetime.fromtimestamp(end.timestamp(), timezone.utc),
+                )
+            )
+    records.sort(key=lambda record: record.created_at)
+    return records
+
+
+def timed(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+@click.command()
+@click.option("--days", default=1825, show_default=True, help="History length")
+@click.option("--users", default=1000, show_default=True, help="Users for batch run")
+@click.option("--seed", default=0, show_default=True)
+def cli(days: int, users: int, seed: int):
+    rnd = random.Random(seed)
+    tz = parse_tz("+03:00")
+    records = make_records(days, rnd)
+    # baseline only grouped records of a month by day of month
+    baseline, _ = timed(legacy.get_average_sleep, records, tz, "en", "month", 31)
+    vectorized, _ = timed(get_average_sleep, records, tz)
+    click.echo(
+        f"Single user, {len(records)} records: baseline {baseline * 1000:.1f} ms, "
+        f"numpy {vectorized * 1000:.1f} ms ({baseline / vectorized:.1f}x)"
+    )
+
+    histories = [make_records(days // 10, rnd) for _ in range(users)]
+    offsets = [parse_tz(rnd.choice(TIMEZONES)) for _ in range(users)]
+    baseline, _ = timed(
+        lambda: [
+            legacy.get_average_sleep(h, o, "en", "month", 31)
+            for h, o in zip(histories, offsets)
+        ],
+        repeat=1,
+    )
+    user_ids = np.concatenate(
+        [np.full(len(h), user_id) for user_id, h in enumerate(histories)]
+    )
+    starts, ends = zip(*(records_to_arrays(h) for h in histories))
+    utc_offsets = np.concatenate(
+        [np.full(len(h), o.offset) for h, o in zip(histories, offsets)]
+    )
+    start, end = np.concatenate(starts), np.concatenate(ends)
+    vectorized, _ = timed(average_by_user, user_ids, start, end, utc_offsets)
+    click.echo(
+        f"{users} users, {len(start)} records: baseline {baseline * 1000:.1f} ms, "
+        f"numpy {vectorized * 1000:.1f} ms ({baseline / vectorized:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,130 @@
+"""
+Parity check and timing of the python and sql stats backends.
+
+Synthetic users and sleep records are written inside a transaction
+that is rolled back at the end, real data is never touched:
+
+    python -m benchmarks.stats_backends --users 20 --days 730
+"""
+import asyncio
+import random
+import time
+
+import click
+import pendulum
+from sqlalchemy.dialects.postgresql import insert
+
+from app import config
+from app.models.db import db
+from app.models.sleep_record import SleepRecord
+from app.models.user import User
+from app.utils.datetime import latenight_offset, parse_tz
+from app.utils.sleep_stats import local_day
+from app.utils.sleep_tracker import get_month_weeks, get_sleep_records
+from app.utils.stats_backend import PythonStatsBackend, SQLStatsBackend
+
+TIMEZONES = ["+00:00", "+03:00", "-05:00", "+05:30", "-09:30", "+14:00"]
+# far away from real telegram ids
+FIRST_USER_ID = 2 ** 31 - 1_000_000
+
+
+def make_records(user_id: int, days: int, rnd: random.Random):
+    now = pendulum.now("UTC")
+    records = []
+    for day in range(days, 0, -1):
+        for _ in range(rnd.choice([1, 1, 1, 2])):
+            start = now.subtract(days=day, seconds=rnd.randint(0, 86400))
+            end = start.add(
+                seconds=rnd.randint(0, 11 * 3600), microseconds=rnd.randint(0, 999999)
+            )
+            records.append(
+                {"user_id": user_id, "created_at": start, "wakeup_time": end}
+            )
+    return records
+
+
+async def seed(users: int, days: int, rnd: random.Random):
+    user_ids = list(range(FIRST_USER_ID, FIRST_USER_ID + users))
+    await insert(User.__table__).values(
+        [{"id": user_id} for user_id in user_ids]
+    ).gino.status()
+    for user_id in user_ids:
+        await insert(SleepRecord.__table__).values(
+            make_records(user_id, days, rnd)
+        ).gino.status()
+    return user_ids
+
+
+def windows(now, weeks: int, months: int):
+    for weeks_ago in range(weeks):
+        dt = now.subtract(weeks=weeks_ago)
+        start_dt = (
+            dt.subtract(days=dt.weekday())
+            .start_of("day")
+            .add(seconds=latenight_offset.in_seconds())
+        )
+        yield [(start_dt, start_dt.add(weeks=1))]
+    for months_ago in range(months):
+        dt = now.subtract(months=months_ago)
+        start_dt = dt.start_of("month").add(seconds=latenight_offset.in_seconds())
+        yield [(start_dt, start_dt.add(months=1))] + get_month_weeks(start_dt)
+
+
+async def compare(user_id: int, tz, periods, stats: dict):
+    (start_dt, end_dt), *weeks = periods
+    started = time.perf_counter()
+    records = await get_sleep_records(user_id, start_dt, end_dt)
+    python_days = await PythonStatsBackend().get_sleep_days(
+        user_id, tz, start_dt, end_dt, records=records
+    )
+    stats["python"] += time.perf_counter() - started
+
+    started = time.perf_counter()
+    sql_days = await SQLStatsBackend().get_sleep_days(user_id, tz, start_dt, end_dt)
+    stats["sql"] += time.perf_counter() - started
+    stats["checks"] += 1
+
+    for week_start, week_end in [(start_dt, end_dt)] + weeks:
+        start_day = local_day(week_start, tz.offset)
+        end_day = local_day(week_end, tz.offset)
+        python_week = python_days.between(start_day, end_day)
+        sql_week = sql_days.between(start_day, end_day)
+        python_totals = [x.tolist() for x in python_week.daily_totals()]
+        sql_totals = [x.tolist() for x in sql_week.daily_totals()]
+        assert python_totals == sql_totals, (user_id, tz, week_start, week_end)
+        assert python_week.average() == sql_week.average()
+
+
+async def main(users: int, days: int, seed_value: int):
+    rnd = random.Random(seed_value)
+    await db.set_bind(config.POSTGRES_URI)
+    try:
+        async with db.transaction() as tx:
+            click.echo(f"Seeding {users} users x {days} days of sleep records..")
+            user_ids = await seed(users, days, rnd)
+            stats = {"python": 0.0, "sql": 0.0, "checks": 0}
+            for user_id in user_ids:
+                tz = parse_tz(rnd.choice(TIMEZONES))
+                now = pendulum.now(tz)
+                for periods in windows(now, weeks=8, months=days // 31):
+                    await compare(user_id, tz, periods, stats)
+            click.echo(f"{stats['checks']} periods match")
+            click.echo(
+                f"python (load records + numpy): {stats['python'] / stats['checks'] * 1000:.3f} ms/period, "
+                f"sql (per-day totals): {stats['sql'] / stats['checks'] * 1000:.3f} ms/period"
+            )
+            tx.raise_rollback()
+    finally:
+        await db.pop_bind().close()
+
+
+@click.command()
+@click.option("--users", default=20, show_default=True)
+@click.option("--days", default=730, show_default=True, help="Days of history per user")
+@click.option("--seed", "seed_value", default=0, show_default=True)
+def cli(users: int, days: int, seed_value: int):
+    asyncio.run(main(users, days, seed_value))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,113 @@
+"""
+Updates of many users double tapping "I woke up", processed by aiogram
+Dispatcher and by app.utils.dispatcher.BatchDispatcher with per-user lanes,
+handlers hold a --latency seconds database call between checking that user
+is asleep and waking them up:
+
+    python -m benchmarks.update_lanes --users 1000 --taps 4 --workers 10 20 50
+
+Exits with an error if lanes let a user wake up twice or process updates
+of a user out of order.
+"""
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import click
+from aiogram import Bot, Dispatcher, types
+
+from app.utils.dispatcher import BatchDispatcher
+from benchmarks.reminder_fanout import TOKEN
+
+BENCH_USER_ID = 1
+
+
+def make_updates(users: int, taps: int) -> List[types.Update]:
+    updates = []
+    for tap in range(taps):
+        for user_id in range(BENCH_USER_ID, BENCH_USER_ID + users):
+            update_id = len(updates)
+            updates.append(
+                types.Update(
+                    update_id=update_id,
+                    message={
+                        "message_id": update_id,
+                        "date": 0,
+                        "chat": {"id": user_id, "type": "private"},
+                        "from": {"id": user_id, "is_bot": False, "first_name": "a"},
+                        "text": "+",
+                    },
+                )
+            )
+    return updates
+
+
+async def run(
+    dp: Dispatcher, updates: List[types.Update], latency: float, batch: int
+) -> Tuple[float, int, int]:
+    asleep: Dict[int, bool] = defaultdict(lambda: True)
+    processed: Dict[int, List[int]] = defaultdict(list)
+    woke_up: Dict[int, int] = defaultdict(int)
+
+    @dp.message_handler(text="+")
+    async def sleep_end(message: types.Message):
+        processed[message.chat.id].append(message.message_id)
+        if not asleep[message.chat.id]:
+            return
+        # SleepRecord query and update
+        await asyncio.sleep(latency)
+        asleep[message.chat.id] = False
+        woke_up[message.chat.id] += 1
+
+    started = time.perf_counter()
+    # polling hands updates over in batches without waiting for the previous one
+    await asyncio.gather(
+        *(
+            asyncio.gather(
+                *map(dp.process_update, updates[i : i + batch])  # noqa: E203
+            )
+            for i in range(0, len(updates), batch)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    twice = sum(count > 1 for count in woke_up.values())
+    unordered = sum(ids != sorted(ids) for ids in processed.values())
+    return elapsed, twice, unordered
+
+
+async def main(
+    users: int, taps: int, workers: List[int], latency: float, batch: int
+) -> bool:
+    bot = Bot(TOKEN)
+    updates = make_updates(users, taps)
+    dispatchers = [("aiogram", Dispatcher(bot))]
+    dispatchers.extend(
+        (f"lanes, {count} workers", BatchDispatcher(bot, workers=count))
+        for count in workers
+    )
+    correct = True
+    for name, dp in dispatchers:
+        elapsed, twice, unordered = await run(dp, updates, latency, batch)
+        click.echo(
+            f"{name:>20}: {len(updates) / elapsed:8.0f} updates/s, "
+            f"{twice} users woke up twice, {unordered} out of order"
+        )
+        if isinstance(dp, BatchDispatcher):
+            correct = correct and not twice and not unordered
+    return correct
+
+
+@click.command()
+@click.option("--users", default=1000, show_default=True)
+@click.option("--taps", default=4, show_default=True, help="updates per user")
+@click.option("--workers", default=[10, 20, 50], multiple=True, show_default=True)
+@click.option("--latency", default=0.01, show_default=True, help="seconds")
+@click.option("--batch", default=100, show_default=True, help="updates per poll")
+def cli(users: int, taps: int, workers: List[int], latency: float, batch: int):
+    if not asyncio.run(main(users, taps, list(workers), latency, batch)):
+        raise click.ClickException("Updates of a user were not serialized")
+
+
+if __name__ == "__main__":
+    cli()
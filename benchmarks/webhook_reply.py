@@ -0,0 +1,117 @@
+"""
+Bot API requests and webhook response time of commands answered with
+app.utils.interaction.Reply, with replies sent as separate requests and
+returned as webhook responses, against the fake Bot API taking --latency
+seconds per request like the real one far away:
+
+    python -m benchmarks.webhook_reply --updates 200 --latency 0.05
+
+Exits with an error if webhook replies do not save a request per update.
+"""
+import asyncio
+import time
+
+import click
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.dispatcher.webhook import get_new_configured_app
+from aiohttp import ClientSession, web
+
+from app.utils import interaction
+from app.utils.fake_bot_api import FakeBotAPI
+from app.utils.interaction import Reply
+from benchmarks.reminder_fanout import HOST, TOKEN
+
+WEBHOOK_PATH = "/webhook"
+CHAT_ID = 1
+
+
+def make_update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": CHAT_ID, "type": "private"},
+            "from": {"id": CHAT_ID, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        },
+    }
+
+
+def make_dispatcher(bot: Bot) -> Dispatcher:
+    dp = Dispatcher(bot)
+
+    @dp.message_handler(commands=["help"])
+    async def cmd_help(message: types.Message):
+        reply = Reply("help", message.chat.id, reply_to_message_id=message.message_id)
+        return await reply.add("Here's list of my commands:").respond()
+
+    @dp.message_handler(text="-")
+    async def sleep_start(message: types.Message):
+        return await Reply("sleep_start", message.chat.id).add("Good night..").respond()
+
+    return dp
+
+
+async def start_app(app: web.Application):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, HOST, 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+async def measure(api: FakeBotAPI, session: ClientSession, url: str, updates: int):
+    api.calls.clear()
+    responses = 0
+    started = time.perf_counter()
+    for update_id in range(updates):
+        text = "/help" if update_id % 2 else "-"
+        async with session.post(url, json=make_update(update_id, text)) as response:
+            # "ok" without a reply, Telegram sends the reply in JSON
+            # right away, with no request of the bot
+            if response.content_type == "application/json":
+                responses += "method" in await response.json()
+    elapsed = (time.perf_counter() - started) / updates
+    return sum(api.calls.values()) / updates, responses / updates, elapsed
+
+
+async def main(updates: int, latency: float) -> bool:
+    api = FakeBotAPI(rate=None, latency=latency)
+    bot = Bot(TOKEN, server=TelegramAPIServer.from_base(await api.start(HOST)))
+    dp = make_dispatcher(bot)
+    webhook_runner, webhook_port = await start_app(
+        get_new_configured_app(dp, WEBHOOK_PATH)
+    )
+    url = f"http://{HOST}:{webhook_port}{WEBHOOK_PATH}"
+
+    results = {}
+    try:
+        async with ClientSession() as session:
+            for webhook_replies in (False, True):
+                interaction.webhook_replies = webhook_replies
+                results[webhook_replies] = await measure(api, session, url, updates)
+                calls, responses, elapsed = results[webhook_replies]
+                click.echo(
+                    f"webhook replies {'on' if webhook_replies else 'off':>3}: "
+                    f"{calls:.2f} requests and {responses:.2f} webhook responses "
+                    f"per update, answered in {elapsed * 1000:.1f} ms"
+                )
+    finally:
+        await bot.session.close()
+        await webhook_runner.cleanup()
+        await api.stop()
+    return results[True][0] <= results[False][0] - 1
+
+
+@click.command()
+@click.option("--updates", default=200, show_default=True)
+@click.option("--latency", default=0.05, show_default=True, help="seconds")
+def cli(updates: int, latency: float):
+    if not asyncio.run(main(updates, latency)):
+        raise click.ClickException("Webhook replies did not save Bot API requests")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,70 @@
+"""sleep_rollups
+
+Revision ID: 3c6f1e2a9b47
+Revises: 5f878d7571b0
+Create Date: 2026-10-17 12:10:42.518304
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3c6f1e2a9b47"
+down_revision = "5f878d7571b0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "sleep_daily_stats",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("total_seconds", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("records", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], onupdate="CASCADE", ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("user_id", "day"),
+    )
+    op.create_table(
+        "sleep_monthly_stats",
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("total_seconds", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("days", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("records", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], onupdate="CASCADE", ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("user_id", "month"),
+    )
+
+
+def downgrade():
+    op.drop_table("sleep_monthly_stats")
+    op.drop_table("sleep_daily_stats")
@@ -0,0 +1,40 @@
+"""reminder_claims
+
+Revision ID: 7c3e9a5d1f20
+Revises: f5a2c8e7d4b1
+Create Date: 2026-10-17 18:02:41.517309
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c3e9a5d1f20"
+down_revision = "f5a2c8e7d4b1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("wakeup_reminders", sa.Column("claimed_by", sa.String(length=32)))
+    op.add_column(
+        "wakeup_reminders", sa.Column("claimed_until", sa.DateTime(timezone=True)),
+    )
+    op.create_index(
+        "ix_wakeup_reminders_fire_at", "wakeup_reminders", ["fire_at"], unique=False
+    )
+    op.create_table(
+        "reminder_minutes",
+        sa.Column("minute_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("claimed_by", sa.String(length=32), nullable=False),
+        sa.Column("claimed_until", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("done", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("minute_at"),
+    )
+
+
+def downgrade():
+    op.drop_table("reminder_minutes")
+    op.drop_index("ix_wakeup_reminders_fire_at", table_name="wakeup_reminders")
+    op.drop_column("wakeup_reminders", "claimed_until")
+    op.drop_column("wakeup_reminders", "claimed_by")
@@ -0,0 +1,73 @@
+"""sleep_records_and_reminders_keys
+
+Revision ID: 8f2d4b7c1e05
+Revises: 3c6f1e2a9b47
+Create Date: 2026-10-17 13:02:17.904521
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8f2d4b7c1e05"
+down_revision = "3c6f1e2a9b47"
+branch_labels = None
+depends_on = None
+
+REMINDER_TABLES = ("bedtime_reminders", "wakeup_reminders")
+
+
+def upgrade():
+    # primary keys already cover these
+    op.drop_index("ix_sleep_records_id", table_name="sleep_records")
+    op.drop_index("ix_users_id", table_name="users")
+
+    op.create_index(
+        "ix_sleep_records_user_id_created_at",
+        "sleep_records",
+        ["user_id", "created_at"],
+        unique=False,
+    )
+    # only the latest open record of a user could ever be closed,
+    # older ones are kept and closed when the user's next sleep started
+    op.execute(
+        "UPDATE sleep_records r SET wakeup_time = ("
+        "SELECT min(later.created_at) FROM sleep_records later "
+        "WHERE later.user_id = r.user_id "
+        "AND (later.created_at, later.id) > (r.created_at, r.id)) "
+        "WHERE r.wakeup_time IS NULL AND EXISTS ("
+        "SELECT 1 FROM sleep_records newer "
+        "WHERE newer.user_id = r.user_id AND newer.wakeup_time IS NULL "
+        "AND (newer.created_at, newer.id) > (r.created_at, r.id))"
+    )
+    op.create_index(
+        "ux_sleep_records_user_id_open",
+        "sleep_records",
+        ["user_id"],
+        unique=True,
+        postgresql_where=sa.text("wakeup_time IS NULL"),
+    )
+
+    for table in REMINDER_TABLES:
+        # drop jobs of duplicate reminders, rows are removed by cascade
+        op.execute(
+            f"DELETE FROM apscheduler_jobs WHERE id IN ("
+            f"SELECT r.job_id FROM {table} r JOIN {table} newer "
+            f"ON r.user_id = newer.user_id "
+            f"AND (r.updated_at, r.job_id) < (newer.updated_at, newer.job_id))"
+        )
+        op.create_primary_key(f"{table}_pkey", table, ["user_id"])
+        op.create_index(f"ux_{table}_job_id", table, ["job_id"], unique=True)
+
+
+def downgrade():
+    for table in REMINDER_TABLES:
+        op.drop_index(f"ux_{table}_job_id", table_name=table)
+        op.drop_constraint(f"{table}_pkey", table, type_="primary")
+
+    # records closed on upgrade stay closed
+    op.drop_index("ux_sleep_records_user_id_open", table_name="sleep_records")
+    op.drop_index("ix_sleep_records_user_id_created_at", table_name="sleep_records")
+
+    op.create_index("ix_users_id", "users", ["id"], unique=True)
+    op.create_index("ix_sleep_records_id", "sleep_records", ["id"], unique=True)
@@ -0,0 +1,39 @@
+"""reminders_job_id_without_fk
+
+Revision ID: a4e1c9d27b63
+Revises: 8f2d4b7c1e05
+Create Date: 2026-10-17 14:21:40.318265
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a4e1c9d27b63"
+down_revision = "8f2d4b7c1e05"
+branch_labels = None
+depends_on = None
+
+REMINDER_TABLES = ("bedtime_reminders", "wakeup_reminders")
+
+
+def upgrade():
+    # jobs are written in background and may be stored in redis
+    for table in REMINDER_TABLES:
+        op.drop_constraint(f"{table}_job_id_fkey", table, type_="foreignkey")
+
+
+def downgrade():
+    for table in REMINDER_TABLES:
+        op.execute(
+            f"DELETE FROM {table} r WHERE NOT EXISTS "
+            "(SELECT 1 FROM apscheduler_jobs j WHERE j.id = r.job_id)"
+        )
+        op.create_foreign_key(
+            f"{table}_job_id_fkey",
+            table,
+            "apscheduler_jobs",
+            ["job_id"],
+            ["id"],
+            onupdate="CASCADE",
+            ondelete="CASCADE",
+        )
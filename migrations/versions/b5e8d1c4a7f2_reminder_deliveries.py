@@ -0,0 +1,31 @@
+"""reminder_deliveries
+
+Revision ID: b5e8d1c4a7f2
+Revises: 7c3e9a5d1f20
+Create Date: 2026-10-17 21:14:09.382615
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b5e8d1c4a7f2"
+down_revision = "7c3e9a5d1f20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "reminder_deliveries",
+        sa.Column("minute_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["minute_at"], ["reminder_minutes.minute_at"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("minute_at", "user_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("reminder_deliveries")
@@ -0,0 +1,73 @@
+"""bedtime_reminder_minute
+
+Revision ID: d3b9f6a1c2e8
+Revises: a4e1c9d27b63
+Create Date: 2026-10-17 15:08:12.730416
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d3b9f6a1c2e8"
+down_revision = "a4e1c9d27b63"
+branch_labels = None
+depends_on = None
+
+# "HH:MM" reminder in "+HH:MM" timezone as minute of the UTC day
+REMINDER_MINUTE_SQL = """
+UPDATE users SET reminder_minute = ((
+    split_part(reminder, ':', 1)::int * 60 + split_part(reminder, ':', 2)::int
+    - CASE WHEN left(tz, 1) = '-' THEN -1 ELSE 1 END * (
+        split_part(substr(tz, 2), ':', 1)::int * 60
+        + coalesce(nullif(split_part(substr(tz, 2), ':', 2), ''), '0')::int
+    )
+) % 1440 + 1440) % 1440
+FROM (SELECT id, coalesce(timezone, '+00:00') AS tz FROM users) AS tzs
+WHERE users.id = tzs.id AND reminder LIKE '%:%'
+"""
+
+
+def upgrade():
+    op.add_column("users", sa.Column("reminder_minute", sa.SmallInteger()))
+    op.execute(REMINDER_MINUTE_SQL)
+    op.create_index(
+        "ix_users_reminder_minute", "users", ["reminder_minute"], unique=False
+    )
+    # bedtime reminders are sent by the reminder wheel now,
+    # jobs kept in redis are removed on startup
+    op.execute(
+        "DELETE FROM apscheduler_jobs j USING bedtime_reminders r WHERE j.id = r.job_id"
+    )
+    op.drop_table("bedtime_reminders")
+
+
+def downgrade():
+    # reminders have to be set again by users, their jobs are gone
+    op.create_table(
+        "bedtime_reminders",
+        sa.Column("job_id", sa.VARCHAR(length=191), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], onupdate="CASCADE", ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("user_id", name="bedtime_reminders_pkey"),
+    )
+    op.create_index(
+        "ux_bedtime_reminders_job_id", "bedtime_reminders", ["job_id"], unique=True
+    )
+    op.execute("UPDATE users SET reminder = '-' WHERE reminder_minute IS NOT NULL")
+    op.drop_index("ix_users_reminder_minute", table_name="users")
+    op.drop_column("users", "reminder_minute")
@@ -0,0 +1,70 @@
+"""wakeup_reminder_timers
+
+Revision ID: f5a2c8e7d4b1
+Revises: d3b9f6a1c2e8
+Create Date: 2026-10-17 16:25:03.184952
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f5a2c8e7d4b1"
+down_revision = "d3b9f6a1c2e8"
+branch_labels = None
+depends_on = None
+
+# app.utils.wakeup_reminder.sleep_duration
+SLEEP_DURATION = "interval '6 hours 30 minutes'"
+
+
+def upgrade():
+    # wakeup reminders are one-shot timers now, daily jobs are removed
+    op.execute(
+        "DELETE FROM apscheduler_jobs j USING wakeup_reminders r WHERE j.id = r.job_id"
+    )
+    op.drop_table("wakeup_reminders")
+    op.create_table(
+        "wakeup_reminders",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("fire_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], onupdate="CASCADE", ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("user_id", name="wakeup_reminders_pkey"),
+    )
+    # users still asleep get their reminder if it is not due yet
+    op.execute(
+        "INSERT INTO wakeup_reminders (user_id, fire_at) "
+        f"SELECT user_id, created_at + {SLEEP_DURATION} FROM sleep_records "
+        f"WHERE wakeup_time IS NULL AND created_at + {SLEEP_DURATION} > now()"
+    )
+
+
+def downgrade():
+    # pending reminders are lost, daily jobs are created again on next sleep
+    op.drop_table("wakeup_reminders")
+    op.create_table(
+        "wakeup_reminders",
+        sa.Column("job_id", sa.VARCHAR(length=191), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], onupdate="CASCADE", ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("user_id", name="wakeup_reminders_pkey"),
+    )
+    op.create_index(
+        "ux_wakeup_reminders_job_id", "wakeup_reminders", ["job_id"], unique=True
+    )
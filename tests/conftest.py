@@ -0,0 +1,5 @@
+import os
+
+# tests run without .env, settings they do not set keep their defaults
+os.environ.setdefault("DOTENV_LOADED", "True")
+os.environ.setdefault("BOT_TOKEN", "123456:fake")
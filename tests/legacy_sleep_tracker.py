@@ -0,0 +1,59 @@
+"""
+Sleep statistics as computed before the numpy engine, copied verbatim
+from app/utils/sleep_tracker.py and app/utils/datetime.py of the baseline,
+kept as the oracle for tests
+"""
+from typing import List
+
+import pendulum
+from pendulum import DateTime, Duration, Period
+
+from app.models.sleep_record import SleepRecord
+from app.utils.datetime import latenight_offset
+
+datetime_fmtr = pendulum.Formatter()
+
+
+def as_weekday_int(dt: DateTime, tz):
+    return datetime_fmtr.format(dt.in_tz(tz), "d")
+
+
+def as_day(dt: DateTime, tz):
+    return datetime_fmtr.format(dt.in_tz(tz), "D")
+
+
+def get_stats_grouped_by_day(
+    records: List[SleepRecord], tz, language, mode="week", days=7
+):
+    if mode == "week":
+        get_day_func = as_weekday_int
+    elif mode == "month":
+        days = days + 1
+        get_day_func = as_day
+    else:
+        return []
+    tmp_res = [Duration() for i in range(days)]
+    result = []
+    for record in records:
+        dt_start = pendulum.instance(record.created_at)
+        dt_start_fixed_weekday = dt_start.subtract(
+            seconds=latenight_offset.in_seconds()
+        )
+        dt_end = pendulum.instance(record.wakeup_time)
+        interval = Period(dt_start, dt_end).as_interval()
+        i = int(get_day_func(dt_start_fixed_weekday, tz))
+        tmp_res[i] = tmp_res[i] + interval
+    for x in filter(lambda a: a.in_seconds() > 0, tmp_res):
+        result.append(x)
+    return result
+
+
+def get_average_sleep(records: List[SleepRecord], tz, language, mode="week", days=7):
+    grouped_by_day = get_stats_grouped_by_day(
+        records, tz, language, mode=mode, days=days
+    )
+    avg_sleep_per_day = Duration(
+        seconds=sum(map(lambda x: x.in_seconds(), grouped_by_day))
+        / max(len(grouped_by_day), 1)
+    )
+    return avg_sleep_per_day
@@ -0,0 +1,61 @@
+import asyncio
+from typing import List
+
+from aiogram import Bot, types
+
+from app.utils import dispatcher
+from app.utils.dispatcher import BatchDispatcher
+from benchmarks.reminder_fanout import TOKEN
+
+USER_ID = 1
+
+
+def make_update(update_id: int, text: str) -> types.Update:
+    return types.Update(
+        update_id=update_id,
+        message={
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": USER_ID, "type": "private"},
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "a"},
+            "text": text,
+        },
+    )
+
+
+class SlowFirstPrefetch:
+    """
+    Users of the first batch are loaded from the database,
+    later batches find them cached
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    async def prefetch(self, user_ids: List[int]):
+        self.calls += 1
+        if self.calls == 1:
+            await asyncio.sleep(0.05)
+
+
+def test_batches_keep_order_of_updates(monkeypatch):
+    monkeypatch.setattr(dispatcher, "user_cache", SlowFirstPrefetch())
+    processed = []
+
+    async def main():
+        dp = BatchDispatcher(Bot(TOKEN))
+
+        @dp.message_handler()
+        async def record(message: types.Message):
+            processed.append(message.text)
+
+        # polling starts a task per batch without waiting for the previous one
+        await asyncio.gather(
+            dp.process_updates([make_update(1, "-")]),
+            dp.process_updates([make_update(2, "+"), make_update(3, "?")]),
+        )
+        return dp
+
+    dp = asyncio.run(main())
+    assert processed == ["-", "+", "?"]
+    assert not dp._lanes and not dp._reserved
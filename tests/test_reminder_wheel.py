@@ -0,0 +1,67 @@
+"""
+Minutes the reminder wheel sends around restarts,
+runs against a migrated database given by TEST_POSTGRES_URI,
+rows it creates are rolled back
+"""
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import config
+from app.models.db import db
+from app.utils import reminder_wheel
+from app.utils.reminder_wheel import MAX_CATCH_UP_MINUTES, ReminderWheel
+
+POSTGRES_URI = os.environ.get("TEST_POSTGRES_URI")
+# a day ahead, so minutes are not claimed by a running bot
+# and not removed with claims kept for a day
+START_MINUTE = int(time.time() // 60) + 24 * 60
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URI, reason="TEST_POSTGRES_URI not set")
+
+
+async def ticks(monkeypatch, restarts):
+    """
+    Minutes reminded by a wheel ticking at each minute of restarts,
+    a new wheel is started for each of them
+    """
+    reminded = []
+
+    async def remind(minutes):
+        reminded.append(minutes)
+
+    monkeypatch.setattr(ReminderWheel, "remind", staticmethod(remind))
+    await db.set_bind(POSTGRES_URI)
+    try:
+        async with db.transaction() as tx:
+            for now_minutes in restarts:
+                wheel = ReminderWheel()
+                for now_minute in now_minutes:
+                    clock = SimpleNamespace(time=lambda: now_minute * 60 + 0.5)
+                    monkeypatch.setattr(reminder_wheel, "time", clock)
+                    await wheel.tick()
+            tx.raise_rollback()
+    finally:
+        await db.pop_bind().close()
+    return reminded
+
+
+@pytest.mark.parametrize("distributed", [False, True])
+def test_restart_sends_missed_minutes(monkeypatch, distributed):
+    monkeypatch.setattr(config, "SCHEDULER_DISTRIBUTED", distributed)
+    t = START_MINUTE
+    restarts = [[t, t + 1], [t + 4], [t + 5], [t + 30]]
+    reminded = asyncio.run(ticks(monkeypatch, restarts))
+    catch_up = MAX_CATCH_UP_MINUTES
+    assert reminded == [
+        list(range(t - catch_up + 1, t + 1)),
+        [t + 1],
+        # down from t + 2, minutes sent before the restart are not sent again
+        [t + 2, t + 3, t + 4],
+        [t + 5],
+        # down for longer than catch up
+        list(range(t + 30 - catch_up + 1, t + 31)),
+    ]
@@ -0,0 +1,101 @@
+"""
+Parity of the SQL stats backend with sleep days summed by the bot,
+runs against a migrated database given by TEST_POSTGRES_URI,
+rows it creates are rolled back
+"""
+import asyncio
+import os
+import random
+
+import numpy as np
+import pendulum
+import pytest
+
+from app.models.db import db
+from app.models.sleep_record import SleepRecord
+from app.models.user import User
+from app.utils.datetime import latenight_offset, parse_tz
+from app.utils.stats_backend import PythonStatsBackend, SQLStatsBackend
+
+POSTGRES_URI = os.environ.get("TEST_POSTGRES_URI")
+# never an id of a telegram user
+USER_ID = -1
+TIMEZONES = ["-09:30", "-05:00", "+00:00", "+05:30", "+14:00"]
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URI, reason="TEST_POSTGRES_URI not set")
+
+
+def edge_records(tz):
+    """
+    Start and end of records around the late night boundary and midnight,
+    None for the open one
+    """
+    day = pendulum.datetime(2021, 3, 10, tz=tz)
+    boundary = day.add(seconds=latenight_offset.in_seconds())
+    return [
+        # just before the boundary belongs to the previous day
+        (boundary.subtract(microseconds=1), boundary.add(hours=2)),
+        (boundary, boundary.add(hours=1, microseconds=500000)),
+        # crosses local midnight
+        (day.subtract(hours=1), day.add(hours=7, seconds=30)),
+        (day.add(days=1, hours=23), None),
+    ]
+
+
+def random_records(tz, rnd: random.Random):
+    first_day = pendulum.datetime(2021, 2, 1, tz=tz)
+    records = []
+    for _ in range(60):
+        start = first_day.add(
+            seconds=rnd.randrange(28 * 86400), microseconds=rnd.randrange(10 ** 6)
+        )
+        end = start.add(
+            seconds=rnd.randint(0, 11 * 3600), microseconds=rnd.randrange(10 ** 6)
+        )
+        records.append((start, end))
+    return records
+
+
+async def compare_backends(tz, records):
+    start_dt = pendulum.datetime(2021, 1, 1)
+    end_dt = pendulum.datetime(2021, 4, 1)
+    async with db.transaction() as tx:
+        await User.create(id=USER_ID, timezone=tz.name)
+        for created_at, wakeup_time in records:
+            await SleepRecord.create(
+                user_id=USER_ID, created_at=created_at, wakeup_time=wakeup_time
+            )
+        expected = await PythonStatsBackend().get_sleep_days(
+            USER_ID, tz, start_dt, end_dt
+        )
+        actual = await SQLStatsBackend().get_sleep_days(USER_ID, tz, start_dt, end_dt)
+        tx.raise_rollback()
+    expected_days, expected_totals = expected.daily_totals()
+    actual_days, actual_totals = actual.daily_totals()
+    assert len(expected_days) > 0
+    np.testing.assert_array_equal(actual_days, expected_days)
+    np.testing.assert_array_equal(actual_totals, expected_totals)
+
+
+def run(coroutine):
+    async def bound():
+        await db.set_bind(POSTGRES_URI)
+        try:
+            await coroutine
+        finally:
+            await db.pop_bind().close()
+
+    asyncio.run(bound())
+
+
+@pytest.mark.parametrize("timezone", TIMEZONES)
+def test_edge_records(timezone):
+    tz = parse_tz(timezone)
+    run(compare_backends(tz, edge_records(tz)))
+
+
+@pytest.mark.parametrize("timezone", TIMEZONES)
+def test_random_records(timezone):
+    tz = parse_tz(timezone)
+    records = random_records(tz, random.Random(timezone))
+    run(compare_backends(tz, records + [(records[-1][1].add(hours=1), None)]))